@@ -2,98 +2,45 @@ import asyncio
 import pandas as pd
 import aiocoap
 import datetime
+import zlib
+
+from concurrent.futures import as_completed
 
 from aiocoap import *
 
-from utils import payload_handling, workflow_handling
+from utils import payload_handling, workflow_handling, context_handling, rate_handling, concurrency_handling, transmission_handling, rtt_handling, host_handling, network_handling, blockwise_handling, process_handling
+from O1_DataCollection import stateless_coap
 
 ################################################################################################
 
-def get_max_transmit_wait():
-    return (
-        aiocoap.numbers.TransportTuning.ACK_TIMEOUT *
-        (2 ** (aiocoap.numbers.TransportTuning.MAX_RETRANSMIT + 1) - 1) *
-        aiocoap.numbers.TransportTuning.ACK_RANDOM_FACTOR
-    )
+# bounded work queue (backpressure on the target producers)
+QUEUE_SIZE = 1000
+# number of result records handed to the sink at once (streaming mode)
+RESULTS_BATCH_SIZE = 500
+# number of worker processes used by coap_sharded() (1 = everything runs in the current process)
+NUM_PROCESSES = 1
 
 ################################################################################################
 
 # perform a CoAP GET request of a specified CoAP resource (IP addr + Resource URI)
-async def get(ip_address, uri, context, declared_obs, user_inserted, timeout_time, must_test_obs):
+#   O: result record, RTT of the first request/response exchange (None if no response)
+async def get(ip_address, uri, context, declared_obs, user_inserted, profile, must_test_obs):
         
-    data_to_store = {
-        'saddr': ip_address,
-        'uri': uri,
-        'version': None,
-        'mtype': None,
-        'token': None,
-        'token_length': None,
-        'code': None,
-        'mid': None,
-        'options': None,
-        'observable': None,
-        'data': None,
-        'data_format': None,
-        'data_length': None,
-        'user_inserted': None
-    }
+    data_to_store = payload_handling.empty_record(ip_address, uri)
+    rtt = None
 
     # resource URI to be checked
     uri_to_check = f"coap://{ip_address}:5683{uri}"
     
-    # build the request message
-    if must_test_obs:
-        request = Message(code=GET, uri=uri_to_check, observe=0)
-    else:
-        request = Message(code=GET, uri=uri_to_check)
-        
-
     try:
         
-        # send the request and obtained the response
-        response = await asyncio.wait_for(context.request(request).response, timeout=timeout_time)
+        # send the request(s) and obtain the response
+        #   large resources: Block2 with the largest block size, blocks requested in parallel and reassembled
+        #   (the token bucket rate limiting is applied to every block)
+        response, rtt = await blockwise_handling.fetch(context, uri_to_check, profile, must_test_obs)
 
-
-        # -------- observability handling --------
-        # OBS resource
-        if payload_handling.get_observe(response, uri) == True:
-                
-            #   -> declared OBS = CORRECT          
-            if declared_obs == True:                                
-                observable_status = 0
-                    
-            #   -> NOT declared OBS = WRONG
-            else:                                                   
-                observable_status = 1
-                    
-        # NOT OBS resource
-        else:
-                
-            #   -> declared OBS = WRONG                                               
-            if declared_obs == True:                                
-                observable_status = 2
-                    
-            #   -> NOT declared OBS = CORRECT               
-            else:                                                   
-                observable_status = 3
-        # ------------------------------------------
-
-        decoded_message_payload = payload_handling.get_payload(response)
-
-        data_to_store.update({
-            'version': payload_handling.get_version(response),
-            'mtype': payload_handling.get_mtype(response),
-            'token_length': payload_handling.get_token_length(response),
-            'code': payload_handling.get_code(response),
-            'mid': payload_handling.get_mid(response),
-            'token': payload_handling.get_token(response),
-            'options': payload_handling.get_options(response),
-            'data': decoded_message_payload,
-            'data_format': payload_handling.get_payload_format(decoded_message_payload),   
-            'data_length': payload_handling.get_payload_length(response),
-            'observable': observable_status,
-            'user_inserted': user_inserted
-        })    
+        # populate the record (observability status included)
+        data_to_store.update(payload_handling.get_response_fields(response, uri, declared_obs, user_inserted))
 
     except asyncio.TimeoutError:
 
@@ -107,169 +54,255 @@ async def get(ip_address, uri, context, declared_obs, user_inserted, timeout_tim
             'data': e
         })
 
-    return data_to_store
+    return data_to_store, rtt
 
 ################################################################################################
 
-async def coap(discovery_df, operation_type):
+async def coap(targets, operation_type, sink=None, engine='aiocoap', profile=None):
+
+    # targets:
+    #   - a pandas DataFrame (one chunk)
+    #   - an iterable of DataFrames (ex. pd.read_csv(..., chunksize=...)) -> rows are produced lazily
+    # sink:
+    #   - None -> results are collected and returned as a single DataFrame (previous behaviour)
+    #   - callable(batch_df) -> streaming mode: results are flushed in batches, the number of rows is returned
+    # engine:
+    #   - 'aiocoap'   -> worker fleet on top of the shared aiocoap client contexts
+    #   - 'stateless' -> high-rate stateless GET engine (see stateless_coap.py), same record schema
+    # profile:
+    #   - retransmission/timeout settings of every request (default: the operation profile)
+    collector = ResultCollector(sink)
+
+    if profile is None:
+        profile = transmission_handling.get_operation_profile(operation_type)
 
     # -------------------------------------
     match operation_type:
         case 0:
-            # setting MAX_RETRANSMIT = 3
-            aiocoap.numbers.TransportTuning.MAX_RETRANSMIT = 3
-            responses_df = await discovery(discovery_df)
+            await discovery(targets, collector, profile, engine)
         case 1:
-            # setting MAX_RETRANSMIT = 1
-            aiocoap.numbers.TransportTuning.MAX_RETRANSMIT = 1
-            responses_df = await get_requests(discovery_df)
+            await get_requests(targets, collector, profile, engine)
         case 2:
-            # setting MAX_RETRANSMIT = 3
-            aiocoap.numbers.TransportTuning.MAX_RETRANSMIT = 3
-            responses_df = await get_requests_to_observable_resources(discovery_df)
+            await get_requests_to_observable_resources(targets, collector, profile, engine)
     
     # -------------------------------------
 
-    return responses_df
+    return collector.result()
 
 ################################################################################################
 
-async def worker(worker_id, queue, results, rate_delay):
-    
-    context = await Context.create_client_context()
-    await asyncio.sleep(1)
+# ResultCollector
+#   it gathers the result records produced by the workers
+#   streaming mode (sink defined): records are handed to the sink every RESULTS_BATCH_SIZE rows,
+#   so memory stays flat no matter how many requests a chunk expands into
+class ResultCollector:
+
+    def __init__(self, sink=None, batch_size=RESULTS_BATCH_SIZE):
+
+        self.sink = sink
+        self.batch_size = batch_size
+
+        self.results = []
+        self.rows_written = 0
+
+    def append(self, result):
+
+        self.results.append(result)
+
+        if self.sink is not None and len(self.results) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+
+        if self.sink is None or not self.results:
+            return
+
+        batch = self.results
+        self.results = []
+
+        self.sink(pd.DataFrame(batch))
+        self.rows_written += len(batch)
+
+    def result(self):
+
+        if self.sink is None:
+            return pd.DataFrame(self.results)
+
+        self.flush()
+
+        return self.rows_written
+
+################################################################################################
+
+# iter_rows()
+#   it lazily yields the rows (as dictionaries) of a DataFrame or of an iterable of DataFrames
+def iter_rows(targets):
+
+    chunks = [targets] if isinstance(targets, pd.DataFrame) else targets
+
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False):
+            yield row._asdict()
+
+################################################################################################
+
+async def worker(worker_id, queue, collector, context, controller, health, scheduler):
     
-    last_logged = None
+    processed = 0
 
     while True:
         
-        size = queue.qsize()
-        milestone = size // 500
-
-        if milestone != last_logged and worker_id == 0:
-            print(f"\tQueue size ~ {milestone * 500}")
-            last_logged = milestone
-        
         item = await queue.get()
         
         if item is None:
             queue.task_done()
             break
 
-        ip, uri, declared_obs, user_inserted, timeout, must_test_obs = item
+        ip, uri, declared_obs, user_inserted, profile, must_test_obs = item
+
+        # adaptive in-flight limit (AIMD)
+        await controller.acquire()
 
-        result = await get(
+        # host gone silent (circuit breaker open) -> do not burn the slot for the whole timeout
+        if health.is_open(ip):
+            await controller.cancel()
+            scheduler.release(ip)
+            collector.append(health.skip(ip, uri))
+            queue.task_done()
+            continue
+
+        # rtt: network RTT of the first exchange (rate limiter wait and following blocks excluded)
+        result, rtt = await get(
             ip, uri,
             context,
             declared_obs,
             user_inserted,
-            timeout,
+            # timeouts learned from the RTTs observed in the target network (if any)
+            rtt_handling.adapt_profile(ip, profile),
             must_test_obs
         )
 
-        results.append(result)
+        outcome = concurrency_handling.classify_result(result)
 
-        # rate limiting
-        await asyncio.sleep(rate_delay)
+        # local failure (ex. URI build error) -> logged, the host and the network are not to blame
+        if outcome == 'local':
+            print(f"\tLocal error for {ip}{uri}: {result['data']!r}")
+            await controller.cancel()
+            scheduler.release(ip)
+            collector.append(result)
+            queue.task_done()
+            continue
 
-        queue.task_done()
+        if outcome == 'success' and rtt is not None:
+            rtt_handling.record_rtt(ip, rtt)
 
-    await context.shutdown()
+        health.record(ip, outcome)
+        scheduler.release(ip)
+
+        await controller.release(outcome, rtt)
+
+        collector.append(result)
+
+        processed += 1
+        if worker_id == 0 and processed % 100 == 0:
+            print(f"\t({datetime.datetime.now()}) Worker 0 processed {processed} requests, window {int(controller.window)}")
+
+        queue.task_done()
     
 ################################################################################################
 
-async def get_requests_to_observable_resources(observable_df):
-    
-    print("\tMax Retransmissions: ", aiocoap.numbers.TransportTuning.MAX_RETRANSMIT)
-    timeout = get_max_transmit_wait() + 5
-    print("\tTimeout: ", timeout)
+# run_workers()
+#   it starts the worker fleet and feeds it with the items produced by the given (lazy) producer
+#   the queue is bounded -> the producer is suspended while the workers are busy (backpressure)
+async def run_workers(producer, collector, profile, engine='aiocoap'):
+
+    profile.report()
+    print("\tRate limit [req/s]: ", rate_handling.get_rate_limiter().rate)
+
+    # per-host circuit breaker
+    health = host_handling.HostHealth()
+
+    # per-network packet-rate ceilings
+    pacer = network_handling.NetworkPacer()
+
+    # targets interleaved across networks, then round-robin across hosts + per-host in-flight limit/request cap
+    scheduler = host_handling.FairScheduler(network_handling.interleave(producer), pacer=pacer, collector=collector)
+
+    if engine == 'stateless':
+        await stateless_coap.run(scheduler, collector, profile, health)
+        scheduler.report()
+        pacer.report()
+        health.report()
+        rtt_handling.report()
+        return
     
     # ---------------------------------------
     
-    queue = asyncio.Queue()
-    results = []
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    # adaptive in-flight limit: one worker per window slot, the controller decides how many are active
+    controller = concurrency_handling.AIMDController()
 
-    NUM_WORKERS = 15
-    RATE_DELAY = 0.21
+    # shared client contexts (created once per process)
+    contexts = await context_handling.get_context_pool()
 
     workers = [
-        asyncio.create_task(worker(i, queue, results, RATE_DELAY))
-        for i in range(NUM_WORKERS)
+        asyncio.create_task(worker(i, queue, collector, contexts[i % len(contexts)], controller, health, scheduler))
+        for i in range(controller.maximum)
     ]
 
-    for _, row in observable_df.iterrows():
-        
-        if row['observable'] == 0:
-            declared_obs = True
-        elif row['observable'] == 1:
-            declared_obs = False
-        
-        await queue.put((row['saddr'], row['uri'], declared_obs, False, timeout, False))
+    while (item := await scheduler.next()) is not None:
+        ip, uri, declared_obs, user_inserted, must_test_obs = item
+        await queue.put((ip, uri, declared_obs, user_inserted, profile, must_test_obs))
     
+    # stop workers
     for _ in workers:
         await queue.put(None)
 
     await queue.join()
     await asyncio.gather(*workers)
-    
-    return pd.DataFrame(results)
+
+    controller.report()
+    scheduler.report()
+    pacer.report()
+    health.report()
+    rtt_handling.report()
 
 ################################################################################################
 
-async def discovery(discovery_df):
-    
-    print("\tMax Retransmissions: ", aiocoap.numbers.TransportTuning.MAX_RETRANSMIT)
-    timeout = get_max_transmit_wait() + 5
-    print("\tTimeout: ", timeout)
-    
-    # ---------------------------------------
-    
-    queue = asyncio.Queue()
-    results = []
+def observable_targets(observable_rows):
 
-    NUM_WORKERS = 15
-    RATE_DELAY = 0.21
+    for row in observable_rows:
 
-    workers = [
-        asyncio.create_task(worker(i, queue, results, RATE_DELAY))
-        for i in range(NUM_WORKERS)
-    ]
+        declared_obs = (row['observable'] == 0)
 
-    for _, row in discovery_df.iterrows():
-        
-        await queue.put((row['saddr'], '/.well-known/core', False, False, timeout, False))
-    
-    for _ in workers:
-        await queue.put(None)
+        yield row['saddr'], row['uri'], declared_obs, False, False
 
-    await queue.join()
-    await asyncio.gather(*workers)
-    
-    return pd.DataFrame(results)
+################################################################################################
+
+async def get_requests_to_observable_resources(targets, collector, profile, engine):
+
+    await run_workers(observable_targets(iter_rows(targets)), collector, profile, engine)
 
 ################################################################################################
 
-async def get_requests(discovery_df):
-    
-    print("\tMax Retransmissions: ", aiocoap.numbers.TransportTuning.MAX_RETRANSMIT)
-    timeout = get_max_transmit_wait() + 5
-    print("\tTimeout: ", timeout)
-    
-    # ---------------------------------------
-    
-    queue = asyncio.Queue()
-    results = []
+def discovery_targets(discovery_rows):
 
-    NUM_WORKERS = 15
-    RATE_DELAY = 0.21
+    for row in discovery_rows:
 
-    # create NUM_WORKERS workers
-    workers = [
-        asyncio.create_task(worker(i, queue, results, RATE_DELAY))
-        for i in range(NUM_WORKERS)
-    ]
+        yield row['saddr'], '/.well-known/core', False, False, False
 
-    for _, row in discovery_df.iterrows():
+################################################################################################
+
+async def discovery(targets, collector, profile, engine):
+
+    await run_workers(discovery_targets(iter_rows(targets)), collector, profile, engine)
+
+################################################################################################
+
+def resource_targets(discovery_rows):
+
+    for row in discovery_rows:
             
         if workflow_handling.avoid_get(row):
             continue
@@ -289,13 +322,97 @@ async def get_requests(discovery_df):
             declared_obs = payload_handling.get_metadata_value_of(res, 'obs')
             user_inserted = (uri == '/' and home_path_inserted)
 
-            await queue.put((row['saddr'], uri, declared_obs, user_inserted, timeout, True))
-    
-    # stop workers
-    for _ in workers:
-        await queue.put(None)
+            yield row['saddr'], uri, declared_obs, user_inserted, True
 
-    await queue.join()
-    await asyncio.gather(*workers)
-    
-    return pd.DataFrame(results)
\ No newline at end of file
+################################################################################################
+
+async def get_requests(targets, collector, profile, engine):
+
+    await run_workers(resource_targets(iter_rows(targets)), collector, profile, engine)
+
+################################################################################################
+
+# shard_of()
+#   stable (across processes and runs) shard index of an IP address
+def shard_of(ip_address, n_shards):
+
+    return zlib.crc32(str(ip_address).encode()) % n_shards
+
+################################################################################################
+
+# run_shard()
+#   entry point of every worker process: it runs coap() on its own shard of targets
+#   (the ASNs known by the parent process travel with the targets, 'asn' column)
+def run_shard(shard_df, operation_type, engine, profile, requests_per_second, burst):
+
+    # the global packet rate is split among the worker processes
+    rate_handling.set_rate(requests_per_second, burst)
+
+    if 'asn' in shard_df.columns:
+        network_handling.register_asns(shard_df)
+
+    responses_df = context_handling.run(coap(shard_df, operation_type, engine=engine, profile=profile))
+
+    # exceptions stored as data (ex. NetworkError) are not always picklable -> keep their text only
+    if 'data' in responses_df.columns:
+        responses_df['data'] = responses_df['data'].apply(lambda x: str(x) if isinstance(x, Exception) else x)
+
+    return responses_df
+
+################################################################################################
+
+# coap_sharded()
+#   synchronous counterpart of coap() that splits the targets by IP hash across n_processes worker processes
+#   (response decoding no longer competes with a single event loop); results are merged as they arrive
+#   -> same return values as coap(): DataFrame, or number of rows handed to the sink
+#   targets_df may carry an 'asn' column (ASN of saddr): per-AS pacing and RTT estimates in every process
+def coap_sharded(targets_df, operation_type, n_processes=None, sink=None, engine='aiocoap', profile=None):
+
+    if n_processes is None:
+        n_processes = NUM_PROCESSES
+
+    if n_processes <= 1:
+
+        if 'asn' in targets_df.columns:
+            network_handling.register_asns(targets_df)
+
+        return context_handling.run(coap(targets_df, operation_type, sink=sink, engine=engine, profile=profile))
+
+    limiter = rate_handling.get_rate_limiter()
+    requests_per_second = limiter.rate / n_processes
+    burst = max(1, limiter.burst // n_processes)
+
+    shards = targets_df['saddr'].apply(shard_of, args=(n_processes,))
+
+    pool = process_handling.get_process_pool('coap', n_processes)
+
+    futures = [
+        pool.submit(run_shard, targets_df[shards == shard_id], operation_type, engine, profile, requests_per_second, burst)
+        for shard_id in range(n_processes)
+        if (shards == shard_id).any()
+    ]
+
+    print(f"\t{len(futures)} shards dispatched to {n_processes} processes")
+
+    results = []
+    rows_written = 0
+
+    # order-independent merge
+    for future in as_completed(futures):
+
+        responses_df = future.result()
+
+        if sink is None:
+            results.append(responses_df)
+
+        elif not responses_df.empty:
+            sink(responses_df)
+            rows_written += responses_df.shape[0]
+
+    if sink is not None:
+        return rows_written
+
+    if not results:
+        return pd.DataFrame()
+
+    return pd.concat(results, ignore_index=True)
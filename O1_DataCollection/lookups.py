@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import pandas as pd
 import time
 import os
@@ -6,8 +7,8 @@ import datetime
 
 from aiocoap import *
 
-from utils import payload_handling, workflow_handling
-from O1_DataCollection.coap import coap
+from utils import payload_handling, workflow_handling, context_handling, network_handling, ipinfo_handling, address_handling, storage_handling, manifest_handling
+from O1_DataCollection.coap import coap, coap_sharded
 
 ################################################################################################
 
@@ -17,43 +18,53 @@ CHUNK_SIZE = 1000
 
 ################################################################################################
 
+# pause()
+#   screen pacing of the interactive menu (no call at all in headless runs, MENU_WAIT = 0)
+def pause():
+
+    if MENU_WAIT:
+        time.sleep(MENU_WAIT)
+
+################################################################################################
+
 def lookups(cidr_id):
     
     date_and_time = datetime.datetime.today()
     
-    filename_path = f'O1_DataCollection/data/discovery/cleaned/{cidr_id}/'
-    
-    all_files = os.listdir(filename_path)
-    all_files.sort()
-    
-    # master cleaned csv file
-    filename = filename_path + all_files[0]
+    # master cleaned csv file (first one of the portion, see the run manifest)
+    filename = manifest_handling.first('discovery/cleaned', cidr_id)
 
     # since the ZMap result could be large, I split the output csv file into chunks having size CHUNK_SIZE    
     #   get IP addresses from master ip info file
-    with pd.read_csv(filename, chunksize=CHUNK_SIZE, usecols=['saddr']) as csv_reader:
+    with contextlib.closing(storage_handling.read_chunks(filename, ['saddr'], CHUNK_SIZE)) as csv_reader:
 
         # when an header is necessary, it must be happended on the first chunk only
         add_header = True
 
+        # every address is looked up once per day
+        seen = address_handling.AddressSet()
+
         for i, chunk in enumerate(csv_reader):
             
             # ----------- chunk-info -----------
             print(f"\tChunk nr [{i+1}]")
 
+            # ----------- remove-duplicates -----------
+            chunk = workflow_handling.remove_duplicates(chunk.dropna(subset=['saddr']), seen)
+
             # ----------- enrich-chunk -----------
             chunk['observable'] = False
 
             # ----------- discovery -----------
             print('-' * 50)
             print("\tLOOKUP")
-            time.sleep(MENU_WAIT)
+            pause()
 
             # perform discovery over already found IP addresses
-            discovery_df = asyncio.run(coap(chunk, 0))
-            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/cleaned/{cidr_id}/', None, add_header, date_and_time)
+            discovery_df = coap_sharded(chunk, 0)
+            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/cleaned/{cidr_id}/', None, add_header, date_and_time, portion=cidr_id)
             discovery_df = payload_handling.options_to_json(discovery_df)
-            discovery_df.to_csv(filename, index=False, header=add_header, mode='a')
+            storage_handling.append(discovery_df, filename, add_header)
             
             # ----------------------------------  
             # keep only active ip addresses
@@ -64,47 +75,61 @@ def lookups(cidr_id):
             # ----------- ip-info -----------
             print('-' * 50)
             print("\tADDITIONAL IP INFORMATION EXTRACTION")
-            time.sleep(MENU_WAIT)
+            pause()
             # extract and store the IP addresses collected by ZMap processing 
+            #   (addresses enriched on the previous days are taken from the persistent store: the daily file
+            #   references it -> saddr + mmdb build only)
             ip_info_df = workflow_handling.extract_ip_info(discovery_df[['saddr']])
-            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/ip_info/{cidr_id}', None, add_header, date_and_time)
-            ip_info_df.to_csv(filename, index=False, header=add_header, mode='a')
+            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/ip_info/{cidr_id}', None, add_header, date_and_time, portion=cidr_id)
+            storage_handling.append(ipinfo_handling.reference_of(ip_info_df), filename, add_header)
+            # ASN of every address -> per-AS RTT estimates (adaptive timeouts) + per-AS pacing
+            network_handling.register_asns(ip_info_df)
+            ipinfo_handling.get_prefix_cache().report()
             
             add_header = False
+
+    # end of the lookup stage: Parquet buffers flushed
+    storage_handling.close()
                    
             
-    filepath = f'O1_DataCollection/data/observe/{cidr_id}/'
-    
-    master_observe = os.listdir(filepath)
-    master_observe.sort()
-    
-    filepath += master_observe[0]
+    # master observe csv file (observable resources found by the GET stage)
+    filepath = manifest_handling.first('observe', cidr_id)
+
+    if filepath is None:
+        print("\tThere were no observable resources")
+        return
     
     # since the ZMap result could be large, I split the output csv file into chunks having size CHUNK_SIZE    
     #   get IP addresses from master ip info file
-    with pd.read_csv(filepath, chunksize=CHUNK_SIZE, usecols=['saddr','uri', 'observable']) as csv_reader:
+    with contextlib.closing(storage_handling.read_chunks(filepath, ['saddr','uri', 'observable'], CHUNK_SIZE)) as csv_reader:
         
-        # when an header is necessary, it must be happended on the first chunk only
+        # when an header is necessary, it must be happended on the first batch only
         add_observe_header = True
 
-        for _, chunk in enumerate(csv_reader):
+        # store_observe_batch()
+        #   streaming sink: every batch of responses is stored as soon as it is ready
+        def store_observe_batch(observable_res_df):
 
-            # ----------- get-observable-resources -----------
-            print('-' * 50)
-            print("\tGET OBSERVABLE RESOURCES")
-            time.sleep(MENU_WAIT)
-            
-            if chunk.empty:
-                
-                print("\tThere were no observable resources")
-                
-            else:
+            nonlocal add_observe_header
 
-                # perform the GET requests to found ZMap resources
-                observable_res_df = asyncio.run(coap(chunk, 2))
-                filename = workflow_handling.create_file(f'O1_DataCollection/data/observe/{cidr_id}/', None, add_observe_header, date_and_time)
-                observable_res_df[['saddr', 'uri', 'data', 'data_length', 'observable']].to_csv(filename, index=False, header=add_observe_header, mode='a')
+            filename = workflow_handling.create_file(f'O1_DataCollection/data/observe/{cidr_id}/', None, add_observe_header, date_and_time, portion=cidr_id)
+            storage_handling.append(observable_res_df[['saddr', 'uri', 'data', 'data_length', 'observable']], filename, add_observe_header)
+
+            add_observe_header = False
+
+        # ----------- get-observable-resources -----------
+        print('-' * 50)
+        print("\tGET OBSERVABLE RESOURCES")
+        pause()
+
+        # perform the GET requests to the observable resources
+        #   the master file is streamed through the workers: rows are read lazily, chunk by chunk
+        n_observable_resources = context_handling.run(coap(csv_reader, 2, sink=store_observe_batch))
+
+        if n_observable_resources == 0:
+            
+            print("\tThere were no observable resources")
 
-                add_observe_header = False
+    storage_handling.close()
                 
     return
\ No newline at end of file
@@ -0,0 +1,422 @@
+import asyncio
+import hashlib
+import hmac
+import math
+import os
+import random
+import socket
+import struct
+import time
+
+from aiocoap import *
+
+from utils import concurrency_handling, payload_handling, rate_handling, rtt_handling
+
+################################################################################################
+
+# Stateless CoAP GET engine
+#   a lighter alternative to the aiocoap request/response machinery for bulk GETs:
+#   - GET datagrams are built directly (same bytes as the ZMap probe in utils/zmap_configs/coap_5683.pkt)
+#   - one (or a few) UDP sockets are shared by every request
+#   - request identity is encoded in the token: [4 B sequence number | 4 B keyed hash of (IP, seq)]
+#     so responses are matched (and validated) by looking at the datagram only
+#   - retransmissions and deadlines are driven by a single timer wheel instead of one timer per request
+#   It produces the same record schema as coap.get()
+#   NB: only the first block of a blockwise resource is received -> those records are flagged 'truncated'
+#   NB: ICMP errors are not reported on unconnected UDP sockets -> unreachable hosts end up as 'timeout'
+
+################################################################################################
+
+COAP_PORT = 5683
+
+# number of UDP sockets used to send the requests (round-robin)
+NUM_SOCKETS = 1
+
+# max number of requests waiting for a response
+MAX_IN_FLIGHT = 1000
+
+# timer wheel granularity (seconds) and number of slots (= WHEEL_TICK * WHEEL_SLOTS seconds per revolution)
+WHEEL_TICK = 0.05
+WHEEL_SLOTS = 2048
+
+################################################################################################
+
+# TimerWheel
+#   hashed timing wheel: scheduling and expiring a timer are O(1), one periodic tick drives all of them
+class TimerWheel:
+
+    def __init__(self, tick=WHEEL_TICK, n_slots=WHEEL_SLOTS):
+
+        self.tick = tick
+        self.slots = [[] for _ in range(n_slots)]
+        self.current = 0
+
+    def schedule(self, delay, key):
+
+        ticks = max(1, math.ceil(delay / self.tick))
+
+        rounds, offset = divmod(ticks, len(self.slots))
+
+        self.slots[(self.current + offset) % len(self.slots)].append([rounds, key])
+
+    def advance(self):
+
+        self.current = (self.current + 1) % len(self.slots)
+
+        expired = []
+        remaining = []
+
+        for timer in self.slots[self.current]:
+
+            if timer[0] == 0:
+                expired.append(timer[1])
+            else:
+                timer[0] -= 1
+                remaining.append(timer)
+
+        self.slots[self.current] = remaining
+
+        return expired
+
+################################################################################################
+
+class EngineProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, engine):
+
+        self.engine = engine
+        self.transport = None
+
+    def connection_made(self, transport):
+
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+
+        self.engine.datagram_received(data, addr, self.transport)
+
+    def error_received(self, exc):
+
+        # unconnected socket: the error cannot be bound to a specific request
+        pass
+
+################################################################################################
+
+class StatelessEngine:
+
+    def __init__(self, collector, profile, health, scheduler):
+
+        # where the result records are appended (see coap.ResultCollector)
+        self.collector = collector
+
+        # fair-share scheduler: host slots are given back on completion (see host_handling.FairScheduler)
+        self.scheduler = scheduler
+
+        # per-host circuit breaker (see host_handling.HostHealth)
+        self.health = health
+
+        # retransmission/timeout settings (see transmission_handling.TransmissionProfile)
+        #   -> refined per request with the RTTs observed in the target network
+        self.profile = profile
+
+        # key used to validate the tokens (responses to other runs/spoofed datagrams are dropped)
+        self.secret = os.urandom(16)
+
+        self.sequence = random.getrandbits(32)
+        self.sequence_count = 0
+
+        # seq -> pending request
+        self.pending = {}
+        # (ip, mid) -> seq (empty ACKs/RSTs only carry the message id)
+        self.mids = {}
+
+        self.wheel = TimerWheel()
+        self.ticker = None
+
+        self.transports = []
+
+        self.in_flight = None
+        self.drained = None
+
+    async def start(self):
+
+        loop = asyncio.get_running_loop()
+
+        for _ in range(NUM_SOCKETS):
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: EngineProtocol(self),
+                local_addr=('0.0.0.0', 0),
+                family=socket.AF_INET
+            )
+            self.transports.append(transport)
+
+        self.in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+        self.ticker = asyncio.create_task(self.tick())
+
+    async def close(self, wait=True):
+
+        # wait for every pending request to be answered or to expire
+        if wait:
+            await self.drained.wait()
+
+        self.ticker.cancel()
+
+        for transport in self.transports:
+            transport.close()
+
+        self.transports = []
+
+    # ------------------------------------------------------------------------------------------
+
+    def token_of(self, ip_address, seq):
+
+        seq_bytes = struct.pack('!I', seq)
+
+        digest = hmac.new(self.secret, socket.inet_aton(ip_address) + seq_bytes, hashlib.sha256).digest()
+
+        return seq_bytes + digest[:4]
+
+    def seq_of(self, ip_address, token):
+
+        if len(token) != 8:
+            return None
+
+        seq = struct.unpack('!I', token[:4])[0]
+
+        if not hmac.compare_digest(self.token_of(ip_address, seq), token):
+            return None
+
+        return seq
+
+    # ------------------------------------------------------------------------------------------
+
+    def build_request(self, ip_address, uri, seq, must_test_obs):
+
+        if must_test_obs:
+            request = Message(code=GET, mtype=CON, mid=seq & 0xFFFF, token=self.token_of(ip_address, seq), observe=0)
+        else:
+            request = Message(code=GET, mtype=CON, mid=seq & 0xFFFF, token=self.token_of(ip_address, seq))
+
+        # Uri-Path/Uri-Query only (no Uri-Host, as in the ZMap probe)
+        request.set_request_uri(f"coap://{ip_address}:{COAP_PORT}{uri}", set_uri_host=False)
+
+        return request.encode()
+
+    async def request(self, ip_address, uri, declared_obs, user_inserted, must_test_obs):
+
+        await self.in_flight.acquire()
+
+        # host gone silent (circuit breaker open) -> short-circuit the request
+        if self.health.is_open(ip_address):
+            self.in_flight.release()
+            self.scheduler.release(ip_address)
+            self.collector.append(self.health.skip(ip_address, uri))
+            return
+
+        # rate limiting (process-wide token bucket)
+        await rate_handling.acquire()
+
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        self.sequence_count += 1
+        seq = self.sequence
+
+        try:
+            datagram = self.build_request(ip_address, uri, seq, must_test_obs)
+
+        except Exception as e:
+            # local failure (ex. URI build error) -> logged, not held against the host
+            print(f"\tLocal error for {ip_address}{uri}: {e!r}")
+            self.in_flight.release()
+            self.scheduler.release(ip_address)
+            self.collector.append({**payload_handling.empty_record(ip_address, uri), 'data': e})
+            return
+
+        profile = rtt_handling.adapt_profile(ip_address, self.profile)
+
+        # first retransmission timeout: random value in [ACK_TIMEOUT, ACK_TIMEOUT * ACK_RANDOM_FACTOR]
+        retransmit_timeout = profile.ack_timeout * random.uniform(1, profile.ack_random_factor)
+
+        self.pending[seq] = {
+            'saddr': ip_address,
+            'uri': uri,
+            'declared_obs': declared_obs,
+            'user_inserted': user_inserted,
+            'datagram': datagram,
+            'transport': self.transports[seq % len(self.transports)],
+            'retransmissions': 0,
+            'max_retransmit': profile.max_retransmit,
+            'sent_at': time.monotonic(),
+            'retransmit_timeout': retransmit_timeout,
+            'acked': False,
+            'deadline': time.monotonic() + profile.deadline,
+            # no ACK by then -> the host is not answering (learned profiles give up before the deadline)
+            'give_up': time.monotonic() + min(profile.give_up, profile.deadline)
+        }
+        self.mids[(ip_address, seq & 0xFFFF)] = seq
+        self.drained.clear()
+
+        self.send(seq)
+
+        self.wheel.schedule(retransmit_timeout, seq)
+
+    def send(self, seq):
+
+        entry = self.pending[seq]
+
+        entry['transport'].sendto(entry['datagram'], (entry['saddr'], COAP_PORT))
+
+    def complete(self, seq, fields):
+
+        entry = self.pending.pop(seq, None)
+
+        if entry is None:
+            return
+
+        self.mids.pop((entry['saddr'], seq & 0xFFFF), None)
+
+        self.scheduler.release(entry['saddr'])
+
+        record = payload_handling.empty_record(entry['saddr'], entry['uri'])
+        record.update(fields)
+
+        outcome = concurrency_handling.classify_result(record)
+
+        # local failure (ex. unparsable response fields) -> logged, not held against the host
+        if outcome == 'local':
+            print(f"\tLocal error for {entry['saddr']}{entry['uri']}: {record['data']!r}")
+        else:
+            self.health.record(entry['saddr'], outcome)
+
+        self.collector.append(record)
+
+        self.in_flight.release()
+
+        if not self.pending:
+            self.drained.set()
+
+    # ------------------------------------------------------------------------------------------
+
+    async def tick(self):
+
+        next_tick = time.monotonic()
+
+        while True:
+
+            next_tick += self.wheel.tick
+            await asyncio.sleep(max(0, next_tick - time.monotonic()))
+
+            now = time.monotonic()
+
+            for seq in self.wheel.advance():
+
+                entry = self.pending.get(seq)
+
+                # already completed
+                if entry is None:
+                    continue
+
+                # separate response announced (empty ACK) -> only the deadline matters
+                expiry = entry['deadline'] if entry['acked'] else entry['give_up']
+
+                if now >= expiry:
+                    self.complete(seq, {'data': 'timeout'})
+                    continue
+
+                if entry['acked'] or entry['retransmissions'] >= entry['max_retransmit']:
+                    self.wheel.schedule(expiry - now, seq)
+                    continue
+
+                # retransmission with exponential back-off
+                entry['retransmissions'] += 1
+                entry['retransmit_timeout'] *= 2
+
+                self.send(seq)
+
+                self.wheel.schedule(min(entry['retransmit_timeout'], expiry - now), seq)
+
+    # ------------------------------------------------------------------------------------------
+
+    def datagram_received(self, data, addr, transport):
+
+        ip_address = addr[0]
+
+        try:
+            message = Message.decode(data)
+        except Exception:
+            return
+
+        # empty ACK (separate response will follow) or RST -> matched through the message id
+        if message.code == EMPTY:
+
+            seq = self.mids.get((ip_address, message.mid))
+
+            if seq is None:
+                return
+
+            if message.mtype == ACK:
+                self.pending[seq]['acked'] = True
+
+            elif message.mtype == RST:
+                self.complete(seq, {'data': 'reset'})
+
+            return
+
+        seq = self.seq_of(ip_address, message.token)
+
+        # not one of our tokens
+        if seq is None:
+            return
+
+        entry = self.pending.get(seq)
+
+        # response already processed (ex. observe notification) -> reject it, cancelling the observation
+        if entry is None:
+
+            if message.mtype in (CON, NON):
+                transport.sendto(Message(mtype=RST, code=EMPTY, mid=message.mid).encode(), addr)
+
+            return
+
+        # confirmable (separate) response -> acknowledge it
+        if message.mtype == CON:
+            transport.sendto(Message(mtype=ACK, code=EMPTY, mid=message.mid).encode(), addr)
+
+        # RTT sample (only if unambiguous: no retransmission, no separate response)
+        if entry['retransmissions'] == 0 and not entry['acked']:
+            rtt_handling.record_rtt(ip_address, time.monotonic() - entry['sent_at'])
+
+        try:
+            fields = payload_handling.get_response_fields(message, entry['uri'], entry['declared_obs'], entry['user_inserted'])
+
+        except Exception as e:
+            fields = {'data': e}
+
+        self.complete(seq, fields)
+
+################################################################################################
+
+# run()
+#   it sends a GET for every item handed out by 'scheduler' ((ip, uri, declared_obs, user_inserted, must_test_obs) tuples,
+#   see host_handling.FairScheduler) and appends one record per request to 'collector'
+async def run(scheduler, collector, profile, health):
+
+    engine = StatelessEngine(collector, profile, health, scheduler)
+
+    await engine.start()
+
+    try:
+
+        while (item := await scheduler.next()) is not None:
+            ip, uri, declared_obs, user_inserted, must_test_obs = item
+            await engine.request(ip, uri, declared_obs, user_inserted, must_test_obs)
+
+    except BaseException:
+        await engine.close(wait=False)
+        raise
+
+    await engine.close()
+
+    print(f"\tStateless engine: {engine.sequence_count} requests sent")
@@ -4,8 +4,8 @@ import asyncio
 import datetime
 import os
 
-from utils import payload_handling, workflow_handling
-from O1_DataCollection.coap import coap
+from utils import payload_handling, workflow_handling, context_handling, network_handling, ipinfo_handling, process_handling, cache_handling, address_handling, storage_handling, manifest_handling
+from O1_DataCollection.coap import coap, coap_sharded
 from O1_DataCollection.lookups import lookups
 
 ################################################################################################
@@ -16,37 +16,119 @@ CHUNK_SIZE = 1000
 
 ################################################################################################
 
-# before refining the zmap results, balance them into 7 datasets with evenly distributed num of rows
-def balance_zmap_datasets():
-    
-    # 1. Read and combine all CSVs
-    path_to_zmap_datasets = 'O1_DataCollection/data/discovery/csv/'
-    
-    zmap_datasets = os.listdir(path_to_zmap_datasets)
-    zmap_datasets.sort()
-    
-    zmap_dataframes = [pd.read_csv(path_to_zmap_datasets + f) for f in zmap_datasets]
-    
-    all_data = pd.concat(zmap_dataframes, ignore_index=True)
-    
-    
-    # 2. Compute how many rows each output file should have
-    final_num_files = 7
-    
-    total_rows = len(all_data)
-    
-    base_rows = total_rows // final_num_files
-    extra_rows = total_rows % final_num_files
-    
-    
-    # 3. Split evenly and write new CSV files
-    start = 0
-    
-    for i in range(final_num_files):
-        rows = base_rows + (1 if i < extra_rows else 0)
-        chunk = all_data.iloc[start:start + rows]
-        chunk.to_csv(f'{path_to_zmap_datasets}{i}.csv', index=False)
-        start += rows
+# pause()
+#   screen pacing of the interactive menu (no call at all in headless runs, MENU_WAIT = 0)
+def pause():
+
+    if MENU_WAIT:
+        time.sleep(MENU_WAIT)
+
+################################################################################################
+
+# raw ZMap outputs (any number of csv files, left untouched) -> balanced portions
+RAW_PATH = 'O1_DataCollection/data/discovery/csv/'
+PORTIONS_PATH = 'O1_DataCollection/data/discovery/portions/'
+
+N_PORTIONS = 7
+
+# portions written into RAW_PATH by the former in-place balancer (0.csv ... 6.csv, copies of the raw rows)
+#   -> moved out once (see move_legacy_portions()), otherwise their rows would be balanced twice
+LEGACY_PORTIONS = [f'{i}.csv' for i in range(7)]
+LEGACY_PORTIONS_PATH = 'O1_DataCollection/data/discovery/legacy_portions/'
+
+# rows read at a time from the raw files (memory bound of the balancing)
+BALANCE_CHUNK_SIZE = 100000
+
+################################################################################################
+
+# portion_of()
+#   stable (across processes and runs) portion index of every address:
+#   the same address always ends up in the same portion (duplicates co-located)
+def portion_of(saddr, n_portions):
+
+    return (pd.util.hash_pandas_object(saddr.astype(str), index=False).to_numpy() % n_portions).astype(int)
+
+# move_legacy_portions()
+#   one-off migration: the portions left in RAW_PATH by the former balancer are moved to LEGACY_PORTIONS_PATH
+#   (nothing is deleted)
+def move_legacy_portions():
+
+    legacy_portions = [f for f in sorted(os.listdir(RAW_PATH)) if f in LEGACY_PORTIONS]
+
+    if legacy_portions:
+
+        os.makedirs(LEGACY_PORTIONS_PATH, exist_ok=True)
+
+        for filename in legacy_portions:
+            os.replace(RAW_PATH + filename, LEGACY_PORTIONS_PATH + filename)
+
+        print(f"\tLegacy portions moved out of {RAW_PATH}: {', '.join(legacy_portions)}")
+
+    return legacy_portions
+
+# before refining the zmap results, balance them into n_portions datasets
+#   streaming: the raw files are read chunk by chunk and every row is appended to its portion (saddr hash)
+#   the portions are written to '.part' files, renamed only at the end (no partial/stale portion is ever read)
+def balance_zmap_datasets(n_portions=N_PORTIONS):
+
+    start_time = datetime.datetime.today()
+
+    move_legacy_portions()
+
+    zmap_datasets = sorted(f for f in os.listdir(RAW_PATH) if f.endswith('.csv'))
+
+    os.makedirs(PORTIONS_PATH, exist_ok=True)
+
+    # previous balancing (possibly with a different number of portions)
+    for filename in os.listdir(PORTIONS_PATH):
+        if filename.endswith('.csv') or filename.endswith('.part'):
+            os.remove(PORTIONS_PATH + filename)
+
+    part_filenames = [f'{PORTIONS_PATH}{i}.csv.part' for i in range(n_portions)]
+    rows_per_portion = [0] * n_portions
+
+    # columns of the first raw file (the same order is enforced on all the others)
+    columns = None
+
+    for zmap_dataset in zmap_datasets:
+
+        print(f"\tBalancing {zmap_dataset}")
+
+        with pd.read_csv(RAW_PATH + zmap_dataset, chunksize=BALANCE_CHUNK_SIZE) as csv_reader:
+
+            for chunk in csv_reader:
+
+                if columns is None:
+                    columns = list(chunk.columns)
+                else:
+                    chunk = chunk.reindex(columns=columns)
+
+                for portion_id, portion in chunk.groupby(portion_of(chunk['saddr'], n_portions)):
+
+                    portion.to_csv(part_filenames[portion_id], index=False, header=rows_per_portion[portion_id] == 0, mode='a')
+                    rows_per_portion[portion_id] += portion.shape[0]
+
+    for i, part_filename in enumerate(part_filenames):
+
+        # empty portion -> header only
+        if rows_per_portion[i] == 0:
+            pd.DataFrame(columns=columns).to_csv(part_filename, index=False)
+
+        os.replace(part_filename, f'{PORTIONS_PATH}{i}.csv')
+
+    # run manifest: the portions replace the ones of the previous balancing
+    manifest_handling.forget('discovery/portions')
+    for i, rows in enumerate(rows_per_portion):
+        manifest_handling.register(f'{PORTIONS_PATH}{i}.csv', 'discovery/portions', i, start_time)
+        manifest_handling.set_rows(f'{PORTIONS_PATH}{i}.csv', rows, os.path.getsize(f'{PORTIONS_PATH}{i}.csv'))
+
+    print('-' * 50)
+    print("\tBalanced portions")
+    for i, rows in enumerate(rows_per_portion):
+        print(f"\t\t{i} - {rows} rows")
+    print(f"\t\ttotal - {sum(rows_per_portion)} rows")
+
+    return rows_per_portion
 
 ################################################################################################
 
@@ -57,15 +139,48 @@ def elaborate_zmap_results(cidr_id):
     '''ELABORATE ZMAP RESULTS'''
     '''-------------------------------------------------------'''
     # since the ZMap result could be large, I split the output csv file into chunks having size CHUNK_SIZE    
-    filename = f'O1_DataCollection/data/discovery/csv/{cidr_id}.csv'
+    filename = f'{PORTIONS_PATH}{cidr_id}.csv'
+
+    # addresses already elaborated (previous chunks of the portion): they are not decoded, enriched and GET-crawled again
+    #   NB: the portions are partitioned by address hash (balance_zmap_datasets()) -> no address is shared with other portions
+    seen = address_handling.AddressSet()
     
     with pd.read_csv(filename, chunksize=CHUNK_SIZE) as csv_reader:
 
         # when an header is necessary, it must be happended on the first chunk only
         add_header = True
+        add_get_header = True
         add_observe_header = True
         add_undecodable_msgs_header = True
 
+        # observable resources stored for the current chunk
+        n_observable_resources = 0
+
+        # store_get_batch()
+        #   streaming sink of the GET stage: every batch of responses is stored as soon as it is ready
+        #   (GET responses + observable resources), instead of building the whole chunk result in memory
+        def store_get_batch(get_resources_df):
+
+            nonlocal add_get_header, add_observe_header, n_observable_resources
+
+            filename = workflow_handling.create_file('O1_DataCollection/data/get/', cidr_id, add_get_header, date_and_time)
+            # 'options' -> typed option columns (opt_content_format, ...)
+            get_resources_df = payload_handling.options_to_json(get_resources_df)
+            storage_handling.append(get_resources_df, filename, add_get_header)
+            add_get_header = False
+
+            # consider only those entries having the observable field equal to 0 or 1 -> REAL OBS resources
+            observable_resources_df = get_resources_df[(get_resources_df['observable'] == 0) | (get_resources_df['observable'] == 1)]
+
+            if not observable_resources_df.empty:
+                # store essential data
+                filename = workflow_handling.create_file(f'O1_DataCollection/data/observe/{cidr_id}/', None, add_observe_header, date_and_time, portion=cidr_id)
+                storage_handling.append(observable_resources_df[['saddr', 'uri', 'data', 'data_length', 'observable']], filename, add_observe_header)
+                print(f"\tObservable Resources: \n{observable_resources_df[['saddr', 'uri', 'data', 'data_length', 'observable']]}")
+                add_observe_header = False
+
+                n_observable_resources += observable_resources_df.shape[0]
+
         for i, chunk in enumerate(csv_reader):
 
             # ----------- chunk-info -----------
@@ -74,14 +189,14 @@ def elaborate_zmap_results(cidr_id):
             # ----------- raw-master-dataset -----------
             print('-' * 50)
             print("\tZMAP RAW DATASET")
-            time.sleep(MENU_WAIT)
+            pause()
             # print number of entries in the current chunk
             print(f"\tNumber of entries: {chunk.shape[0]}")
             
             # ----------- remove-invalid-ips -----------
             print('-' * 50)
             print("\tINVALID IP ADDRESSES REMOVAL")
-            time.sleep(MENU_WAIT)
+            pause()
             # remove rows with empty 'saddr' field
             chunk.dropna(subset=['saddr'], inplace=True)
             print(f"\tNumber of unique entries with valid ip address: {chunk.shape[0]}")
@@ -89,9 +204,9 @@ def elaborate_zmap_results(cidr_id):
             # ----------- remove-duplicates -----------                 
             print('-' * 50)
             print("\tDUPLICATES REMOVAL")
-            time.sleep(MENU_WAIT)
+            pause()
             # clean the chunk by removing eventual ICMP duplicates -> 'probes' + 'output-filter' options
-            chunk = workflow_handling.remove_duplicates(chunk)
+            chunk = workflow_handling.remove_duplicates(chunk, seen)
             print(f"\tNumber of unique entries: {chunk.shape[0]}")
 
             # ----------- enrich-chunk -----------
@@ -100,15 +215,17 @@ def elaborate_zmap_results(cidr_id):
             # ----------- decode-zmap-payload -----------
             print('-' * 50)
             print("\tZMAP BINARY DECODE")
-            time.sleep(MENU_WAIT)
+            pause()
             # decode the ZMap results
-            decode_res = asyncio.run(workflow_handling.decode(chunk,'/.well-known/core'))
+            decode_res = context_handling.run(workflow_handling.decode(chunk,'/.well-known/core'))
             chunk = decode_res[0]
             
             print('-' * 50)
             print("\tDecode Results")
             for option, count in decode_res[1].items():
                 print(f"\t\t{option} - {count}")
+
+            cache_handling.report()
             
             if decode_res[2] is not None:
                 print('-' * 50)
@@ -116,53 +233,52 @@ def elaborate_zmap_results(cidr_id):
                 print(decode_res[2])
                 
                 filename = workflow_handling.create_file('O1_DataCollection/data/discovery/undecodable_msgs/', cidr_id, add_undecodable_msgs_header, date_and_time)
-                decode_res[2].to_csv(filename, index=False, header=add_undecodable_msgs_header, mode='a')
+                storage_handling.append(decode_res[2], filename, add_undecodable_msgs_header)
                 add_undecodable_msgs_header = False
 
             # ----------- store-discovery-dataframe -----------
             print('-' * 50)
             print("\tDISCOVERY DATASET STORAGE")
-            time.sleep(MENU_WAIT)
+            pause()
             # stored the cleaned chunk version in append mode
-            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/cleaned/{cidr_id}/', None, add_header, date_and_time)
-            payload_handling.options_to_json(chunk).to_csv(filename, index=False, header=add_header, mode='a')
+            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/cleaned/{cidr_id}/', None, add_header, date_and_time, portion=cidr_id)
+            # 'options' -> typed option columns (opt_content_format is used by the GET targets below)
+            chunk = payload_handling.options_to_json(chunk)
+            storage_handling.append(chunk, filename, add_header)
             print("\tCleaned version stored correctly!")
 
             # ----------- ip-info -----------
             print('-' * 50)
             print("\tADDITIONAL IP INFORMATION EXTRACTION")
-            time.sleep(MENU_WAIT)
+            pause()
             # extract and store the IP addresses collected by ZMap processing 
             ip_info_df = workflow_handling.extract_ip_info(chunk[['saddr']])
-            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/ip_info/{cidr_id}', None, add_header, date_and_time)
-            ip_info_df.to_csv(filename, index=False, header=add_header, mode='a')
+            filename = workflow_handling.create_file(f'O1_DataCollection/data/discovery/ip_info/{cidr_id}', None, add_header, date_and_time, portion=cidr_id)
+            storage_handling.append(ip_info_df, filename, add_header)
+            # ASN of every address -> per-AS RTT estimates (adaptive timeouts) + per-AS pacing
+            network_handling.register_asns(ip_info_df)
+            ipinfo_handling.get_prefix_cache().report()
 
             # ----------- get-resources -----------
             print('-' * 50)
-            print("\tGET RESOURCES")
-            time.sleep(MENU_WAIT)
-            # perform the GET requests to found ZMap resources
-            get_resources_df = asyncio.run(coap(chunk[['saddr','code','data','options']], 1))
-            filename = workflow_handling.create_file('O1_DataCollection/data/get/', cidr_id, add_header, date_and_time)
-            payload_handling.options_to_json(get_resources_df).to_csv(filename, index=False, header=add_header, mode='a')
-
-            # ----------- observe -----------
-            print('-' * 50)
-            print("\tOBSERVE RESOURCES")
-            time.sleep(MENU_WAIT)
-            # consider only those entries having the observable field equal to 0 or 1 -> REAL OBS resources
-            observable_resources_df = get_resources_df[(get_resources_df['observable'] == 0) | (get_resources_df['observable'] == 1)]
+            print("\tGET RESOURCES + OBSERVE RESOURCES")
+            pause()
+            n_observable_resources = 0
+            # perform the GET requests to found ZMap resources (streaming mode -> results stored batch by batch)
+            #   the ASNs go with the targets (worker processes do not share the ones registered here)
+            get_targets_df = chunk[['saddr','code','data','opt_content_format']].merge(ip_info_df[['saddr', 'asn']].drop_duplicates('saddr'), on='saddr', how='left')
+            n_get_responses = coap_sharded(get_targets_df, 1, sink=store_get_batch)
+            print(f"\tGET responses stored: {n_get_responses}")
 
-            if observable_resources_df.empty:
+            if n_observable_resources == 0:
                 print("\t\tThere were NOT observable resources within the collected dataset")
-            else:
-                # store essential data
-                filename = workflow_handling.create_file(f'O1_DataCollection/data/observe/{cidr_id}/', None, add_observe_header, date_and_time)
-                observable_resources_df[['saddr', 'uri', 'data', 'data_length', 'observable']].to_csv(filename, index=False, header=add_observe_header, mode='a')
-                print(f"\tObservable Resources: \n{observable_resources_df[['saddr', 'uri', 'data', 'data_length', 'observable']]}")
-                add_observe_header = False
                 
             add_header = False
+
+    seen.report()
+
+    # the lookups read the cleaned dataset back: Parquet buffers flushed
+    storage_handling.close()
     
     return
 
@@ -210,6 +326,11 @@ def after_zmap_execution():
         # print the error type
         print(e)
 
+    finally:
+        # close the shared CoAP client contexts and worker processes (once, at the end of the whole run)
+        context_handling.shutdown()
+        process_handling.shutdown_process_pool()
+
     return
 
 ################################################################################################
@@ -221,10 +342,10 @@ def portion_selection():
 
     # header
     print("\tindex".ljust(10))
-    # options
-    for index in range(7):
+    # options (portions written by balance_zmap_datasets())
+    for portion in manifest_handling.datasets('discovery/portions'):
 
-        print(f"\t{index}".ljust(10))
+        print(f"\t{portion['portion']}".ljust(10))
     
     # user selects the portion id
     print("\nPlease select the index:", end="")
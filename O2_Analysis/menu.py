@@ -3,7 +3,7 @@ from O2_Analysis.options import payload
 from O2_Analysis.options import get_resource
 from O2_Analysis.options import zmap
 
-import os
+from utils import manifest_handling
 
 ############################################
 
@@ -127,58 +127,32 @@ def analysis_sel():
 
 def dataset_sel(analysis):
 
-    # --------- IP info datasets ---------
-    path = 'O1_DataCollection/data/'
-
-    # --------- Scope-oriented datasets ---------
+    # --------- Scope-oriented datasets (run manifest stages) ---------
     match analysis[0]:
 
         case 0:
-            # zmap based
-            path += 'discovery/csv/'
+            # zmap based (balanced portions)
+            stage = 'discovery/portions'
         case 1:
             # discovery based
-            path += 'discovery/'
-            
             match analysis[1]:
                 
                 case 0:
-                    path += 'ip_info/'
+                    stage = 'discovery/ip_info'
                         
                 case 1:
-                    path += 'cleaned/'
+                    stage = 'discovery/cleaned'
                     
         case 2:
             # observe based
-            path += 'observe/'
+            stage = 'observe'
         case 3:
             # get based
-            path += 'get/'
+            stage = 'get'
             
     
-    # Dataset files extraction
-    datasets_path = []
-    
-    datasets_filenames = os.listdir(path)
-    datasets_filenames.sort()
-    
-    for dataset in datasets_filenames:
-        
-        if dataset.endswith('.csv'):
-        
-            datasets_path.append(path + dataset)
-            
-            
-        else:
-            
-            files = os.listdir(f'{path}{dataset}/')
-            files.sort()
-            
-            for data in files:
-                
-                datasets_path.append(f"{path}{dataset}/{data}")
-    
-    return datasets_path
+    # Dataset files extraction (portion by portion, in creation order)
+    return [dataset['path'] for dataset in manifest_handling.datasets(stage)]
     
 
 
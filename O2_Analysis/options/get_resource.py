@@ -3,7 +3,8 @@ import json
 import plotly.express as px
 
 from collections import Counter
-from dateutil.parser import parse
+
+from utils import payload_handling, storage_handling
 
 CHUNK_SIZE = 10000
 
@@ -31,44 +32,6 @@ def detect_server_version(payload):
     return None
 
 
-def detect_format(s: str):
-    # 1. Number first
-    try:
-        int(s)
-        return "int"
-    except ValueError:
-        try:
-            float(s)
-            return "float"
-        except ValueError:
-            try:
-                complex(s)
-                return "complex"
-            except ValueError:
-                pass
-
-    # 2. Boolean
-    if s.lower() in {"true", "false"}:
-        return "boolean"
-
-    # 3. Datetime
-    try:
-        parse(s)
-        return "datetime"
-    except Exception:
-        pass
-
-    # 4. JSON
-    try:
-        json.loads(s)
-        return "json"
-    except (json.JSONDecodeError, TypeError):
-        pass
-
-    # 5. Fallback: just a string
-    return "string"
-
-
 def analysis(data_paths, mode):
 
     match mode:
@@ -80,7 +43,7 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data_format']): 
+                for chunk in storage_handling.read_chunks(path, ['data_format'], CHUNK_SIZE): 
 
                     # DATA CLEANING
                     # deleting rows with data_format field equal to nan
@@ -119,7 +82,7 @@ def analysis(data_paths, mode):
             
             for path in data_paths:
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data_length']): 
+                for chunk in storage_handling.read_chunks(path, ['data_length'], CHUNK_SIZE): 
 
                     # DATA CLEANING
                     # deleting rows with data_length field equal to nan
@@ -160,7 +123,7 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['uri','code', 'user_inserted']): 
+                for chunk in storage_handling.read_chunks(path, ['uri','code', 'user_inserted'], CHUNK_SIZE): 
 
                     # DATA CLEANING
                     # deleting rows with code field equal to nan
@@ -211,24 +174,39 @@ def analysis(data_paths, mode):
             
             for path in data_paths:
 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['options']): 
+                option_columns = list(payload_handling.OPTION_COLUMNS_OF.values()) + [payload_handling.OTHER_OPTIONS_COLUMN, 'options']
 
-                    # DATA CLEANING
-                    # deleting rows with code field equal to nan
-                    chunk.dropna(ignore_index=True, inplace=True, subset=['options'])
+                for chunk in storage_handling.read_chunks(path, lambda column: column in option_columns, CHUNK_SIZE): 
 
-                    ##############################
+                    # typed option columns -> count the non-empty values per column
+                    for name, column in payload_handling.OPTION_COLUMNS_OF.items():
+                        if column in chunk.columns and chunk[column].notna().any():
+                            options[name] += int(chunk[column].notna().sum())
+
+                    # remaining options (compact JSON) -> only option keys and NOT values
+                    if payload_handling.OTHER_OPTIONS_COLUMN in chunk.columns:
+                        for raw in chunk[payload_handling.OTHER_OPTIONS_COLUMN].dropna():
+                            options.update(json.loads(raw).keys())
+
+                    # datasets stored before the typed option columns
+                    if 'options' in chunk.columns:
+
+                        # DATA CLEANING
+                        # deleting rows with code field equal to nan
+                        chunk.dropna(ignore_index=True, inplace=True, subset=['options'])
+
+                        ##############################
 
-                    # Parse JSON safely
-                    for raw in chunk['options']:
-                        try:
-                            parsed = json.loads(raw.replace('""', '"'))
-                            # only option keys and NOT values
-                            options.update(parsed.keys())
+                        # Parse JSON safely
+                        for raw in chunk['options']:
+                            try:
+                                parsed = json.loads(raw.replace('""', '"'))
+                                # only option keys and NOT values
+                                options.update(parsed.keys())
 
-                        # ignore malformed entries
-                        except Exception:
-                            continue 
+                            # ignore malformed entries
+                            except Exception:
+                                continue 
 
 
             ##############################
@@ -258,13 +236,12 @@ def analysis(data_paths, mode):
             
             for path in data_paths:
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data', 'code', 'uri']): 
+                for chunk in storage_handling.read_chunks(path, ['data', 'code', 'uri'], CHUNK_SIZE, filters=[('code', '==', '2.05 Content'), ('uri', '==', '/')]): 
 
                     # DATA CLEANING
+                    # (only rows with code equal to 2.05 and where the uri is home path ('/'): filter pushed down to the reader)
                     # deleting rows with data field equal to nan
                     chunk.dropna(ignore_index=True, inplace=True, subset=['data'])
-                    # keep only rows with code equal to 2.05 and where the uri is home path ('/')
-                    chunk = chunk[(chunk['code'] == '2.05 Content') & (chunk['uri'] == '/')]
                     
                     ##############################
 
@@ -298,7 +275,7 @@ def analysis(data_paths, mode):
             
             for path in data_paths:
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['uri', 'code', 'user_inserted', 'observable']): 
+                for chunk in storage_handling.read_chunks(path, ['uri', 'code', 'user_inserted', 'observable'], CHUNK_SIZE): 
 
                     # DATA CLEANING
                     # deleting rows with code field equal to nan
@@ -353,7 +330,7 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['uri','code', 'user_inserted']): 
+                for chunk in storage_handling.read_chunks(path, ['uri','code', 'user_inserted'], CHUNK_SIZE): 
 
                     # DATA CLEANING
                     # deleting rows with code field equal to nan
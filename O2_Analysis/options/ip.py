@@ -6,6 +6,8 @@ import gc
 
 from collections import Counter
 
+from utils import ipinfo_handling, storage_handling, manifest_handling
+
 #############################
 
 CHUNK_SIZE = 1000
@@ -43,12 +45,15 @@ def analysis(paths, mode):
         
     for path in paths:
             
-        # take only date and ignore '.csv' part of the string 
-        current_date = path.split('/')[5][:10]
+        # take the date of the run that created the dataset (run manifest) 
+        current_date = manifest_handling.date_of(path)
             
         data_dict = Counter() 
             
-        for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=[mode]): 
+        # (reference datasets: saddr + mmdb build, the fields are read from the enrichment store)
+        for chunk in storage_handling.read_chunks(path, lambda column: column in (mode, 'saddr', ipinfo_handling.BUILD_COLUMN), CHUNK_SIZE): 
+
+            chunk = ipinfo_handling.resolve(chunk)
                 
             vc = chunk[mode].value_counts(dropna=True)
                 
@@ -150,10 +155,10 @@ def stability_analysis(paths):
         
     for path in paths:
             
-        # take only date and ignore '.csv' part of the string 
-        current_date = path.split('/')[5][:10]
+        # take the date of the run that created the dataset (run manifest) 
+        current_date = manifest_handling.date_of(path)
             
-        for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['saddr']):
+        for chunk in storage_handling.read_chunks(path, ['saddr'], CHUNK_SIZE):
             
             if current_date not in data_per_date_dict.keys():
                 
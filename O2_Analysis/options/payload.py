@@ -2,7 +2,7 @@ import pandas as pd
 import plotly.express as px
 from collections import Counter
 
-from utils import payload_handling
+from utils import payload_handling, storage_handling, manifest_handling
 
 ########################################
 
@@ -22,16 +22,15 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
 
-                # take current date
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 sizes = Counter()
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data_length', 'code']): 
+                for chunk in storage_handling.read_chunks(path, ['data_length', 'code'], CHUNK_SIZE, filters=[('code', '==', '2.05 Content')]): 
                     
                     # DATA CLEANING
-                    # keeping only entries having code equal to 2.05 Content
-                    chunk = chunk[chunk['code'] == '2.05 Content']
+                    # (only entries having code equal to 2.05 Content: filter pushed down to the reader)
                     # deleting rows with code field equal to nan -> network error/max retransmits/timeout
                     chunk.dropna(ignore_index=True, inplace=True, subset=['code'])
                     
@@ -74,16 +73,15 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
 
-                # take only date and ignore '.csv' part of the string
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 uri_counter = Counter()
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data', 'code']): 
+                for chunk in storage_handling.read_chunks(path, ['data', 'code'], CHUNK_SIZE, filters=[('code', '==', '2.05 Content')]): 
 
                     # DATA CLEANING
-                    # keeping only entries having code equal to 2.05 Content
-                    chunk = chunk[chunk['code'] == '2.05 Content']
+                    # (only entries having code equal to 2.05 Content: filter pushed down to the reader)
                     # deleting rows with data field equal to nan
                     chunk.dropna(ignore_index=True, inplace=True, subset=['data'])
 
@@ -135,16 +133,15 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
 
-                # take only date and ignore '.csv' part of the string
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 n_resources = Counter()
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data', 'code']): 
+                for chunk in storage_handling.read_chunks(path, ['data', 'code'], CHUNK_SIZE, filters=[('code', '==', '2.05 Content')]): 
 
                     # DATA CLEANING
-                    # keeping only entries having code equal to 2.05 Content
-                    chunk = chunk[chunk['code'] == '2.05 Content']
+                    # (only entries having code equal to 2.05 Content: filter pushed down to the reader)
                     # deleting rows with data field equal to nan
                     chunk.dropna(ignore_index=True, inplace=True, subset=['data'])
 
@@ -187,16 +184,15 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
 
-                # take only date and ignore '.csv' part of the string
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 n_levels = Counter()
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data', 'code']): 
+                for chunk in storage_handling.read_chunks(path, ['data', 'code'], CHUNK_SIZE, filters=[('code', '==', '2.05 Content')]): 
 
                     # DATA CLEANING
-                    # keeping only entries having code equal to 2.05 Content
-                    chunk = chunk[chunk['code'] == '2.05 Content']
+                    # (only entries having code equal to 2.05 Content: filter pushed down to the reader)
                     # deleting rows with data field equal to nan
                     chunk.dropna(ignore_index=True, inplace=True, subset=['data'])
 
@@ -242,12 +238,12 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
 
-                # take current date out of filename
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 active_servers = 0
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['code']): 
+                for chunk in storage_handling.read_chunks(path, ['code'], CHUNK_SIZE): 
                     
                     # DATA CLEANING
                     # deleting rows with data field equal to nan
@@ -286,13 +282,13 @@ def analysis(data_paths, mode):
             
             for path in data_paths:
 
-                # take current date out of filename
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 coap_servers = 0
                 wellknown_explicit = 0
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data', 'code']): 
+                for chunk in storage_handling.read_chunks(path, ['data', 'code'], CHUNK_SIZE): 
 
                     # DATA CLEANING
                     # deleting rows with data field equal to nan
@@ -348,16 +344,15 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
 
-                # take current date out of filename
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 metadatas = Counter()
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data', 'code']): 
+                for chunk in storage_handling.read_chunks(path, ['data', 'code'], CHUNK_SIZE, filters=[('code', '==', '2.05 Content')]): 
 
                     # DATA CLEANING
-                    # keeping only entries having code equal to 2.05 Content
-                    chunk = chunk[chunk['code'] == '2.05 Content']
+                    # (only entries having code equal to 2.05 Content: filter pushed down to the reader)
                     # deleting rows with data field equal to nan
                     chunk.dropna(ignore_index=True, inplace=True, how='any', subset=['data', 'code'])
 
@@ -403,16 +398,15 @@ def analysis(data_paths, mode):
 
             for path in data_paths:
 
-                # take current date out of filename
-                current_date = path.split('/')[5][:10]
+                # take the date of the run that created the dataset (run manifest)
+                current_date = manifest_handling.date_of(path)
 
                 ct_values = Counter()
                 
-                for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['data', 'code']): 
+                for chunk in storage_handling.read_chunks(path, ['data', 'code'], CHUNK_SIZE, filters=[('code', '==', '2.05 Content')]): 
 
                     # DATA CLEANING
-                    # keeping only entries having code equal to 2.05 Content
-                    chunk = chunk[chunk['code'] == '2.05 Content']
+                    # (only entries having code equal to 2.05 Content: filter pushed down to the reader)
                     # deleting rows with data field equal to nan
                     chunk.dropna(ignore_index=True, inplace=True, how='any', subset=['data', 'code'])
 
@@ -1,8 +1,9 @@
+import contextlib
 import pandas as pd
 import plotly.express as px
 from collections import Counter
 
-from utils import workflow_handling
+from utils import workflow_handling, address_handling, storage_handling
 
 ########################################à
 
@@ -13,16 +14,19 @@ CHUNK_SIZE = 1000
 def analysis(data_paths):
 
     zmap_res = Counter()
+
+    # every address is counted once (across chunks and files)
+    seen = address_handling.AddressSet()
             
     for path in data_paths:
         
-        with pd.read_csv(path, chunksize=CHUNK_SIZE, usecols=['saddr', 'data', 'classification', 'icmp_unreach_str']) as csv_reader:
+        with contextlib.closing(storage_handling.read_chunks(path, ['saddr', 'data', 'classification', 'icmp_unreach_str'], CHUNK_SIZE)) as csv_reader:
 
             for _, chunk in enumerate(csv_reader):
 
                 # ----------- remove-duplicates -----------
                 # clean the chunk by removing eventual ICMP duplicates -> 'probes' + 'output-filter' options
-                chunk = workflow_handling.remove_duplicates(chunk)
+                chunk = workflow_handling.remove_duplicates(chunk, seen)
                 
                 # ----------- remove-invalid-ips -----------
                 # remove rows with empty 'saddr' field
@@ -0,0 +1,137 @@
+import argparse
+import contextlib
+import datetime
+import logging
+import sys
+
+import O1_DataCollection.lookups as lookup_stage
+
+from O1_DataCollection import zmap
+from utils import log_handling, context_handling, process_handling, manifest_handling, storage_handling
+
+################################################################################################
+
+# Headless entry point (no prompts, no screen pacing): meant to be run by a scheduler
+#
+#   python cli.py balance [--portions N]
+#   python cli.py refine 0 3 5
+#   python cli.py lookups 0 3 5
+#
+#   log records (JSON lines) on stderr, exit code 0 = success, 1 = at least one portion failed
+
+logger = logging.getLogger('cli')
+
+################################################################################################
+
+def parse_arguments(argv):
+
+    parser = argparse.ArgumentParser(description="IoT-Thesis data collection pipeline (headless)")
+
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--formats', default=None, help="output formats, comma separated (csv, parquet), default csv (parquet needs pyarrow)")
+
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    balance = commands.add_parser('balance', help="balance the raw ZMap datasets into portions")
+    balance.add_argument('--portions', type=int, default=zmap.N_PORTIONS, help="number of portions")
+
+    refine = commands.add_parser('refine', help="elaborate the ZMap results of the given portions")
+    refine.add_argument('portion_ids', type=int, nargs='+')
+
+    lookups = commands.add_parser('lookups', help="perform one lookup round over the given portions")
+    lookups.add_argument('portion_ids', type=int, nargs='+')
+
+    return parser.parse_args(argv)
+
+################################################################################################
+
+# run_stage()
+#   it runs stage(portion_id) for every portion, logging start/end/duration (one failure does not stop the others)
+#   O: number of failed portions
+def run_stage(name, stage, portion_ids, output):
+
+    n_failed = 0
+
+    available = {dataset['portion'] for dataset in manifest_handling.datasets('discovery/portions')}
+
+    for portion_id in portion_ids:
+
+        output.fields = {'stage': name, 'portion': portion_id}
+
+        if str(portion_id) not in available:
+            log_handling.event(logger, "unknown portion", logging.ERROR, stage=name, portion=portion_id)
+            n_failed += 1
+            continue
+
+        start = datetime.datetime.now()
+        log_handling.event(logger, "stage started", stage=name, portion=portion_id)
+
+        try:
+            stage(portion_id)
+
+        except Exception as e:
+            n_failed += 1
+            log_handling.event(logger, "stage failed", logging.ERROR, exc_info=e, stage=name, portion=portion_id)
+
+        else:
+            elapsed = (datetime.datetime.now() - start).total_seconds()
+            log_handling.event(logger, "stage completed", stage=name, portion=portion_id, seconds=elapsed)
+
+    output.fields = {}
+
+    return n_failed
+
+def main(argv=None):
+
+    arguments = parse_arguments(argv)
+
+    log_handling.configure(arguments.log_level)
+
+    # no screen pacing
+    zmap.MENU_WAIT = 0
+    lookup_stage.MENU_WAIT = 0
+
+    # output of the worker processes -> log records too (stdout carries no plain text)
+    process_handling.set_worker_initializer(log_handling.init_worker, arguments.log_level)
+
+    # pipeline output (print) -> log records
+    output = log_handling.PrintToLog(logging.getLogger('pipeline'))
+
+    n_failed = 0
+
+    try:
+
+        with contextlib.redirect_stdout(output):
+
+            if arguments.formats:
+                storage_handling.set_output_formats(arguments.formats.split(','))
+
+            match arguments.command:
+
+                case 'balance':
+                    output.fields = {'stage': 'balance'}
+                    rows_per_portion = zmap.balance_zmap_datasets(arguments.portions)
+                    log_handling.event(logger, "balance completed", stage='balance', rows_per_portion=rows_per_portion)
+
+                case 'refine':
+                    n_failed = run_stage('refine', zmap.elaborate_zmap_results, arguments.portion_ids, output)
+
+                case 'lookups':
+                    n_failed = run_stage('lookups', lookup_stage.lookups, arguments.portion_ids, output)
+
+            output.flush()
+
+    except Exception as e:
+        log_handling.event(logger, "run failed", logging.ERROR, exc_info=e, command=arguments.command)
+        return 1
+
+    finally:
+        # close the shared CoAP client contexts and worker processes
+        context_handling.shutdown()
+        process_handling.shutdown_process_pool()
+
+    return 1 if n_failed else 0
+
+# NB: guarded -> worker processes (spawn) import this module without running the pipeline
+if __name__ == '__main__':
+    sys.exit(main())
@@ -47,4 +47,6 @@ def main():
     return None
 
 # call the main function
-main()
\ No newline at end of file
+#   NB: guarded -> worker processes (spawn) import this module without starting the menu
+if __name__ == '__main__':
+    main()
\ No newline at end of file
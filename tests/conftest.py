@@ -0,0 +1,24 @@
+import pytest
+
+from utils import manifest_handling, storage_handling
+
+################################################################################################
+
+# data_path
+#   pipeline data directory (datasets, Parquet mirrors, run manifest) in a temporary directory
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+
+    path = f"{tmp_path}/data/"
+
+    manifest_handling.close()
+
+    monkeypatch.setattr(manifest_handling, 'DATA_PATH', path)
+    monkeypatch.setattr(manifest_handling, 'MANIFEST_PATH', f"{path}manifest.sqlite")
+    monkeypatch.setattr(storage_handling, 'DATA_PATH', path)
+    monkeypatch.setattr(storage_handling, 'PARQUET_PATH', f"{path}parquet/")
+
+    yield path
+
+    storage_handling.close()
+    manifest_handling.close()
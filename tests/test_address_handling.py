@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from utils import address_handling
+
+################################################################################################
+
+def test_add_new_matches_python_set(monkeypatch):
+
+    # small buffer -> the merge path is exercised too
+    monkeypatch.setattr(address_handling, 'MIN_BUFFER_SIZE', 64)
+
+    rng = np.random.default_rng(0)
+
+    seen = address_handling.AddressSet()
+    reference = set()
+
+    for _ in range(20):
+
+        chunk = pd.Series([f"10.{a}.{b}.{c}" for a, b, c in rng.integers(0, 8, size=(200, 3))] + [None, 'not an ip'], dtype=object)
+
+        expected = []
+        for ip_address in chunk:
+            if ip_address is None or ip_address == 'not an ip':
+                expected.append(True)
+            elif ip_address in reference:
+                expected.append(False)
+            else:
+                reference.add(ip_address)
+                expected.append(True)
+
+        assert seen.add_new(chunk).tolist() == expected
+
+    assert len(seen) == len(reference)
+    assert seen.contains(pd.Series(sorted(reference))).all()
@@ -0,0 +1,43 @@
+from utils import cache_handling
+
+################################################################################################
+
+def test_memoized_results_are_not_shared():
+
+    @cache_handling.memoize('test_options')
+    def parse(payload):
+        return [{'name': payload, 'values': [1, 2]}]
+
+    first = parse('</sensor>')
+    first[0]['values'].append(3)
+    first.append({})
+
+    second = parse('</sensor>')
+    second[0]['name'] = 'changed'
+
+    assert parse('</sensor>') == [{'name': '</sensor>', 'values': [1, 2]}]
+    assert parse.cache.hits == 2
+
+def test_str_and_bytes_payloads_do_not_collide():
+
+    @cache_handling.memoize('test_types')
+    def kind(payload):
+        return type(payload).__name__
+
+    payload = 'x' * (cache_handling.MAX_RAW_KEY_LENGTH + 1)
+
+    assert kind(payload) == 'str'
+    assert kind(payload.encode()) == 'bytes'
+
+def test_flat_results_are_copied():
+
+    @cache_handling.memoize('test_flat')
+    def decode(payload):
+        return {'data': payload, 'data_length': len(payload)}
+
+    first = decode('21.5')
+    first['data'] = 21.5
+
+    assert decode('21.5') == {'data': '21.5', 'data_length': 4}
+    assert cache_handling.copier_of(first) is cache_handling.copy.copy
+    assert cache_handling.copier_of([{'values': []}]) is cache_handling.copy.deepcopy
@@ -0,0 +1,78 @@
+import asyncio
+
+import aiocoap.error
+
+from utils import concurrency_handling, payload_handling
+
+################################################################################################
+
+# outcome_of()
+#   outcome of a record without response carrying 'data'
+def outcome_of(data):
+
+    return concurrency_handling.classify_result({**payload_handling.empty_record('10.0.0.1', '/a'), 'data': data})
+
+# run_requests()
+#   one acquire/release per outcome, it returns the window afterwards
+def run_requests(controller, outcomes, rtt=0.1):
+
+    async def scenario():
+
+        for outcome in outcomes:
+            await controller.acquire()
+            await controller.release(outcome, rtt)
+
+        return controller.window
+
+    return asyncio.run(scenario())
+
+################################################################################################
+
+def test_classify_result():
+
+    assert concurrency_handling.classify_result({**payload_handling.empty_record('10.0.0.1', '/a'), 'code': '2.05 Content'}) == 'success'
+
+    assert outcome_of('timeout') == 'timeout'
+    assert outcome_of('reset') == 'error'
+    assert outcome_of(aiocoap.error.ConRetransmitsExceeded()) == 'error'
+    assert outcome_of(ConnectionRefusedError()) == 'error'
+
+    # failures on this side say nothing about the host
+    assert outcome_of(aiocoap.error.MalformedUrlError()) == 'local'
+    assert outcome_of(ValueError('bad uri')) == 'local'
+
+def test_additive_increase():
+
+    controller = concurrency_handling.AIMDController(initial=5, minimum=5, maximum=10)
+
+    # about +1 every 'window' healthy responses
+    assert int(run_requests(controller, ['success'] * 5)) == 5
+    assert int(run_requests(controller, ['success'])) == 6
+    assert controller.increases == 1
+
+    # slow responses or unknown RTTs do not open the window
+    assert int(run_requests(controller, ['success'] * 20, rtt=concurrency_handling.HEALTHY_RTT + 1)) == 6
+    assert int(run_requests(controller, ['success'] * 20, rtt=None)) == 6
+
+    assert int(run_requests(controller, ['success'] * 1000)) == 10
+
+def test_multiplicative_decrease():
+
+    controller = concurrency_handling.AIMDController(initial=40, minimum=5, maximum=100)
+
+    # a batch of failures is a single congestion event
+    assert run_requests(controller, ['timeout', 'error', 'timeout']) == 40 * concurrency_handling.DECREASE_FACTOR
+    assert controller.decreases == 1
+
+    # next decrease after DECREASE_INTERVAL, never below the minimum
+    controller.last_decrease -= concurrency_handling.DECREASE_INTERVAL
+    assert run_requests(controller, ['timeout']) == 10
+
+    controller.last_decrease -= concurrency_handling.DECREASE_INTERVAL
+    assert run_requests(controller, ['timeout']) == 5
+
+    controller.last_decrease -= concurrency_handling.DECREASE_INTERVAL
+    assert run_requests(controller, ['timeout']) == 5
+
+    assert controller.outcomes == {'success': 0, 'timeout': 5, 'error': 1}
+    assert controller.in_flight == 0
@@ -0,0 +1,101 @@
+import asyncio
+
+import pandas as pd
+
+from aiocoap import Message, CONTENT, NOT_FOUND, ACK
+
+from utils import workflow_handling, process_handling, cache_handling, payload_handling
+
+################################################################################################
+
+# zmap_chunk()
+#   ZMap-like chunk (one CHUNK_SIZE of the pipeline): CoAP responses with and without options + ICMP rows
+def zmap_chunk(n_rows=1000):
+
+    rows = []
+
+    for i in range(n_rows):
+
+        saddr = f"10.0.{i // 256}.{i % 256}"
+
+        if i % 10 == 9:
+            rows.append({'saddr': saddr, 'success': 0, 'data': None, 'udp_pkt_size': None, 'icmp_unreach_str': 'port'})
+            continue
+
+        if i % 3 == 0:
+            msg = Message(mtype=ACK, code=CONTENT, mid=i, token=b'\x01\x02', payload=b'</sensors/temp>;obs', content_format=40)
+        elif i % 3 == 1:
+            msg = Message(mtype=ACK, code=CONTENT, mid=i, payload=f"value {i}".encode())
+        else:
+            msg = Message(mtype=ACK, code=NOT_FOUND, mid=i)
+
+        data = msg.encode()
+
+        rows.append({'saddr': saddr, 'success': 1, 'data': data.hex(), 'udp_pkt_size': len(data) + 8, 'icmp_unreach_str': None})
+
+    return pd.DataFrame(rows)
+
+################################################################################################
+
+def test_pipeline_chunk_is_split_across_processes():
+
+    slices = workflow_handling.slices_of(zmap_chunk(), 2)
+
+    assert len(slices) == 2
+    assert sum(len(df_slice) for df_slice in slices) == 1000
+
+def test_small_chunk_is_not_split():
+
+    assert len(workflow_handling.slices_of(zmap_chunk(100), 4)) == 1
+
+def test_parallel_decode_matches_serial_decode(monkeypatch):
+
+    chunk = zmap_chunk()
+
+    pool_sizes = []
+    get_process_pool = process_handling.get_process_pool
+
+    def recording_get_process_pool(use, n_processes):
+        pool_sizes.append((use, n_processes))
+        return get_process_pool(use, n_processes)
+
+    monkeypatch.setattr(process_handling, 'get_process_pool', recording_get_process_pool)
+
+    cache_handling.clear()
+
+    try:
+        serial_df, serial_results, _ = asyncio.run(workflow_handling.decode(chunk, '/.well-known/core', n_processes=1))
+        parallel_df, parallel_results, _ = asyncio.run(workflow_handling.decode(chunk, '/.well-known/core', n_processes=2))
+    finally:
+        process_handling.shutdown_process_pool()
+
+    # the process pool is used for the pipeline-sized chunk (and only in the parallel run)
+    assert pool_sizes == [('decode', 2)]
+
+    pd.testing.assert_frame_equal(serial_df, parallel_df)
+    assert serial_results == parallel_results
+    assert serial_results['success'] == 900
+
+    # payload cache lookups made by the workers are reported by the parent process
+    worker_lookups = sum(hits + misses for hits, misses in cache_handling._worker_counters.values())
+    assert worker_lookups > 0
+
+def test_process_pools_are_kept_per_use():
+
+    try:
+        coap_pool = process_handling.get_process_pool('coap', 1)
+        decode_pool = process_handling.get_process_pool('decode', 2)
+
+        assert process_handling.get_process_pool('coap', 1) is coap_pool
+        assert process_handling.get_process_pool('decode', 2) is decode_pool
+    finally:
+        process_handling.shutdown_process_pool()
+
+def test_decoded_rows_have_the_get_record_schema():
+
+    assert workflow_handling.DECODED_COLUMNS == list(payload_handling.empty_record('10.0.0.1', '/'))
+
+    decoded_df, _, _ = asyncio.run(workflow_handling.decode(zmap_chunk(100), '/.well-known/core', n_processes=1))
+
+    assert list(decoded_df.columns) == workflow_handling.DECODED_COLUMNS
+    assert decoded_df['truncated'].eq(False).sum() == 90
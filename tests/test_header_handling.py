@@ -0,0 +1,107 @@
+import random
+
+import pandas as pd
+
+from aiocoap import Message, CONTENT, NOT_FOUND, ACK, CON, NON
+from aiocoap.optiontypes import BlockOption
+
+from utils import header_handling, workflow_handling
+
+################################################################################################
+
+# random_messages()
+#   hex strings of CoAP responses: with/without token, options, Block2, payload + truncated/garbage ones
+#   (a set with the positions of the complete messages is returned too)
+def random_messages(n_messages=2000, seed=1):
+
+    rng = random.Random(seed)
+
+    messages = []
+    complete = set()
+
+    for i in range(n_messages):
+
+        message = Message(
+            mtype=rng.choice([ACK, CON, NON]),
+            code=rng.choice([CONTENT, NOT_FOUND]),
+            mid=rng.randrange(65536),
+            token=bytes(rng.randrange(256) for _ in range(rng.randrange(9)))
+        )
+
+        if rng.random() < 0.6:
+            message.payload = rng.choice([b'</a>;obs,</b>', b'hello', b'{"a": 1}', bytes(rng.randrange(256) for _ in range(rng.randrange(1, 40)))])
+
+        if rng.random() < 0.4:
+            message.opt.content_format = rng.choice([0, 40, 50])
+            if rng.random() < 0.3:
+                message.opt.block2 = BlockOption.BlockwiseTuple(0, True, 2)
+            if rng.random() < 0.3:
+                message.opt.uri_path = ('x' * rng.randrange(30),)
+
+        hex_string = message.encode().hex()
+
+        # captured partially
+        if rng.random() < 0.1:
+            hex_string = hex_string[:2 * rng.randrange(len(hex_string) // 2 + 1)]
+        else:
+            complete.add(i)
+
+        messages.append(hex_string)
+
+    return messages + [None, 'not hex', ''], complete
+
+def aiocoap_decode(hex_string):
+
+    try:
+        return Message.decode(bytes.fromhex(hex_string))
+    except Exception:
+        return None
+
+################################################################################################
+
+# valid messages: same header fields of aiocoap
+#   (not valid -> decoded by aiocoap, see workflow_handling.decode_slice(): it accepts some malformed messages)
+def test_headers_match_aiocoap():
+
+    messages, complete = random_messages()
+
+    headers = header_handling.parse_headers(pd.Series(messages, dtype=object))
+
+    assert all(headers['valid'][i] for i in complete)
+
+    for i, hex_string in enumerate(messages):
+
+        if not headers['valid'][i]:
+            continue
+
+        message = aiocoap_decode(hex_string)
+
+        assert message is not None, hex_string
+
+        assert headers['version'][i] == message.version
+        assert headers['mtype'][i] == message.mtype
+        assert headers['code'][i] == message.code
+        assert headers['mid'][i] == message.mid
+        assert headers['token_length'][i] == len(message.token)
+        assert headers['payload_length'][i] == len(message.payload)
+        assert bool(headers['has_options'][i]) == bool(list(message.opt.option_list()))
+        assert bool(headers['has_block2'][i]) == (message.opt.block2 is not None)
+
+def test_decode_row_matches_decode_data():
+
+    messages, _ = random_messages()
+
+    headers = header_handling.parse_headers(pd.Series(messages, dtype=object))
+
+    fast_rows = [i for i in range(len(messages)) if headers['valid'][i] and not headers['has_options'][i]]
+
+    assert fast_rows
+
+    for i in fast_rows:
+
+        expected = workflow_handling.decode_data(messages[i], '/.well-known/core')
+        decoded = header_handling.decode_row(headers, i, '/.well-known/core')
+
+        for field, value in decoded.items():
+            if field != 'data_format':
+                assert value == expected[field], (field, messages[i])
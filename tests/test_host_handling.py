@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from utils import host_handling, network_handling
+
+################################################################################################
+
+# drain()
+#   every item handed out by the scheduler, each host slot given back right away
+async def drain(scheduler):
+
+    items = []
+
+    while (item := await scheduler.next()) is not None:
+        items.append(item)
+        scheduler.release(item[0])
+
+    return items
+
+################################################################################################
+
+def test_round_robin_across_hosts():
+
+    producer = [('10.0.0.1', '/a'), ('10.0.0.1', '/b'), ('10.0.0.1', '/c'), ('10.0.1.1', '/a'), ('10.0.1.1', '/b')]
+
+    items = asyncio.run(drain(host_handling.FairScheduler(producer)))
+
+    assert [ip for ip, _ in items] == ['10.0.0.1', '10.0.1.1', '10.0.0.1', '10.0.1.1', '10.0.0.1']
+
+def test_in_flight_limit():
+
+    async def scenario():
+
+        scheduler = host_handling.FairScheduler([('10.0.0.1', '/a'), ('10.0.0.1', '/b')], in_flight_limit=1)
+
+        assert await scheduler.next() == ('10.0.0.1', '/a')
+
+        # the only host is busy -> nothing to hand out until its slot is given back
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.next(), timeout=0.1)
+
+        scheduler.release('10.0.0.1')
+
+        assert await scheduler.next() == ('10.0.0.1', '/b')
+
+    asyncio.run(scenario())
+
+def test_per_host_cap_writes_skipped_records():
+
+    collector = []
+
+    producer = [('10.0.0.1', f"/{i}") for i in range(5)] + [('10.0.1.1', '/a')]
+    scheduler = host_handling.FairScheduler(producer, max_requests=2, collector=collector)
+
+    items = asyncio.run(drain(scheduler))
+
+    assert sorted(items) == [('10.0.0.1', '/0'), ('10.0.0.1', '/1'), ('10.0.1.1', '/a')]
+
+    # one record per capped item, no item lost
+    assert [(record['saddr'], record['uri']) for record in collector] == [('10.0.0.1', '/2'), ('10.0.0.1', '/3'), ('10.0.0.1', '/4')]
+    assert all(record['data'].startswith('skipped: per-host cap') for record in collector)
+
+    assert scheduler.capped['10.0.0.1'] == 3
+
+def test_paced_hosts_wait_for_their_network():
+
+    # same /24, one packet every 0.2 s
+    pacer = network_handling.NetworkPacer(requests_per_second=5, burst=1)
+
+    producer = [('10.0.0.1', '/a'), ('10.0.0.2', '/a'), ('10.0.1.1', '/a')]
+    scheduler = host_handling.FairScheduler(producer, pacer=pacer)
+
+    start = time.monotonic()
+    items = asyncio.run(drain(scheduler))
+    elapsed = time.monotonic() - start
+
+    # the host of the other network is not held back by the paced one
+    assert [ip for ip, _ in items] == ['10.0.0.1', '10.0.1.1', '10.0.0.2']
+
+    assert elapsed >= 0.15
+    assert pacer.waits == 1
+    assert not scheduler.paced
+
+################################################################################################
+
+def test_breaker_opens_after_consecutive_failures():
+
+    health = host_handling.HostHealth()
+
+    health.record('10.0.0.1', 'timeout')
+    health.record('10.0.0.1', 'error')
+    assert not health.is_open('10.0.0.1')
+
+    health.record('10.0.0.1', 'error')
+    assert health.is_open('10.0.0.1')
+
+    record = health.skip('10.0.0.1', '/a')
+    assert record['data'] == 'skipped: 3 consecutive errors'
+    assert health.skipped['10.0.0.1'] == 1
+
+def test_breaker_counts_consecutive_failures_only():
+
+    health = host_handling.HostHealth()
+
+    for outcome in ['timeout', 'timeout', 'success', 'timeout', 'timeout']:
+        health.record('10.0.0.1', outcome)
+
+    assert not health.is_open('10.0.0.1')
+
+    # other hosts are not affected
+    health.record('10.0.0.2', 'timeout')
+    assert health.failures['10.0.0.2'] == 1
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from utils import ipinfo_handling
+
+################################################################################################
+
+# store
+#   persistent enrichment store in a temporary directory
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+
+    ipinfo_handling.close_store()
+
+    monkeypatch.setattr(ipinfo_handling, 'STORE_PATH', f"{tmp_path}/ipinfo/ip_info_store.sqlite")
+
+    yield ipinfo_handling.get_store()
+
+    ipinfo_handling.close_store()
+
+# fields_for()
+#   IPINFO_FIELDS values of a fake record
+def fields_for(ip_address):
+
+    return tuple(f"{field} of {ip_address}" for field in ipinfo_handling.IPINFO_FIELDS)
+
+################################################################################################
+
+def test_stored_fields_by_build(store, monkeypatch):
+
+    monkeypatch.setattr(ipinfo_handling, 'STORE_BATCH_SIZE', 2)
+
+    addresses = [f"10.0.0.{i}" for i in range(5)]
+
+    ipinfo_handling.store_fields({ip: fields_for(ip) for ip in addresses}, 1)
+    # already stored -> kept as it is
+    ipinfo_handling.store_fields({'10.0.0.0': fields_for('other')}, 1)
+
+    assert ipinfo_handling.stored_fields(addresses + ['10.0.1.1'], 1) == {ip: fields_for(ip) for ip in addresses}
+    assert ipinfo_handling.stored_fields(addresses, 2) == {}
+
+def test_enrich_looks_up_new_addresses_only(store, monkeypatch):
+
+    looked_up = []
+
+    def lookup(ip_address):
+        looked_up.append(ip_address)
+        return fields_for(ip_address)
+
+    monkeypatch.setattr(ipinfo_handling, 'build_version', lambda: 7)
+    monkeypatch.setattr(ipinfo_handling, 'lookup', lookup)
+
+    ipinfo_handling.enrich(['10.0.0.1', '10.0.0.2'])
+    looked_up.clear()
+
+    columns = ipinfo_handling.enrich(['10.0.0.2', '10.0.0.3', '10.0.0.1'])
+
+    assert looked_up == ['10.0.0.3']
+    assert columns['asn'] == ['asn of 10.0.0.2', 'asn of 10.0.0.3', 'asn of 10.0.0.1']
+
+    # reference dataset (saddr + build) -> fields read back from the store
+    reference_df = ipinfo_handling.reference_of(pd.DataFrame({'saddr': ['10.0.0.3', '10.0.9.9']}))
+    resolved_df = ipinfo_handling.resolve(reference_df)
+
+    assert list(resolved_df.columns) == ['saddr', *ipinfo_handling.IPINFO_FIELDS]
+    assert resolved_df.loc[0, 'country'] == 'country of 10.0.0.3'
+    assert pd.isna(resolved_df.loc[1, 'country'])
@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+################################################################################################
+
+# headless run: print() of a spawned worker process
+WORKER_PRINT = """
+from utils import log_handling, process_handling
+
+if __name__ == '__main__':
+    process_handling.set_worker_initializer(log_handling.init_worker, 'INFO')
+    process_handling.get_process_pool('test', 1).submit(print, 'from the worker').result()
+    process_handling.shutdown_process_pool()
+"""
+
+################################################################################################
+
+def test_worker_output_goes_to_the_log(tmp_path):
+
+    script = tmp_path / 'worker_print.py'
+    script.write_text(WORKER_PRINT)
+
+    run = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=60, env={**os.environ, 'PYTHONPATH': os.getcwd()})
+
+    assert run.returncode == 0, run.stderr
+
+    # stdout carries no plain text
+    assert run.stdout == ''
+
+    records = [json.loads(line) for line in run.stderr.splitlines()]
+
+    assert [(record['logger'], record['message']) for record in records] == [('pipeline', 'from the worker')]
@@ -0,0 +1,68 @@
+import datetime
+import os
+
+from utils import manifest_handling
+
+################################################################################################
+
+# csv_file()
+#   empty dataset at data_path/relative_path
+def csv_file(data_path, relative_path, content='saddr\n'):
+
+    path = os.path.join(data_path, relative_path)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'w') as f:
+        f.write(content)
+
+    return path
+
+################################################################################################
+
+def test_latest(data_path):
+
+    directory = os.path.join(data_path, 'get', '3')
+
+    assert manifest_handling.latest(directory) is None
+
+    for day in (2, 1):
+        manifest_handling.register(os.path.join(directory, f"2025-10-0{day}.csv"), 'get', 3, datetime.datetime(2025, 10, day))
+
+    assert manifest_handling.latest(directory) == manifest_handling.key_of(os.path.join(directory, '2025-10-02.csv'))
+
+def test_datasets_order_and_rows(data_path):
+
+    for portion in (10, 2):
+        path = os.path.join(data_path, 'discovery', 'cleaned', str(portion), 'a.csv')
+        manifest_handling.register(path, 'discovery/cleaned', portion, datetime.datetime(2025, 10, 1))
+        manifest_handling.add_rows(path, 5, 100)
+        manifest_handling.add_rows(path, 2, 140)
+
+    stage_datasets = manifest_handling.datasets('discovery/cleaned')
+
+    # numeric portions sorted as numbers
+    assert [dataset['portion'] for dataset in stage_datasets] == ['2', '10']
+    assert [(dataset['rows'], dataset['bytes']) for dataset in stage_datasets] == [(7, 140), (7, 140)]
+
+    assert [dataset['portion'] for dataset in manifest_handling.datasets('discovery/cleaned', 10)] == ['10']
+    assert manifest_handling.date_of(stage_datasets[0]['path']) == '2025-10-01'
+
+def test_backfill_registers_old_datasets_once(data_path):
+
+    csv_file(data_path, 'get/0/2025-09-01 10:00:00.000000.csv')
+    csv_file(data_path, 'get/0/2025-09-02 10:00:00.000000.csv')
+    # no date in the file name -> modification time
+    path = csv_file(data_path, 'get/1.csv')
+    os.utime(path, (datetime.datetime(2025, 9, 5, 12).timestamp(),) * 2)
+
+    stage_datasets = manifest_handling.datasets('get')
+
+    assert [(dataset['portion'], dataset['start_time'][:10]) for dataset in stage_datasets] == [('0', '2025-09-01'), ('0', '2025-09-02'), ('1', '2025-09-05')]
+    assert all(dataset['rows'] is None for dataset in stage_datasets)
+
+    # new files are not picked up by a second listing (registered by the writers instead)
+    csv_file(data_path, 'get/0/2025-09-03 10:00:00.000000.csv')
+
+    assert len(manifest_handling.datasets('get')) == 3
+    assert manifest_handling.backfill('missing') == 0
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from utils import cache_handling, network_handling
+
+################################################################################################
+
+def test_asns_are_bounded(monkeypatch):
+
+    monkeypatch.setattr(network_handling, '_asn_of', cache_handling.LRUCache('asn', 2))
+
+    network_handling.register_asns(pd.DataFrame({
+        'saddr': ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4'],
+        'asn': ['AS1', 'AS2', 'AS3', None]
+    }))
+
+    # least recently registered address dropped, address without ASN not stored
+    assert network_handling.asn_of('10.0.0.1') is None
+    assert network_handling.asn_of('10.0.0.3') == 'AS3'
+    assert network_handling.asn_of('10.0.0.4') is None
+
+    assert network_handling.network_of('10.0.0.2') == 'AS2'
+    assert network_handling.network_of('10.0.0.1') == '10.0.0.0/24'
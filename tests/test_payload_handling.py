@@ -0,0 +1,112 @@
+import json
+import random
+
+import pandas as pd
+import pytest
+
+from dateutil.parser import parse
+
+from utils import payload_handling
+
+################################################################################################
+
+# original_detect_format()
+#   detect_format() before the cheap dispatch (every parser tried in order): reference classification
+def original_detect_format(payload):
+
+    payload = str(payload)
+
+    if not payload:
+        return None
+
+    try:
+        int(payload)
+        return "int"
+    except ValueError:
+        try:
+            float(payload)
+            return "float"
+        except ValueError:
+            try:
+                complex(payload)
+                return "complex"
+            except ValueError:
+                pass
+
+    if payload.lower() in {"true", "false"}:
+        return "boolean"
+
+    try:
+        parse(payload)
+        return "datetime"
+    except Exception:
+        pass
+
+    try:
+        json.loads(payload)
+        return "json"
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    return "string"
+
+# edge cases of every dispatch rule + random strings made of the characters the rules look at
+PAYLOADS = [
+    '1', '-2', ' 3 ', '1_000', '1.5', '.5', '1e5', 'nan', 'inf', '-Infinity', '1+2j', 'j', '(1+2j)', '12j', 'jj',
+    'true', 'False', ' true', 'null', ' null', '"x"', '"2020-01-01"', '{"a":1}', '[1,2]', '{2020}', '{bad', '[bad', '"bad',
+    '2020-01-01', '2020-01-01T10:00:00Z', 'Mon, 01 Jan 2024 10:00:00 GMT', 'May', 'monday', 'Jan.', 'sept 5', '10:30',
+    '12/05/2020', 'T12:00', ',May', '-May', '/2020', "'2020'", '</a>;ct=40,</b>', '<2020>', 'hello', 'hello 5', '5 hello',
+    '', ' ', 'ab12', 'Temperature: 23.5C', "b'\\x00\\x01'", 'None', 'On', 'NaN', '0x10', '٣', '1__0', '-', '.',
+    'infinity and beyond', 'nano'
+]
+
+def random_payloads(n_payloads=5000, seed=3):
+
+    rng = random.Random(seed)
+    characters = '0123456789-+.:/ ,TZjJe<>{}[]"abcMay'
+
+    return [''.join(rng.choice(characters) for _ in range(rng.randrange(1, 8))) for _ in range(n_payloads)]
+
+################################################################################################
+
+# (dateutil warns about the tz-like letters of the random strings)
+@pytest.mark.filterwarnings('ignore::dateutil.parser.UnknownTimezoneWarning')
+def test_detect_format_matches_original():
+
+    for payload in PAYLOADS + random_payloads():
+        assert payload_handling.detect_format(payload) == original_detect_format(payload), payload
+
+def test_detect_formats_matches_detect_format():
+
+    payloads = pd.Series(PAYLOADS + [None, float('nan'), b'\x00', 5, '</a>;obs'] * 3, dtype=object)
+
+    expected = [original_detect_format(payload) for payload in payloads]
+
+    assert payload_handling.detect_formats(payloads).tolist() == expected
+
+def test_legacy_options_are_migrated():
+
+    # 'options' as stored before option_value() (str(option) of every option, JSON, CSV-escaped)
+    legacy = json.dumps({
+        'ETAG': "b'\\x124'",
+        'BLOCK2': 'BlockwiseTuple(block_number=0, more=True, size_exponent=6)',
+        'MAX_AGE': '60',
+        'URI_PATH': '123',
+        'CONTENT_FORMAT': 'LINKFORMAT'
+    }).replace('"', '""')
+
+    assert payload_handling.get_option({'options': legacy}, 'ETAG') == '0x1234'
+    assert payload_handling.get_option({'options': legacy}, 'URI_PATH') == '123'
+
+    df = payload_handling.migrate_options(pd.DataFrame({'saddr': ['10.0.0.1', '10.0.0.2'], 'options': [legacy, None]}))
+
+    assert df.loc[0, 'opt_etag'] == '0x1234'
+    assert df.loc[0, 'opt_block2'] == '0/1/6'
+    assert df.loc[0, 'opt_max_age'] == 60
+    assert df.loc[0, 'opt_content_format'] == 'LINKFORMAT'
+    assert json.loads(df.loc[0, 'opt_others']) == {'URI_PATH': '123'}
+    assert pd.isna(df.loc[1, 'opt_etag'])
+
+    # current values are left as they are
+    assert payload_handling.legacy_option_value('BLOCK2', '0/1/6') == '0/1/6'
+    assert payload_handling.legacy_option_value('ETAG', '0x1234') == '0x1234'
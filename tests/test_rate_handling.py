@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+import pytest
+
+from utils import rate_handling
+
+################################################################################################
+
+def test_burst_then_refill():
+
+    bucket = rate_handling.TokenBucket(rate=10, burst=3)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert 0 < bucket.time_to_token() <= 0.1
+
+    # tokens never exceed the burst
+    bucket.last_refill -= 10
+    assert bucket.time_to_token() == 0
+    assert bucket.tokens == 3
+
+def test_acquire_keeps_the_rate():
+
+    bucket = rate_handling.TokenBucket(rate=20, burst=1)
+
+    async def scenario():
+
+        start = time.monotonic()
+
+        await asyncio.gather(*[bucket.acquire() for _ in range(5)])
+
+        return time.monotonic() - start
+
+    # first token right away, one every 50 ms after it
+    assert asyncio.run(scenario()) == pytest.approx(0.2, abs=0.08)
+
+def test_set_rate_replaces_the_limiter(monkeypatch):
+
+    monkeypatch.setattr(rate_handling, '_rate_limiter', None)
+
+    limiter = rate_handling.set_rate(5)
+
+    assert rate_handling.get_rate_limiter() is limiter
+    assert (limiter.rate, limiter.burst) == (5, rate_handling.BURST)
@@ -0,0 +1,89 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+import aiocoap.resource as resource
+
+from aiocoap import Context, Message, CONTENT
+
+from O1_DataCollection import coap
+from utils import cache_handling, context_handling, rtt_handling, transmission_handling
+
+################################################################################################
+
+@pytest.fixture
+def fresh_rtts(monkeypatch):
+
+    monkeypatch.setattr(rtt_handling, '_prefix_rtts', cache_handling.LRUCache('rtt /24', 2))
+    monkeypatch.setattr(rtt_handling, '_asn_rtts', cache_handling.LRUCache('rtt ASN', 2))
+
+def learn(ip_address, rtt=0.05, n_samples=10):
+
+    for _ in range(n_samples):
+        rtt_handling.record_rtt(ip_address, rtt)
+
+################################################################################################
+
+def test_learned_profile_keeps_the_deadline(fresh_rtts):
+
+    profile = transmission_handling.get_profile('get')
+
+    learn('10.0.0.5')
+
+    learned = rtt_handling.adapt_profile('10.0.0.5', profile)
+
+    assert learned.name == 'get/learned'
+    assert learned.ack_timeout < profile.ack_timeout
+    # only the un-ACKed requests are given up earlier
+    assert learned.give_up < profile.deadline
+    assert learned.deadline == profile.deadline
+
+def test_networks_are_bounded(fresh_rtts):
+
+    for network in range(3):
+        learn(f"10.0.{network}.1")
+
+    assert len(rtt_handling._prefix_rtts.entries) == 2
+    assert rtt_handling.learned_rtt('10.0.0.1') is None
+    assert rtt_handling.learned_rtt('10.0.2.1') == 0.05
+
+################################################################################################
+
+# slow device: empty ACK at once (aiocoap server), separate response after the learned give-up time
+SEPARATE_RESPONSE_DELAY = 3.5
+
+class SlowResource(resource.Resource):
+
+    async def render_get(self, request):
+
+        await asyncio.sleep(SEPARATE_RESPONSE_DELAY)
+
+        return Message(code=CONTENT, payload=b'late')
+
+async def get_slow_resource(engine):
+
+    site = resource.Site()
+    site.add_resource(['slow'], SlowResource())
+
+    try:
+        server = await Context.create_server_context(site, bind=('127.0.0.1', 5683))
+    except OSError as e:
+        pytest.skip(f"CoAP port not available: {e}")
+
+    try:
+        return await coap.coap(pd.DataFrame({'saddr': ['127.0.0.1'], 'uri': ['/slow'], 'observable': [1]}), 2, engine=engine, profile=transmission_handling.get_profile('get'))
+    finally:
+        await server.shutdown()
+
+@pytest.mark.parametrize('engine', ['aiocoap', 'stateless'])
+def test_acked_request_waits_for_the_separate_response(fresh_rtts, engine):
+
+    learn('127.0.0.1')
+
+    assert rtt_handling.adapt_profile('127.0.0.1', transmission_handling.get_profile('get')).give_up < SEPARATE_RESPONSE_DELAY
+
+    responses_df = context_handling.run(get_slow_resource(engine))
+
+    assert responses_df.loc[0, 'code'] == '2.05 Content'
+    assert responses_df.loc[0, 'data'] == 'late'
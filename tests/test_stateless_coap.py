@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+import aiocoap.resource as resource
+
+from aiocoap import Context, Message, CONTENT
+
+from O1_DataCollection import coap
+from utils import context_handling
+
+################################################################################################
+
+# loopback CoAP server (both engines send to port 5683)
+SERVER_ADDRESS = '127.0.0.1'
+
+SMALL_PAYLOAD = b'22.5 C'
+# 6 blocks of 1024 B (the last one partial)
+BIG_PAYLOAD = bytes(range(256)) * 23 + b'x' * 172
+
+class StaticResource(resource.Resource):
+
+    def __init__(self, payload):
+
+        super().__init__()
+        self.payload = payload
+
+    async def render_get(self, request):
+
+        return Message(code=CONTENT, payload=self.payload)
+
+async def get_both_engines(targets_df):
+
+    site = resource.Site()
+    site.add_resource(['small'], StaticResource(SMALL_PAYLOAD))
+    site.add_resource(['big'], StaticResource(BIG_PAYLOAD))
+
+    try:
+        server = await Context.create_server_context(site, bind=(SERVER_ADDRESS, 5683))
+    except OSError as e:
+        pytest.skip(f"CoAP port not available: {e}")
+
+    try:
+        aiocoap_df = await coap.coap(targets_df, 2, engine='aiocoap')
+        stateless_df = await coap.coap(targets_df, 2, engine='stateless')
+    finally:
+        await server.shutdown()
+
+    return aiocoap_df.set_index('uri'), stateless_df.set_index('uri')
+
+################################################################################################
+
+def test_stateless_engine_matches_aiocoap():
+
+    targets_df = pd.DataFrame({
+        'saddr': [SERVER_ADDRESS] * 3,
+        'uri': ['/small', '/missing', '/big'],
+        'observable': [1] * 3
+    })
+
+    aiocoap_df, stateless_df = context_handling.run(get_both_engines(targets_df))
+
+    # single datagram responses: same record
+    for uri in ['/small', '/missing']:
+        for column in ['code', 'mtype', 'options', 'data', 'data_format', 'data_length', 'observable', 'user_inserted', 'truncated']:
+            aiocoap_value, stateless_value = aiocoap_df.loc[uri, column], stateless_df.loc[uri, column]
+            assert (pd.isna(aiocoap_value) and pd.isna(stateless_value)) or aiocoap_value == stateless_value, (uri, column)
+
+    assert aiocoap_df.loc['/small', 'code'] == '2.05 Content'
+    assert aiocoap_df.loc['/missing', 'code'] == '4.04 Not Found'
+
+    # blockwise resource: reassembled by the aiocoap engine, first block only (flagged) by the stateless one
+    assert aiocoap_df.loc['/big', 'data_length'] == len(BIG_PAYLOAD)
+    assert not aiocoap_df.loc['/big', 'truncated']
+
+    assert stateless_df.loc['/big', 'code'] == '2.05 Content'
+    assert stateless_df.loc['/big', 'data_length'] == 1024
+    assert stateless_df.loc['/big', 'truncated']
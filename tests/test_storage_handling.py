@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import manifest_handling, storage_handling
+
+pytest.importorskip('pyarrow')
+
+################################################################################################
+
+def new_dataset(data_path):
+
+    os.makedirs(f"{data_path}get", exist_ok=True)
+
+    path = f"{data_path}get/3.csv"
+    open(path, 'w').close()
+
+    manifest_handling.register(path, 'get', 3, '2025-10-01 10:00:00')
+
+    return path
+
+# get_chunk()
+#   chunk shaped like the GET results: mixed object columns, empty columns filled later, nullable ints
+def get_chunk(i, n_rows=1000):
+
+    rng = np.random.default_rng(i)
+
+    return pd.DataFrame({
+        'saddr': [f"10.0.{i}.{j % 256}" for j in range(n_rows)],
+        'code': rng.choice(['2.05 Content', '4.04 Not Found', None], n_rows),
+        'data': [b'\xff' if j % 7 == 0 else ('x' * (j % 50) if j % 3 else None) for j in range(n_rows)],
+        'data_length': rng.integers(0, 100, n_rows),
+        'opt_observe': pd.array([None] * n_rows if i < 3 else list(range(n_rows)), dtype='Int64'),
+        'opt_others': [None] * n_rows if i < 5 else ['{"a": 1}'] * n_rows,
+    })
+
+def read_all(csv_path, columns, filters=None):
+
+    return pd.concat(storage_handling.read_chunks(csv_path, columns, 1000, filters=filters), ignore_index=True)
+
+def read_csv_only(csv_path, columns, filters, monkeypatch):
+
+    with monkeypatch.context() as patch:
+        patch.setattr(storage_handling, 'pa', None)
+        return read_all(csv_path, columns, filters)
+
+################################################################################################
+
+def test_csv_is_the_default_output_format():
+
+    assert storage_handling.OUTPUT_FORMATS == ['csv']
+
+def test_parquet_and_csv_reads_match(data_path, monkeypatch):
+
+    monkeypatch.setattr(storage_handling, 'OUTPUT_FORMATS', ['csv', 'parquet'])
+    monkeypatch.setattr(storage_handling, 'ROW_GROUP_SIZE', 2500)
+
+    csv_path = new_dataset(data_path)
+
+    for i in range(10):
+        storage_handling.append(get_chunk(i), csv_path, i == 0)
+
+    storage_handling.close()
+
+    assert storage_handling.mirror_complete(csv_path)
+
+    filters = [('code', '==', '2.05 Content')]
+
+    parquet_df = read_all(csv_path, ['saddr', 'data_length', 'code'], filters)
+    csv_df = read_csv_only(csv_path, ['saddr', 'data_length', 'code'], filters, monkeypatch)
+
+    assert len(parquet_df) == len(csv_df) > 0
+    assert (parquet_df.values == csv_df.values).all()
+
+def test_unfinalized_mirror_is_not_read(data_path, monkeypatch):
+
+    monkeypatch.setattr(storage_handling, 'OUTPUT_FORMATS', ['csv', 'parquet'])
+    monkeypatch.setattr(storage_handling, 'ROW_GROUP_SIZE', 2500)
+
+    csv_path = new_dataset(data_path)
+
+    for i in range(3):
+        storage_handling.append(get_chunk(i), csv_path, i == 0)
+
+    # one row group already written, the rest still buffered
+    assert storage_handling.parquet_files_of(storage_handling.parquet_path_of(csv_path))
+    assert not storage_handling.mirror_complete(csv_path)
+
+    assert len(read_all(csv_path, ['saddr'])) == 3000
+
+def test_mirror_extended_by_a_later_run(data_path, monkeypatch):
+
+    monkeypatch.setattr(storage_handling, 'OUTPUT_FORMATS', ['csv', 'parquet'])
+
+    csv_path = new_dataset(data_path)
+
+    storage_handling.append(get_chunk(0), csv_path, True)
+    storage_handling.close()
+
+    storage_handling.append(get_chunk(1), csv_path, False)
+    assert not storage_handling.mirror_complete(csv_path)
+
+    storage_handling.close()
+    assert storage_handling.mirror_complete(csv_path)
+
+    assert read_all(csv_path, ['saddr'])['saddr'].tolist() == read_csv_only(csv_path, ['saddr'], None, monkeypatch)['saddr'].tolist()
+
+def test_rows_written_as_csv_only_disable_the_mirror(data_path, monkeypatch):
+
+    monkeypatch.setattr(storage_handling, 'OUTPUT_FORMATS', ['csv', 'parquet'])
+
+    csv_path = new_dataset(data_path)
+
+    storage_handling.append(get_chunk(0), csv_path, True)
+    storage_handling.close()
+
+    monkeypatch.setattr(storage_handling, 'OUTPUT_FORMATS', ['csv'])
+    storage_handling.append(get_chunk(1), csv_path, False)
+
+    assert not storage_handling.mirror_complete(csv_path)
+    assert len(read_all(csv_path, ['saddr'])) == 2000
@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from O1_DataCollection import zmap
+from utils import manifest_handling
+
+################################################################################################
+
+# raw_zmap_files()
+#   ZMap-like raw outputs: 3 files sharing part of their addresses (same address seen by several scans)
+def raw_zmap_files(raw_path):
+
+    os.makedirs(raw_path, exist_ok=True)
+
+    for file_id in range(3):
+
+        addresses = [f"10.{file_id % 2}.{i // 250}.{i % 250}" for i in range(2000)]
+
+        pd.DataFrame({
+            'saddr': addresses,
+            'success': [1] * len(addresses),
+            'data': [f"{file_id:02x}" * 4] * len(addresses)
+        }).to_csv(f"{raw_path}zmap_{file_id}.csv", index=False)
+
+def balance(data_path, monkeypatch, n_portions, chunk_size):
+
+    monkeypatch.setattr(zmap, 'RAW_PATH', f"{data_path}discovery/csv/")
+    monkeypatch.setattr(zmap, 'PORTIONS_PATH', f"{data_path}discovery/portions/")
+    monkeypatch.setattr(zmap, 'LEGACY_PORTIONS_PATH', f"{data_path}discovery/legacy_portions/")
+    monkeypatch.setattr(zmap, 'BALANCE_CHUNK_SIZE', chunk_size)
+
+    rows_per_portion = zmap.balance_zmap_datasets(n_portions)
+
+    portions = {i: pd.read_csv(f"{data_path}discovery/portions/{i}.csv") for i in range(n_portions)}
+
+    return rows_per_portion, portions
+
+################################################################################################
+
+def test_balance_partitions_by_address(data_path, monkeypatch):
+
+    raw_zmap_files(f"{data_path}discovery/csv/")
+
+    rows_per_portion, portions = balance(data_path, monkeypatch, 7, 700)
+
+    assert sum(rows_per_portion) == 6000
+    assert [len(portions[i]) for i in range(7)] == rows_per_portion
+
+    # every address (and all its duplicates) in a single portion, the one given by portion_of()
+    for portion_id, portion in portions.items():
+        assert (zmap.portion_of(portion['saddr'], 7) == portion_id).all()
+
+    addresses = pd.concat([portion[['saddr']].drop_duplicates().assign(portion=i) for i, portion in portions.items()])
+    assert not addresses['saddr'].duplicated().any()
+
+    # run manifest
+    registered = manifest_handling.datasets('discovery/portions')
+    assert [dataset['rows'] for dataset in registered] == rows_per_portion
+
+def test_legacy_portions_are_moved_out(data_path, monkeypatch):
+
+    raw_zmap_files(f"{data_path}discovery/csv/")
+
+    # portions of the former in-place balancer (copies of the raw rows)
+    _, portions = balance(data_path, monkeypatch, 7, 700)
+    for i, portion in portions.items():
+        portion.to_csv(f"{data_path}discovery/csv/{i}.csv", index=False)
+
+    rows_per_portion, _ = balance(data_path, monkeypatch, 7, 700)
+
+    assert sum(rows_per_portion) == 6000
+    assert sorted(os.listdir(f"{data_path}discovery/csv/")) == ['zmap_0.csv', 'zmap_1.csv', 'zmap_2.csv']
+    assert len(os.listdir(f"{data_path}discovery/legacy_portions/")) == 7
+
+def test_balance_is_stable(data_path, monkeypatch):
+
+    raw_zmap_files(f"{data_path}discovery/csv/")
+
+    _, first = balance(data_path, monkeypatch, 5, 700)
+    # different chunking, previous portions replaced
+    _, second = balance(data_path, monkeypatch, 5, 4000)
+
+    for i in range(5):
+        pd.testing.assert_frame_equal(first[i], second[i])
+
+    assert len(manifest_handling.datasets('discovery/portions')) == 5
+
+def test_portion_of_is_stable_across_processes():
+
+    addresses = pd.Series([f"192.168.{i // 256}.{i % 256}" for i in range(1000)])
+
+    # another interpreter (new hash seed)
+    output = subprocess.run(
+        [sys.executable, '-c', (
+            "import pandas as pd\n"
+            "from O1_DataCollection import zmap\n"
+            "addresses = pd.Series([f'192.168.{i // 256}.{i % 256}' for i in range(1000)])\n"
+            "print(','.join(map(str, zmap.portion_of(addresses, 7))))"
+        )],
+        capture_output=True, text=True, check=True, env={**os.environ, 'PYTHONHASHSEED': 'random'}
+    ).stdout.strip().splitlines()[-1]
+
+    assert output == ','.join(map(str, zmap.portion_of(addresses, 7)))
@@ -0,0 +1,110 @@
+import socket
+
+import numpy as np
+
+################################################################################################
+
+# addresses kept in a sorted uint32 array (4 bytes per address, 10M addresses -> 40 MB):
+#   the new addresses go to a small sorted buffer, merged into the main array when it grows
+#   past MERGE_FRACTION of it (amortized O(log n) lookups and inserts, vectorized over the chunk)
+#   NB: the text -> uint32 parsing (ipv4_to_int()) is still one inet_aton() call per address
+MIN_BUFFER_SIZE = 2**16
+MERGE_FRACTION = 1 / 8
+
+################################################################################################
+
+# ipv4_to_int()
+#   I: IPv4 addresses (iterable of strings)
+#   O: uint32 addresses, valid flag (False for NaN, IPv6, malformed, ...)
+#   (same parsing of ipinfo_handling.lookup())
+def ipv4_to_int(ip_addresses):
+
+    addresses = []
+    valid = []
+
+    for ip_address in ip_addresses:
+        try:
+            addresses.append(int.from_bytes(socket.inet_aton(ip_address), 'big'))
+            valid.append(True)
+        except (OSError, TypeError):
+            addresses.append(0)
+            valid.append(False)
+
+    return np.array(addresses, dtype=np.uint32), np.array(valid, dtype=bool)
+
+################################################################################################
+
+# AddressSet
+#   compact set of IPv4 addresses (see above)
+class AddressSet:
+
+    def __init__(self, addresses=None):
+
+        self.main = np.array([], dtype=np.uint32) if addresses is None else np.unique(np.asarray(addresses, dtype=np.uint32))
+        self.buffer = np.array([], dtype=np.uint32)
+
+    def __len__(self):
+
+        return len(self.main) + len(self.buffer)
+
+    def memory_bytes(self):
+
+        return self.main.nbytes + self.buffer.nbytes
+
+    def merge(self):
+
+        if len(self.buffer):
+            self.main = np.union1d(self.main, self.buffer).astype(np.uint32)
+            self.buffer = np.array([], dtype=np.uint32)
+
+    def contains_int(self, addresses):
+
+        found = np.zeros(len(addresses), dtype=bool)
+
+        for array in (self.main, self.buffer):
+            if len(array):
+                positions = np.minimum(np.searchsorted(array, addresses), len(array) - 1)
+                found |= array[positions] == addresses
+
+        return found
+
+    # contains()
+    #   O: membership flag of every address (invalid addresses -> False)
+    def contains(self, ip_series):
+
+        addresses, valid = ipv4_to_int(ip_series)
+
+        return valid & self.contains_int(addresses)
+
+    # add_new()
+    #   it adds the addresses to the set
+    #   O: True for the addresses seen for the first time (first occurrence only if repeated in ip_series)
+    #      invalid addresses are always True (they are left to the caller)
+    def add_new(self, ip_series):
+
+        addresses, valid = ipv4_to_int(ip_series)
+
+        new = ~valid
+
+        # first occurrence of every valid address
+        unique_addresses, first_rows = np.unique(addresses[valid], return_index=True)
+        first_rows = np.flatnonzero(valid)[first_rows]
+
+        unseen = ~self.contains_int(unique_addresses)
+
+        new[first_rows[unseen]] = True
+
+        # sorted insertion (the new addresses are sorted and not in the buffer)
+        unseen_addresses = unique_addresses[unseen]
+        self.buffer = np.insert(self.buffer, np.searchsorted(self.buffer, unseen_addresses), unseen_addresses)
+
+        if len(self.buffer) > max(MIN_BUFFER_SIZE, len(self.main) * MERGE_FRACTION):
+            self.merge()
+
+        return new
+
+    def report(self):
+
+        print("\tAddress seen-set")
+        print(f"\t\taddresses - {len(self)}")
+        print(f"\t\tmemory - {round(self.memory_bytes() / 2**20, 2)} MB")
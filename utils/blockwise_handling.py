@@ -0,0 +1,201 @@
+import asyncio
+import math
+import time
+
+from aiocoap import *
+from aiocoap.optiontypes import BlockOption
+
+from utils import rate_handling, context_handling
+
+################################################################################################
+
+# Block2 retrieval (RFC 7959)
+#   - the first request is a plain GET: Block2 is only used once the response shows the resource is blockwise
+#     (the block size chosen by the server is kept for the following blocks)
+#     NB: no up-front Block2 SZX 6 + Size2 negotiation: most resources are not blockwise and some constrained
+#     servers reject or mishandle a Block2 option they do not expect (4.02 Bad Option) -> a blockwise response
+#     costs no extra round trip (its block 0 is the answer to the plain GET), only the server block size is used
+#   - the remaining blocks are requested in parallel and reassembled in order
+#   - aiocoap lets a single context exchange one message at a time with a given host (NSTART = 1, the others wait
+#     in a backlog) -> every block in flight is sent from a different shared client context (= different endpoint)
+#   - blocks refused by the other contexts are requested again, in order, from the context of the first block
+#   NB: if something goes wrong (block error, ETag changed, too many blocks) the first block is returned as is
+
+# max number of block requests in flight for the same resource (bounded by the number of shared contexts)
+PIPELINE_DEPTH = 4
+
+# max number of blocks of a single resource (64 KiB with 1024 B blocks)
+MAX_BLOCKS = 64
+
+################################################################################################
+
+def first_request(uri_to_check, profile, must_test_obs=False):
+
+    if must_test_obs:
+        return Message(code=GET, uri=uri_to_check, observe=0, transport_tuning=profile.tuning)
+
+    return Message(code=GET, uri=uri_to_check, transport_tuning=profile.tuning)
+
+# block_request()
+#   request of one of the following blocks (observe is only registered with the first one, RFC 7959 section 2.6)
+def block_request(uri_to_check, block_number, szx, profile):
+
+    request = Message(code=GET, uri=uri_to_check, transport_tuning=profile.tuning)
+    request.opt.block2 = BlockOption.BlockwiseTuple(block_number, False, szx)
+
+    return request
+
+################################################################################################
+
+def exchange(context, request, profile):
+
+    return asyncio.wait_for(context.request(request, handle_blockwise=False).response, timeout=profile.deadline)
+
+async def request_block(context, request, profile):
+
+    # rate limiting (process-wide token bucket): every block is a packet
+    await rate_handling.acquire()
+
+    return await exchange(context, request, profile)
+
+################################################################################################
+
+# valid_block()
+#   True if response is block block_number of the same representation of first
+def valid_block(response, block_number, first):
+
+    return (response.code.is_successful() and response.opt.block2 is not None
+            and response.opt.block2.block_number == block_number
+            and response.opt.etag == first.opt.etag)
+
+################################################################################################
+
+# fetch()
+#   it performs a GET of uri_to_check and returns the (reassembled) response message and the RTT
+#   of the first request/response exchange (token bucket wait and following blocks excluded)
+#   the exceptions of the first request (timeout, network errors, ...) are propagated
+async def fetch(context, uri_to_check, profile, must_test_obs=False):
+
+    await rate_handling.acquire()
+
+    sent_at = time.monotonic()
+    first = await exchange(context, first_request(uri_to_check, profile, must_test_obs), profile)
+    rtt = time.monotonic() - sent_at
+
+    block2 = first.opt.block2
+
+    # not a blockwise transfer (or single block)
+    if block2 is None or not block2.more or block2.block_number != 0:
+        return first, rtt
+
+    # block size chosen by the server
+    szx = block2.size_exponent
+    block_size = 2 ** (szx + 4)
+
+    blocks = {0: first.payload}
+
+    # last block number (None = unknown until a block with more=False arrives)
+    last = None
+    if first.opt.size2:
+        last = math.ceil(first.opt.size2 / block_size) - 1
+
+    if last is not None and last >= MAX_BLOCKS:
+        return first, rtt
+
+    # one context per block in flight (a context is given back as soon as its block is received)
+    #   NB: callers send one request at a time to a host (host_handling.HOST_IN_FLIGHT, enforced by the
+    #   FairScheduler for coap.get and by the per-host slots of workflow_handling.refetch)
+    #   -> no block waits in the backlog of a context
+    free_contexts = list(await context_handling.get_context_pool())
+    depth = min(PIPELINE_DEPTH, len(free_contexts))
+
+    tasks = {}
+    next_block = 1
+    failed = False
+
+    # total size unknown -> blocks requested speculatively: an error response marks the end (blocks >= limit not requested)
+    limit = MAX_BLOCKS
+
+    try:
+
+        while not failed:
+
+            # keep the pipeline full
+            while len(tasks) < depth and next_block < limit and (last is None or next_block <= last):
+
+                block_context = free_contexts.pop()
+                request = block_request(uri_to_check, next_block, szx, profile)
+                tasks[asyncio.create_task(request_block(block_context, request, profile))] = (next_block, block_context)
+
+                next_block += 1
+
+            if not tasks:
+                break
+
+            finished, _ = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+
+            for task in finished:
+
+                block_number, block_context = tasks.pop(task)
+                free_contexts.append(block_context)
+
+                # block beyond the end (speculative request)
+                if (last is not None and block_number > last) or block_number >= limit:
+                    continue
+
+                try:
+                    response = task.result()
+                except Exception:
+                    failed = True
+                    break
+
+                # speculative request beyond the end (ex. 4.00 Bad Request, 4.02 Bad Option)
+                if last is None and not response.code.is_successful():
+                    limit = block_number
+                    continue
+
+                if not valid_block(response, block_number, first):
+                    failed = True
+                    break
+
+                blocks[block_number] = response.payload
+
+                if not response.opt.block2.more:
+                    last = block_number
+
+    finally:
+
+        for task in tasks:
+            task.cancel()
+
+    # missing blocks (ex. servers keeping the blockwise state per endpoint answer 4.08 to the other contexts)
+    #   -> they are requested one at a time from the context of the first block
+    block_number = 1
+
+    while last is None or block_number <= last:
+
+        if block_number >= MAX_BLOCKS:
+            return first, rtt
+
+        if block_number not in blocks:
+
+            try:
+                response = await request_block(context, block_request(uri_to_check, block_number, szx, profile), profile)
+            except Exception:
+                return first, rtt
+
+            if not valid_block(response, block_number, first):
+                return first, rtt
+
+            blocks[block_number] = response.payload
+
+            if not response.opt.block2.more:
+                last = block_number
+
+        block_number += 1
+
+    # reassembled response: first block metadata + whole payload
+    response = first.copy(payload=b''.join(blocks[block_number] for block_number in range(last + 1)))
+    response.opt.block2 = None
+
+    return response, rtt
@@ -0,0 +1,195 @@
+import copy
+import functools
+import hashlib
+
+from collections import OrderedDict
+
+################################################################################################
+
+# max number of entries of every cache
+CACHE_SIZE = 100000
+
+# payloads longer than this are keyed by their digest (bounded key size)
+MAX_RAW_KEY_LENGTH = 64
+
+# values a result can hold and still be returned as a shallow copy (see copier_of())
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+################################################################################################
+
+# LRUCache
+#   bounded least-recently-used cache with hit/miss counters
+class LRUCache:
+
+    def __init__(self, name, maxsize=CACHE_SIZE):
+
+        self.name = name
+        self.maxsize = maxsize
+
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    # lookup()
+    #   O: (True, value) on hit, (False, None) on miss
+    def lookup(self, key):
+
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return False, None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return True, value
+
+    def store(self, key, value):
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+
+        self.entries.clear()
+
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+
+        lookups = self.hits + self.misses
+        hit_rate = round(self.hits / lookups * 100, 2) if lookups else 0
+
+        print(f"\t\t{self.name} - {self.hits} hits, {self.misses} misses ({hit_rate}%), {len(self.entries)} entries")
+
+################################################################################################
+
+# name -> cache (every cache created by memoize())
+_caches = {}
+
+# key_of()
+#   content key of a payload (str/bytes): the payload itself if short, its BLAKE2b digest otherwise
+#   (None for any other type: not worth caching)
+def key_of(payload):
+
+    if isinstance(payload, str):
+        if len(payload) <= MAX_RAW_KEY_LENGTH:
+            return payload
+        return hashlib.blake2b(payload.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    if isinstance(payload, (bytes, bytearray)):
+        if len(payload) <= MAX_RAW_KEY_LENGTH:
+            return bytes(payload)
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    return None
+
+# copier_of()
+#   how a cached result is handed out, so that the callers can modify it (and its nested values) freely:
+#   flat lists/dicts -> shallow copy, nested ones -> deep copy, anything else -> as it is (None)
+def copier_of(value):
+
+    if not isinstance(value, (list, dict)):
+        return None
+
+    items = value.values() if isinstance(value, dict) else value
+
+    if all(isinstance(item, IMMUTABLE_TYPES) for item in items):
+        return copy.copy
+
+    return copy.deepcopy
+
+# memoize()
+#   decorator: results cached by the type and content of the first argument (payload) + the other arguments
+#   (a str and its UTF-8 bytes have the same digest)
+#   mutable results (lists, dicts) are copied (first call included), see copier_of()
+def memoize(name, maxsize=CACHE_SIZE):
+
+    def decorator(function):
+
+        cache = LRUCache(name, maxsize)
+        _caches[name] = cache
+
+        @functools.wraps(function)
+        def wrapper(payload, *args):
+
+            payload_key = key_of(payload)
+
+            # not a str/bytes payload -> no caching
+            if payload_key is None:
+                return function(payload, *args)
+
+            key = (type(payload), payload_key, args)
+
+            found, entry = cache.lookup(key)
+
+            if not found:
+                value = function(payload, *args)
+                entry = (value, copier_of(value))
+                cache.store(key, entry)
+
+            value, copier = entry
+
+            if copier is None:
+                return value
+
+            return copier(value)
+
+        wrapper.cache = cache
+
+        return wrapper
+
+    return decorator
+
+################################################################################################
+
+# counters()
+#   name -> (hits, misses) of every cache of the current process
+def counters():
+
+    return {name: (cache.hits, cache.misses) for name, cache in _caches.items()}
+
+def counters_since(previous):
+
+    return {
+        name: (hits - previous.get(name, (0, 0))[0], misses - previous.get(name, (0, 0))[1])
+        for name, (hits, misses) in counters().items()
+    }
+
+# hits/misses of the caches of the worker processes (see workflow_handling.decode_slice_in_worker())
+_worker_counters = {}
+
+def add_worker_counters(worker_counters):
+
+    for name, (hits, misses) in worker_counters.items():
+        total_hits, total_misses = _worker_counters.get(name, (0, 0))
+        _worker_counters[name] = (total_hits + hits, total_misses + misses)
+
+def report():
+
+    print("\tPayload caches (current process)")
+
+    for cache in _caches.values():
+        cache.report()
+
+    if _worker_counters:
+
+        print("\tPayload caches (worker processes)")
+
+        for name, (hits, misses) in _worker_counters.items():
+            lookups = hits + misses
+            hit_rate = round(hits / lookups * 100, 2) if lookups else 0
+            print(f"\t\t{name} - {hits} hits, {misses} misses ({hit_rate}%)")
+
+def clear():
+
+    for cache in _caches.values():
+        cache.clear()
+
+    _worker_counters.clear()
@@ -0,0 +1,157 @@
+import asyncio
+import time
+
+import aiocoap.error
+
+################################################################################################
+
+# in-flight window bounds (replacing the hard-coded NUM_WORKERS = 15)
+MIN_WINDOW = 5
+INITIAL_WINDOW = 15
+MAX_WINDOW = 150
+
+# a response is considered "healthy" if it arrives before the first retransmission
+HEALTHY_RTT = 2.0
+
+# multiplicative decrease factor and minimum time between two decreases
+#   (a batch of dead hosts times out all at once: it must count as a single congestion event)
+DECREASE_FACTOR = 0.5
+DECREASE_INTERVAL = 5.0
+
+# failures telling something about the host/network (ICMP unreachable, retransmissions exhausted, ...)
+#   aiocoap.error.ConRetransmitsExceeded, RequestTimedOut, ResolutionError, ... are NetworkErrors
+NETWORK_ERRORS = (aiocoap.error.NetworkError, OSError)
+
+################################################################################################
+
+# AIMDController
+#   adaptive limit on the number of in-flight CoAP requests
+#   - additive increase: +1 window every 'window' healthy responses (= +1 per round trip)
+#   - multiplicative decrease: window * DECREASE_FACTOR on timeouts/ICMP errors
+class AIMDController:
+
+    def __init__(self, initial=INITIAL_WINDOW, minimum=MIN_WINDOW, maximum=MAX_WINDOW):
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = float(min(max(initial, minimum), maximum))
+
+        self.in_flight = 0
+        self.condition = None
+
+        self.last_decrease = 0
+
+        # telemetry
+        self.started = time.monotonic()
+        self.history = [(0.0, int(self.window))]
+        self.outcomes = {'success': 0, 'timeout': 0, 'error': 0}
+        self.increases = 0
+        self.decreases = 0
+
+    def get_condition(self):
+
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+
+        return self.condition
+
+    async def acquire(self):
+
+        condition = self.get_condition()
+
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.window))
+            self.in_flight += 1
+
+    # cancel()
+    #   it gives back a slot that was not used to send a request (no effect on the window)
+    async def cancel(self):
+
+        condition = self.get_condition()
+
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    # release()
+    #   rtt: network RTT of the first request/response exchange (None if unknown -> the window is not increased)
+    #   NB: the rate limiter wait and the following blocks are not part of it, the window reacts to the network only
+    async def release(self, outcome, rtt):
+
+        condition = self.get_condition()
+
+        async with condition:
+
+            self.in_flight -= 1
+            self.outcomes[outcome] += 1
+
+            previous = int(self.window)
+
+            if outcome == 'success':
+
+                if rtt is not None and rtt <= HEALTHY_RTT:
+                    self.window = min(self.maximum, self.window + 1 / self.window)
+
+            else:
+
+                now = time.monotonic()
+
+                if now - self.last_decrease >= DECREASE_INTERVAL:
+                    self.window = max(self.minimum, self.window * DECREASE_FACTOR)
+                    self.last_decrease = now
+
+            if int(self.window) != previous:
+
+                if int(self.window) > previous:
+                    self.increases += 1
+                else:
+                    self.decreases += 1
+
+                self.history.append((round(time.monotonic() - self.started, 3), int(self.window)))
+
+            condition.notify_all()
+
+    def telemetry(self):
+
+        windows = [window for _, window in self.history]
+
+        return {
+            'final_window': int(self.window),
+            'min_window': min(windows),
+            'max_window': max(windows),
+            'increases': self.increases,
+            'decreases': self.decreases,
+            **self.outcomes
+        }
+
+    def report(self):
+
+        print("\tConcurrency window telemetry")
+        for key, value in self.telemetry().items():
+            print(f"\t\t{key} - {value}")
+
+################################################################################################
+
+# classify_result()
+#   it maps a result record (see coap.get()) into the outcome used by the controller and the host breaker
+#   'local': the request failed on this side (URI build, response parsing, ...) -> neither the controller
+#   nor the breaker must react to it
+def classify_result(result):
+
+    if result['code'] is not None:
+        return 'success'
+
+    if isinstance(result['data'], str):
+
+        if result['data'] == 'timeout':
+            return 'timeout'
+
+        # RST from the host (see stateless_coap)
+        if result['data'] == 'reset':
+            return 'error'
+
+    # ICMP unreachable, network errors, ...
+    if isinstance(result['data'], NETWORK_ERRORS):
+        return 'error'
+
+    return 'local'
@@ -0,0 +1,101 @@
+import asyncio
+import atexit
+
+from aiocoap import *
+
+################################################################################################
+
+# number of client contexts (= UDP sockets + aiocoap stacks) shared by the whole worker fleet
+CONTEXT_POOL_SIZE = 3
+
+################################################################################################
+
+# aiocoap contexts are bound to the event loop they are created in:
+#   asyncio.run() builds a brand new loop on every call (= every chunk), so a single long-lived
+#   runner is kept for the whole process and every stage/chunk runs on top of it
+_runner = None
+
+# shared client contexts (created once, reused by every worker, chunk and operation type)
+_contexts = []
+_contexts_lock = None
+
+################################################################################################
+
+# run()
+#   drop-in replacement of asyncio.run() that keeps the same event loop alive between calls
+def run(coroutine):
+
+    global _runner
+
+    if _runner is None:
+        _runner = asyncio.Runner()
+
+    return _runner.run(coroutine)
+
+################################################################################################
+
+# get_context_pool()
+#   it returns the shared client contexts, creating them the first time they are needed
+#   NB: the context is ready as soon as create_client_context() returns (socket bound) -> no warm-up sleep
+async def get_context_pool():
+
+    global _contexts, _contexts_lock
+
+    if _contexts_lock is None:
+        _contexts_lock = asyncio.Lock()
+
+    async with _contexts_lock:
+
+        if not _contexts:
+
+            print(f"\tCreating {CONTEXT_POOL_SIZE} shared CoAP client context(s)")
+
+            _contexts = list(await asyncio.gather(
+                *[Context.create_client_context() for _ in range(CONTEXT_POOL_SIZE)]
+            ))
+
+    return _contexts
+
+################################################################################################
+
+# get_context()
+#   it returns one of the shared contexts (round-robin on the given index, ex. worker id)
+async def get_context(index=0):
+
+    contexts = await get_context_pool()
+
+    return contexts[index % len(contexts)]
+
+################################################################################################
+
+async def shutdown_contexts():
+
+    global _contexts
+
+    for context in _contexts:
+        await context.shutdown()
+
+    _contexts = []
+
+################################################################################################
+
+# shutdown()
+#   it closes the shared contexts and the long-lived event loop (once, at the end of the process)
+def shutdown():
+
+    global _runner, _contexts_lock
+
+    if _runner is None:
+        return
+
+    if _contexts:
+        _runner.run(shutdown_contexts())
+
+    _runner.close()
+
+    _runner = None
+    _contexts_lock = None
+
+
+# safety net: release sockets even if the caller forgets to do it
+atexit.register(shutdown)
@@ -0,0 +1,204 @@
+import numpy as np
+
+from aiocoap.numbers.codes import Code
+from aiocoap.numbers.types import Type
+
+################################################################################################
+
+# Batch CoAP header parser (RFC 7252 section 3)
+#   the ZMap 'data' column (hex strings) of a whole chunk is parsed in one vectorized pass:
+#
+#    0                   1                   2                   3
+#   |Ver| T |  TKL  |      Code     |          Message ID           |
+#   |   Token (if any, TKL bytes) ...
+#   |   Options (if any) ...
+#   |1 1 1 1 1 1 1 1|    Payload (if any) ...
+#
+#   the options are walked column-wise (one iteration per option, for all the messages at once)
+#   only to find where the payload starts and whether a BLOCK2 option is present:
+#   the options themselves are still decoded by aiocoap (see workflow_handling.decode_data())
+
+PAYLOAD_MARKER = 0xFF
+BLOCK2_OPTION_NUMBER = 23
+UDP_HEADER_SIZE = 8
+
+################################################################################################
+
+# hex_to_bytes()
+#   I: hex strings (pandas Series, None/NaN allowed)
+#   O: all the messages concatenated in a single buffer (+ 4 padding bytes), start offset and number of bytes of each message
+#   NB: bytes.fromhex() per message (same conversion done before aiocoap decoding), the rest is vectorized
+def hex_to_bytes(hex_series):
+
+    messages = []
+
+    for hex_string in hex_series.fillna(''):
+        try:
+            messages.append(bytes.fromhex(hex_string))
+        except (ValueError, TypeError):
+            # not an hex string -> empty message (= malformed)
+            messages.append(b'')
+
+    n_bytes = np.fromiter((len(message) for message in messages), dtype=np.int64, count=len(messages))
+    starts = np.concatenate(([0], np.cumsum(n_bytes)[:-1])).astype(np.int64)
+
+    buffer = np.frombuffer(b''.join(messages) + bytes(4), dtype=np.uint8)
+
+    return buffer, starts, n_bytes
+
+################################################################################################
+
+# parse_headers()
+#   it returns a dictionary of NumPy arrays (one value per message):
+#   valid, version, mtype, token_length, code, mid, has_options, has_block2, payload_offset, payload_length, n_bytes
+#   (+ 'buffer'/'starts': the bytes the offsets refer to, see hex_to_bytes())
+#   valid = False -> malformed message (aiocoap decoding needed to know what went wrong)
+def parse_headers(hex_series):
+
+    buffer, starts, n_bytes = hex_to_bytes(hex_series)
+
+    last_position = len(buffer) - 1
+
+    # extended option delta/length bytes can be read past the end of a message (next message/padding):
+    # such options end past the message, so the message is flagged as malformed anyway
+    def byte_at(offsets):
+        return buffer[np.minimum(starts + offsets, last_position)].astype(np.int64)
+
+    # ----- fixed header -----
+    first_byte = byte_at(0)
+
+    version = first_byte >> 6
+    mtype = (first_byte >> 4) & 0x03
+    token_length = first_byte & 0x0F
+    code = byte_at(1)
+    mid = (byte_at(2) << 8) | byte_at(3)
+
+    valid = (n_bytes >= 4) & (version == 1) & (token_length <= 8) & (4 + token_length <= n_bytes)
+
+    # ----- options -----
+    cursor = 4 + token_length
+    option_number = np.zeros(len(n_bytes), dtype=np.int64)
+    payload_offset = n_bytes.copy()
+
+    has_options = valid & (cursor < n_bytes) & (byte_at(cursor) != PAYLOAD_MARKER)
+    has_block2 = np.zeros(len(n_bytes), dtype=bool)
+
+    active = valid.copy()
+
+    while active.any():
+
+        # end of the message: no payload (or malformed option lengths)
+        valid &= ~(active & (cursor > n_bytes))
+        active &= cursor < n_bytes
+
+        current = byte_at(cursor)
+
+        # payload marker (an empty payload after the marker is a format error)
+        marker = active & (current == PAYLOAD_MARKER)
+        payload_offset[marker] = cursor[marker] + 1
+        valid &= ~(marker & (cursor + 1 >= n_bytes))
+        active &= ~marker
+
+        delta = current >> 4
+        length = current & 0x0F
+
+        # 15 is reserved (payload marker only)
+        reserved = active & ((delta == 15) | (length == 15))
+        valid &= ~reserved
+        active &= ~reserved
+
+        position = cursor + 1
+
+        # extended option delta (NB: both cases decided on the 4-bit value, 13 + 1 = 14 is a plain delta)
+        extended_1, extended_2 = delta == 13, delta == 14
+        delta = np.where(extended_1, byte_at(position) + 13, delta)
+        delta = np.where(extended_2, ((byte_at(position) << 8) | byte_at(position + 1)) + 269, delta)
+        position += extended_1 + 2 * extended_2
+
+        # extended option length
+        extended_1, extended_2 = length == 13, length == 14
+        length = np.where(extended_1, byte_at(position) + 13, length)
+        length = np.where(extended_2, ((byte_at(position) << 8) | byte_at(position + 1)) + 269, length)
+        position += extended_1 + 2 * extended_2
+
+        option_number = np.where(active, option_number + delta, option_number)
+        has_block2 |= active & (option_number == BLOCK2_OPTION_NUMBER)
+
+        cursor = np.where(active, position + length, cursor)
+
+    payload_length = np.where(valid, n_bytes - payload_offset, 0)
+
+    return {
+        'valid': valid,
+        'version': version,
+        'mtype': mtype,
+        'token_length': token_length,
+        'code': code,
+        'mid': mid,
+        'has_options': has_options,
+        'has_block2': has_block2,
+        'payload_offset': payload_offset,
+        'payload_length': payload_length,
+        'n_bytes': n_bytes,
+        'buffer': buffer,
+        'starts': starts
+    }
+
+################################################################################################
+
+# truncated()
+#   column-wise version of payload_handling.detect_truncated_response() (valid messages only):
+#   - BLOCK2 option -> ZMap got the first block only
+#   - non empty payload and UDP payload size (udp_pkt_size - UDP header) != captured bytes
+def truncated(headers, udp_pkt_size):
+
+    udp_pkt_size = np.asarray(udp_pkt_size, dtype=float)
+
+    size_mismatch = (headers['payload_length'] > 0) & (udp_pkt_size - UDP_HEADER_SIZE != headers['n_bytes'])
+
+    return headers['valid'] & (headers['has_block2'] | size_mismatch)
+
+################################################################################################
+
+# code -> '2.05 Content', ... (computed once per code value)
+_code_names = {}
+
+def code_name(code):
+
+    if code not in _code_names:
+        _code_names[code] = str(Code(code))
+
+    return _code_names[code]
+
+# decode_row()
+#   same output of workflow_handling.decode_data() for a valid message without options (data_format apart)
+#   (built from the parsed header, no aiocoap decoding)
+def decode_row(headers, i, uri):
+
+    start = int(headers['starts'][i])
+    token_length = int(headers['token_length'][i])
+    payload_offset = int(headers['payload_offset'][i])
+
+    token = headers['buffer'][start + 4:start + 4 + token_length].tobytes()
+    payload = headers['buffer'][start + payload_offset:start + headers['n_bytes'][i]].tobytes()
+
+    try:
+        decoded_message_payload = payload.decode("utf-8")
+    except UnicodeDecodeError:
+        decoded_message_payload = payload  # fallback to raw bytes
+
+    return {
+        'uri': uri,
+        'version': int(headers['version'][i]),
+        'mtype': Type(int(headers['mtype'][i])),
+        'token': token.hex(),
+        'token_length': token_length,
+        'code': code_name(int(headers['code'][i])),
+        'mid': int(headers['mid'][i]),
+        'options': None,
+        'observable': False,
+        'data': decoded_message_payload,
+        # classified for the whole slice at once (see workflow_handling.decode_slice())
+        'data_format': None,
+        'data_length': len(payload)
+    }
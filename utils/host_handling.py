@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from collections import Counter, deque
+
+from utils import payload_handling
+
+################################################################################################
+
+# consecutive timeouts/ICMP errors after which a host is considered gone
+FAILURE_THRESHOLD = 3
+
+# max number of outstanding requests per host (NSTART, RFC 7252 section 4.7)
+HOST_IN_FLIGHT = 1
+# max number of requests sent to the same host in a run (None = no cap)
+MAX_REQUESTS_PER_HOST = None
+# max number of hosts being served at the same time (bounds the items pulled from the producer)
+MAX_ACTIVE_HOSTS = 2000
+
+################################################################################################
+
+# HostHealth
+#   per-host circuit breaker: after FAILURE_THRESHOLD consecutive failures the breaker of the host opens
+#   and the remaining requests towards it are short-circuited (recorded as skipped) instead of
+#   each one holding a worker slot for the whole timeout
+class HostHealth:
+
+    def __init__(self, threshold=FAILURE_THRESHOLD):
+
+        self.threshold = threshold
+
+        # ip -> consecutive failures
+        self.failures = Counter()
+        # ip -> reason of the opening
+        self.open_breakers = {}
+
+        self.skipped = Counter()
+
+    def is_open(self, ip_address):
+
+        return ip_address in self.open_breakers
+
+    def record(self, ip_address, outcome):
+
+        if outcome == 'success':
+            self.failures.pop(ip_address, None)
+            return
+
+        self.failures[ip_address] += 1
+
+        if self.failures[ip_address] >= self.threshold and ip_address not in self.open_breakers:
+            self.open_breakers[ip_address] = f"{self.failures[ip_address]} consecutive {outcome}s"
+
+    def skip(self, ip_address, uri):
+
+        reason = self.open_breakers[ip_address]
+
+        self.skipped[ip_address] += 1
+
+        record = payload_handling.empty_record(ip_address, uri)
+        record['data'] = f"skipped: {reason}"
+
+        return record
+
+    def report(self):
+
+        print("\tHost circuit breaker")
+        print(f"\t\thosts with open breaker - {len(self.open_breakers)}")
+        print(f"\t\tskipped requests - {sum(self.skipped.values())}")
+
+################################################################################################
+
+# FairScheduler
+#   it pulls the (ip, ...) items out of a producer and hands them out round-robin across hosts:
+#   - a host advertising hundreds of resources no longer monopolizes the workers
+#   - at most HOST_IN_FLIGHT requests are outstanding per host (the host slot is given back with release())
+#   - at most MAX_REQUESTS_PER_HOST requests are scheduled per host, a 'skipped' record is appended
+#     to 'collector' for each of the others (no request is sent)
+#   - (optional pacer) hosts whose network is over its packet-rate ceiling are parked in a heap keyed by
+#     the time their network gets a token back, they rejoin the round-robin queue at that time
+class FairScheduler:
+
+    def __init__(self, producer, in_flight_limit=HOST_IN_FLIGHT, max_requests=MAX_REQUESTS_PER_HOST, max_active_hosts=MAX_ACTIVE_HOSTS, pacer=None, collector=None):
+
+        self.producer = iter(producer)
+        # per-network rate ceilings (see network_handling.NetworkPacer)
+        self.pacer = pacer
+        # where the records of the capped items are appended (see coap.ResultCollector)
+        self.collector = collector
+        self.exhausted = False
+
+        self.in_flight_limit = in_flight_limit
+        self.max_requests = max_requests
+        self.max_active_hosts = max_active_hosts
+
+        # ip -> items still to be handed out
+        self.hosts = {}
+        # hosts having items and a free slot (round-robin order)
+        self.ready = deque()
+        # ready hosts, paced ones included
+        self.ready_set = set()
+        # paced hosts: (time their network gets a token back, tie-breaker, ip) heap
+        self.paced = []
+        self.sequence = itertools.count()
+
+        self.in_flight = Counter()
+        self.scheduled = Counter()
+        self.capped = Counter()
+
+        self.changed = asyncio.Event()
+
+    def mark_ready(self, ip_address):
+
+        if ip_address in self.hosts and self.in_flight[ip_address] < self.in_flight_limit and ip_address not in self.ready_set:
+            self.ready.append(ip_address)
+            self.ready_set.add(ip_address)
+
+    def fill(self):
+
+        while not self.exhausted and len(self.hosts) < self.max_active_hosts:
+
+            try:
+                item = next(self.producer)
+            except StopIteration:
+                self.exhausted = True
+                break
+
+            ip_address = item[0]
+
+            # per-host cap reached
+            if self.max_requests is not None and self.scheduled[ip_address] >= self.max_requests:
+                self.skip(item)
+                continue
+
+            self.scheduled[ip_address] += 1
+
+            self.hosts.setdefault(ip_address, deque()).append(item)
+            self.mark_ready(ip_address)
+
+    # skip()
+    #   the item is over the per-host cap -> no request, a 'skipped' record (see HostHealth.skip)
+    def skip(self, item):
+
+        ip_address, uri = item[0], item[1]
+
+        self.capped[ip_address] += 1
+
+        if self.collector is not None:
+            record = payload_handling.empty_record(ip_address, uri)
+            record['data'] = f"skipped: per-host cap ({self.max_requests} requests)"
+            self.collector.append(record)
+
+    # unpark()
+    #   paced hosts whose network has a token again go back to the end of the round-robin queue
+    def unpark(self):
+
+        now = time.monotonic()
+
+        while self.paced and self.paced[0][0] <= now:
+            _, _, ip_address = heapq.heappop(self.paced)
+            self.ready.append(ip_address)
+
+    # next()
+    #   it returns the next item to be sent, None when every item has been handed out
+    async def next(self):
+
+        while True:
+
+            self.fill()
+            self.unpark()
+
+            # first ready host (round-robin order) whose network can take one more packet
+            while self.ready:
+
+                ip_address = self.ready.popleft()
+
+                if self.pacer is not None and not self.pacer.try_acquire(ip_address):
+                    ready_at = time.monotonic() + self.pacer.time_to_token(ip_address)
+                    heapq.heappush(self.paced, (ready_at, next(self.sequence), ip_address))
+                    continue
+
+                self.ready_set.discard(ip_address)
+
+                items = self.hosts[ip_address]
+                item = items.popleft()
+
+                if not items:
+                    del self.hosts[ip_address]
+
+                self.in_flight[ip_address] += 1
+
+                # back to the end of the round-robin queue
+                self.mark_ready(ip_address)
+
+                return item
+
+            if self.exhausted and not self.hosts:
+                return None
+
+            self.changed.clear()
+
+            if self.paced:
+                # every ready host is paced -> wait for the first network token (or a release)
+                delay = max(0, self.paced[0][0] - time.monotonic())
+                self.pacer.waits += 1
+
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            else:
+                # every pending host is at its in-flight limit -> wait for a release
+                await self.changed.wait()
+
+    # release()
+    #   the request towards ip_address is over (response, timeout, skipped, ...)
+    def release(self, ip_address):
+
+        self.in_flight[ip_address] -= 1
+
+        if self.in_flight[ip_address] <= 0:
+            del self.in_flight[ip_address]
+
+        self.mark_ready(ip_address)
+
+        self.changed.set()
+
+    def report(self):
+
+        print("\tFair-share scheduler")
+        print(f"\t\thosts served - {len(self.scheduled)}")
+        print(f"\t\trequests scheduled - {sum(self.scheduled.values())}")
+        print(f"\t\tmax requests to a single host - {max(self.scheduled.values(), default=0)}")
+        print(f"\t\thosts capped - {len(self.capped)}")
+        print(f"\t\trequests skipped (per-host cap) - {sum(self.capped.values())}")
+
+        for ip_address, count in self.capped.most_common(10):
+            print(f"\t\t\t{ip_address} - {count} skipped")
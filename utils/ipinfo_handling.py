@@ -0,0 +1,284 @@
+import atexit
+import os
+import socket
+import sqlite3
+
+import maxminddb
+import pandas as pd
+
+################################################################################################
+
+MMDB_PATH = "utils/ipinfo/ipinfo_lite.mmdb"
+
+# persistent (cross-day) enrichment table: (saddr, mmdb build) -> IPINFO_FIELDS
+STORE_PATH = "utils/ipinfo/ip_info_store.sqlite"
+
+# max number of addresses per SQL query
+STORE_BATCH_SIZE = 500
+
+# column of the "reference" ip_info datasets (saddr + build: the fields are in the store)
+BUILD_COLUMN = "ipinfo_build"
+
+# fields extracted from every ipinfo record (= columns added by enrich())
+IPINFO_FIELDS = ["asn", "as_name", "as_domain", "continent", "continent_code", "country", "country_code"]
+
+################################################################################################
+
+# one memory-mapped reader for the whole process (opened on first use, closed at exit)
+_reader = None
+
+def get_reader():
+
+    global _reader
+
+    if _reader is None:
+        _reader = maxminddb.open_database(MMDB_PATH, maxminddb.MODE_MMAP)
+
+    return _reader
+
+def close_reader():
+
+    global _reader
+
+    if _reader is not None:
+        _reader.close()
+
+    _reader = None
+
+# build_version()
+#   build timestamp of the mmdb in use: the stored enrichments are valid only for the same build
+def build_version():
+
+    return get_reader().metadata().build_epoch
+
+################################################################################################
+
+_store = None
+
+def get_store():
+
+    global _store
+
+    if _store is None:
+
+        os.makedirs(os.path.dirname(STORE_PATH), exist_ok=True)
+
+        _store = sqlite3.connect(STORE_PATH)
+        _store.execute(
+            f"CREATE TABLE IF NOT EXISTS ip_info (saddr TEXT, build INTEGER, {', '.join(IPINFO_FIELDS)}, PRIMARY KEY (saddr, build))"
+        )
+
+    return _store
+
+def close_store():
+
+    global _store
+
+    if _store is not None:
+        _store.close()
+
+    _store = None
+
+# stored_fields()
+#   I: IP addresses, mmdb build
+#   O: ip -> IPINFO_FIELDS values (only the addresses already enriched with that build)
+def stored_fields(ip_addresses, build):
+
+    store = get_store()
+    ip_addresses = list(ip_addresses)
+
+    fields = {}
+
+    for start in range(0, len(ip_addresses), STORE_BATCH_SIZE):
+
+        batch = ip_addresses[start:start + STORE_BATCH_SIZE]
+
+        rows = store.execute(
+            f"SELECT saddr, {', '.join(IPINFO_FIELDS)} FROM ip_info WHERE build = ? AND saddr IN ({', '.join('?' * len(batch))})",
+            [build, *batch]
+        )
+
+        for row in rows:
+            fields[row[0]] = row[1:]
+
+    return fields
+
+def store_fields(new_fields, build):
+
+    store = get_store()
+
+    store.executemany(
+        f"INSERT OR IGNORE INTO ip_info (saddr, build, {', '.join(IPINFO_FIELDS)}) VALUES ({', '.join('?' * (len(IPINFO_FIELDS) + 2))})",
+        [(ip_address, build, *fields) for ip_address, fields in new_fields.items()]
+    )
+    store.commit()
+
+def close():
+
+    close_reader()
+    close_store()
+
+atexit.register(close)
+
+################################################################################################
+
+# PrefixCache
+#   IPv4 lookups cached per network returned by the database: the networks of the mmdb search tree
+#   are disjoint, so if an address falls inside a cached network that network is its own
+#   (every address of the same block shares a single database lookup)
+class PrefixCache:
+
+    def __init__(self):
+
+        # prefix length -> {network (int) -> record fields}
+        self.networks = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        # addresses found in the persistent store (no lookup at all)
+        self.stored = 0
+
+    def lookup(self, address):
+
+        for prefix_len, networks in self.networks.items():
+
+            network = address >> (32 - prefix_len) if prefix_len else 0
+
+            if network in networks:
+                self.hits += 1
+                return networks[network]
+
+        self.misses += 1
+
+        return None
+
+    def store(self, address, prefix_len, fields):
+
+        network = address >> (32 - prefix_len) if prefix_len else 0
+
+        self.networks.setdefault(prefix_len, {})[network] = fields
+
+    def report(self):
+
+        print("\tIP enrichment cache")
+        print(f"\t\taddresses already in the store - {self.stored}")
+        print(f"\t\tnetworks - {sum(len(networks) for networks in self.networks.values())}")
+        print(f"\t\thits - {self.hits}")
+        print(f"\t\tmisses (database lookups) - {self.misses}")
+
+_prefix_cache = PrefixCache()
+
+def get_prefix_cache():
+
+    return _prefix_cache
+
+################################################################################################
+
+def fields_of(record):
+
+    record = record or {}
+
+    return tuple(record.get(field) for field in IPINFO_FIELDS)
+
+# lookup()
+#   it returns the IPINFO_FIELDS values (tuple) of ip_address
+def lookup(ip_address):
+
+    reader = get_reader()
+
+    try:
+        address = int.from_bytes(socket.inet_aton(ip_address), 'big')
+    except (OSError, TypeError):
+        # not an IPv4 address (IPv6, malformed, ...) -> no prefix caching
+        try:
+            return fields_of(reader.get(ip_address))
+        except ValueError:
+            return fields_of(None)
+
+    fields = _prefix_cache.lookup(address)
+
+    if fields is None:
+        record, prefix_len = reader.get_with_prefix_len(ip_address)
+        fields = fields_of(record)
+        _prefix_cache.store(address, prefix_len, fields)
+
+    return fields
+
+################################################################################################
+
+# enrich()
+#   I: IP addresses (iterable)
+#   O: columnar dictionary IPINFO_FIELDS -> list of values (same order of the input addresses)
+#   the addresses enriched in previous runs (same mmdb build) are taken from the store,
+#   the others are looked up and added to the store
+def enrich(ip_addresses):
+
+    ip_addresses = list(ip_addresses)
+    build = build_version()
+
+    known_fields = stored_fields(set(ip_addresses), build)
+    _prefix_cache.stored += len(known_fields)
+
+    new_fields = {
+        ip_address: lookup(ip_address)
+        for ip_address in ip_addresses
+        if ip_address not in known_fields
+    }
+
+    if new_fields:
+        store_fields(new_fields, build)
+
+    values = [known_fields.get(ip_address) or new_fields[ip_address] for ip_address in ip_addresses]
+
+    if not values:
+        return {field: [] for field in IPINFO_FIELDS}
+
+    return {field: list(column) for field, column in zip(IPINFO_FIELDS, zip(*values))}
+
+# enrich_df()
+#   it returns ip_list_df ('saddr' column) with the IPINFO_FIELDS columns appended
+def enrich_df(ip_list_df):
+
+    ip_info_df = pd.DataFrame(enrich(ip_list_df['saddr']), columns=IPINFO_FIELDS)
+
+    return pd.concat(
+        [ip_list_df.reset_index(drop=True), ip_info_df],
+        axis=1
+    )
+
+################################################################################################
+
+# reference_of()
+#   compact version of an ip_info dataframe: saddr + mmdb build (the fields can be read back from the store)
+def reference_of(ip_info_df):
+
+    return pd.DataFrame({
+        'saddr': ip_info_df['saddr'].to_numpy(),
+        BUILD_COLUMN: build_version()
+    })
+
+# resolve()
+#   inverse of reference_of(): it adds the IPINFO_FIELDS columns to a reference ip_info dataframe
+#   (dataframes already having them are returned as they are)
+def resolve(ip_info_df):
+
+    if BUILD_COLUMN not in ip_info_df.columns:
+        return ip_info_df
+
+    values = {field: [] for field in IPINFO_FIELDS}
+
+    # one query per build (normally a single one)
+    known_fields = {}
+    for build, addresses in ip_info_df.groupby(BUILD_COLUMN)['saddr']:
+        known_fields[build] = stored_fields(set(addresses), int(build))
+
+    empty = fields_of(None)
+
+    for ip_address, build in zip(ip_info_df['saddr'], ip_info_df[BUILD_COLUMN]):
+        for field, value in zip(IPINFO_FIELDS, known_fields[build].get(ip_address, empty)):
+            values[field].append(value)
+
+    resolved_df = ip_info_df.drop(columns=[BUILD_COLUMN]).reset_index(drop=True)
+
+    return pd.concat([resolved_df, pd.DataFrame(values, columns=IPINFO_FIELDS)], axis=1)
@@ -0,0 +1,92 @@
+import json
+import logging
+import sys
+
+################################################################################################
+
+# Structured logging of the headless runs (see cli.py)
+#   one JSON object per line: time, level, logger, message + the fields of the event (portion, stage, ...)
+#   the pipeline output (print() based) is forwarded to the 'pipeline' logger line by line
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+
+        entry.update(getattr(record, 'fields', {}))
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+# PrintToLog
+#   file-like object: every line written to it becomes a log record (with the current fields)
+#   (used as stdout, so the stages do not need to be rewritten)
+class PrintToLog:
+
+    def __init__(self, logger, level=logging.INFO):
+
+        self.logger = logger
+        self.level = level
+
+        # ex. {'stage': 'refine', 'portion': 3}, set by the caller stage by stage
+        self.fields = {}
+
+        self.pending = ''
+
+    def write(self, text):
+
+        self.pending += text
+
+        *lines, self.pending = self.pending.split('\n')
+
+        for line in lines:
+
+            line = line.strip()
+
+            # screen separators ('-----') carry no information
+            if line and line.strip('-'):
+                self.logger.log(self.level, line, extra={'fields': self.fields})
+
+        return len(text)
+
+    def flush(self):
+
+        if self.pending.strip():
+            self.logger.log(self.level, self.pending.strip(), extra={'fields': self.fields})
+
+        self.pending = ''
+
+################################################################################################
+
+def configure(level='INFO', stream=sys.stderr):
+
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+# init_worker()
+#   worker process initializer (see process_handling.set_worker_initializer()): JSON log on stderr and
+#   print() output forwarded to the 'pipeline' logger, as in the parent process
+#   (contextlib.redirect_stdout of the parent does not reach the spawned processes)
+def init_worker(level='INFO'):
+
+    configure(level)
+
+    sys.stdout = PrintToLog(logging.getLogger('pipeline'))
+
+# event()
+#   log record with structured fields
+def event(logger, message, level=logging.INFO, exc_info=None, **fields):
+
+    logger.log(level, message, exc_info=exc_info, extra={'fields': fields})
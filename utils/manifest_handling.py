@@ -0,0 +1,229 @@
+import atexit
+import datetime
+import os
+import sqlite3
+
+################################################################################################
+
+# Run manifest
+#   every output dataset (CSV path, see workflow_handling.create_file()) is registered here with
+#   stage, portion, start time of the run that created it, rows written and byte size:
+#   - writers get "the last file" of a directory with an indexed query (no listing)
+#   - readers enumerate the datasets of a stage/portion in creation order and know their date
+#     without parsing file names
+
+DATA_PATH = 'O1_DataCollection/data/'
+MANIFEST_PATH = 'O1_DataCollection/data/manifest.sqlite'
+
+################################################################################################
+
+_manifest = None
+
+def get_manifest():
+
+    global _manifest
+
+    if _manifest is None:
+
+        os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+
+        # several portions may be elaborated at the same time (separate processes)
+        _manifest = sqlite3.connect(MANIFEST_PATH, timeout=30)
+        _manifest.execute("PRAGMA journal_mode=WAL")
+        _manifest.execute("PRAGMA synchronous=NORMAL")
+
+        _manifest.execute(
+            "CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY, directory TEXT, stage TEXT, portion TEXT, start_time TEXT, rows INTEGER, bytes INTEGER)"
+        )
+        _manifest.execute("CREATE INDEX IF NOT EXISTS outputs_directory ON outputs (directory, start_time)")
+        _manifest.execute("CREATE INDEX IF NOT EXISTS outputs_stage ON outputs (stage, portion, start_time)")
+
+        # stages whose pre-manifest datasets have already been registered (see backfill())
+        _manifest.execute("CREATE TABLE IF NOT EXISTS backfilled (stage TEXT PRIMARY KEY)")
+
+    return _manifest
+
+def close():
+
+    global _manifest
+
+    if _manifest is not None:
+        _manifest.close()
+
+    _manifest = None
+
+atexit.register(close)
+
+################################################################################################
+
+def key_of(path):
+
+    return os.path.normpath(path)
+
+def portion_key_of(portion):
+
+    return None if portion is None else str(portion)
+
+# stage_of()
+#   stage of a dataset directory: its path relative to DATA_PATH, the portion sub-directory excluded
+#   ('O1_DataCollection/data/discovery/cleaned/3/' -> 'discovery/cleaned')
+def stage_of(directory, portion=None):
+
+    stage = os.path.relpath(os.path.normpath(directory), os.path.normpath(DATA_PATH))
+
+    if portion is not None and os.path.basename(stage) == str(portion):
+        stage = os.path.dirname(stage)
+
+    return stage
+
+################################################################################################
+
+# register()
+#   new (or truncated) output dataset: rows and size start from 0
+def register(path, stage, portion, start_time):
+
+    manifest = get_manifest()
+
+    manifest.execute(
+        "INSERT OR REPLACE INTO outputs (path, directory, stage, portion, start_time, rows, bytes) VALUES (?, ?, ?, ?, ?, 0, 0)",
+        (key_of(path), os.path.dirname(key_of(path)), stage, portion_key_of(portion), str(start_time))
+    )
+    manifest.commit()
+
+# add_rows()
+#   rows appended to a registered dataset (byte size = current size of the file)
+def add_rows(path, rows, n_bytes):
+
+    manifest = get_manifest()
+
+    manifest.execute(
+        "UPDATE outputs SET rows = rows + ?, bytes = ? WHERE path = ?",
+        (rows, n_bytes, key_of(path))
+    )
+    manifest.commit()
+
+# set_rows()
+#   whole dataset written at once (ex. balanced portions)
+def set_rows(path, rows, n_bytes):
+
+    manifest = get_manifest()
+
+    manifest.execute("UPDATE outputs SET rows = ?, bytes = ? WHERE path = ?", (rows, n_bytes, key_of(path)))
+    manifest.commit()
+
+# forget()
+#   it removes the datasets of a stage from the manifest (the files are left untouched)
+def forget(stage):
+
+    manifest = get_manifest()
+
+    manifest.execute("DELETE FROM outputs WHERE stage = ?", (stage,))
+    manifest.commit()
+
+################################################################################################
+
+# latest()
+#   path of the last dataset registered in directory (None if there is none)
+def latest(directory):
+
+    row = get_manifest().execute(
+        "SELECT path FROM outputs WHERE directory = ? ORDER BY start_time DESC LIMIT 1",
+        (key_of(directory),)
+    ).fetchone()
+
+    return None if row is None else row[0]
+
+# datasets()
+#   datasets of a stage (of a single portion if given), ordered by portion and creation time:
+#   list of dictionaries path, stage, portion, start_time, rows, bytes
+def datasets(stage, portion=None):
+
+    if get_manifest().execute("SELECT 1 FROM backfilled WHERE stage = ?", (stage,)).fetchone() is None:
+        backfill(stage)
+
+    query = "SELECT path, stage, portion, start_time, rows, bytes FROM outputs WHERE stage = ?"
+    parameters = [stage]
+
+    if portion is not None:
+        query += " AND portion = ?"
+        parameters.append(portion_key_of(portion))
+
+    # numeric portions sorted as numbers (2 before 10)
+    query += " ORDER BY CAST(portion AS INTEGER), portion, start_time"
+
+    columns = ['path', 'stage', 'portion', 'start_time', 'rows', 'bytes']
+
+    return [dict(zip(columns, row)) for row in get_manifest().execute(query, parameters)]
+
+# first()
+#   master dataset of a stage/portion (the first one created, ex. ZMap cleaned dataset)
+def first(stage, portion):
+
+    stage_datasets = datasets(stage, portion)
+
+    return stage_datasets[0]['path'] if stage_datasets else None
+
+# date_of()
+#   'YYYY-MM-DD' of the run that created the dataset at path
+#   (datasets older than the manifest: date at the beginning of the file name, ex. '2025-10-01 10:00:00.000000.csv')
+def date_of(path):
+
+    row = get_manifest().execute("SELECT start_time FROM outputs WHERE path = ?", (key_of(path),)).fetchone()
+
+    if row is not None:
+        return row[0][:10]
+
+    return os.path.basename(path)[:10]
+
+# rows_of()
+#   number of rows written to the dataset at path (None if it is not in the manifest)
+def rows_of(path):
+
+    row = get_manifest().execute("SELECT rows FROM outputs WHERE path = ?", (key_of(path),)).fetchone()
+
+    return None if row is None else row[0]
+
+################################################################################################
+
+# backfill()
+#   one-off registration of the CSV datasets written before the manifest existed (first datasets() of a stage)
+#   (directory layout: DATA_PATH/<stage>/<portion>/<date>.csv or DATA_PATH/<stage>/<portion>.csv)
+def backfill(stage):
+
+    directory = os.path.join(DATA_PATH, stage)
+
+    get_manifest().execute("INSERT OR IGNORE INTO backfilled (stage) VALUES (?)", (stage,))
+
+    registered = 0
+
+    if not os.path.isdir(directory):
+        get_manifest().commit()
+        return registered
+
+    for name in sorted(os.listdir(directory)):
+
+        entry = os.path.join(directory, name)
+
+        if os.path.isdir(entry):
+            paths = [(os.path.join(entry, f), name) for f in sorted(os.listdir(entry)) if f.endswith('.csv')]
+        elif name.endswith('.csv'):
+            paths = [(entry, name[:-len('.csv')])]
+        else:
+            paths = []
+
+        for path, portion in paths:
+
+            try:
+                start_time = datetime.datetime.fromisoformat(os.path.basename(path)[:-len('.csv')])
+            except ValueError:
+                start_time = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+
+            get_manifest().execute(
+                "INSERT OR IGNORE INTO outputs (path, directory, stage, portion, start_time, rows, bytes) VALUES (?, ?, ?, ?, ?, NULL, ?)",
+                (key_of(path), os.path.dirname(key_of(path)), stage, portion, str(start_time), os.path.getsize(path))
+            )
+            registered += 1
+
+    get_manifest().commit()
+
+    return registered
@@ -0,0 +1,143 @@
+from collections import deque
+
+from utils import rate_handling, cache_handling
+
+################################################################################################
+
+# max number of requests per second towards the same network (ASN, or /24 when the ASN is unknown)
+NETWORK_REQUESTS_PER_SECOND = 20
+NETWORK_BURST = 20
+
+# number of targets buffered to interleave them across networks
+INTERLEAVE_WINDOW = 5000
+
+# max number of addresses whose ASN is kept (least recently used ones dropped)
+ASN_CACHE_SIZE = 100000
+
+################################################################################################
+
+# ip -> asn (from the ipinfo data produced by workflow_handling.extract_ip_info)
+#   per process: the worker processes get the ASNs with their targets ('asn' column, see coap.run_shard())
+_asn_of = cache_handling.LRUCache('asn', ASN_CACHE_SIZE)
+
+# register_asns()
+#   it makes the ASN of the given addresses known (ip_info_df: 'saddr' + 'asn' columns)
+def register_asns(ip_info_df):
+
+    for ip_address, asn in zip(ip_info_df['saddr'], ip_info_df['asn']):
+        if isinstance(asn, str) and asn:
+            _asn_of.store(ip_address, asn)
+
+def asn_of(ip_address):
+
+    _, asn = _asn_of.lookup(ip_address)
+
+    return asn
+
+def prefix_of(ip_address):
+
+    return str(ip_address).rsplit('.', 1)[0]
+
+# network_of()
+#   grouping key of an address: its ASN if known, its /24 prefix otherwise
+def network_of(ip_address):
+
+    asn = asn_of(ip_address)
+
+    if asn is not None:
+        return asn
+
+    return f"{prefix_of(ip_address)}.0/24"
+
+################################################################################################
+
+# interleave()
+#   it reorders the (ip, ...) items of a producer so that consecutive items belong to different networks
+#   (round-robin over the networks of a sliding window of INTERLEAVE_WINDOW items), much as ZMap
+#   permutes its address space instead of walking it in order
+def interleave(producer, window=INTERLEAVE_WINDOW):
+
+    producer = iter(producer)
+    exhausted = False
+
+    # network -> buffered items
+    networks = {}
+    # round-robin order of the networks
+    rotation = deque()
+    buffered = 0
+
+    while True:
+
+        while not exhausted and buffered < window:
+
+            try:
+                item = next(producer)
+            except StopIteration:
+                exhausted = True
+                break
+
+            network = network_of(item[0])
+
+            if network not in networks:
+                networks[network] = deque()
+                rotation.append(network)
+
+            networks[network].append(item)
+            buffered += 1
+
+        if not rotation:
+            return
+
+        network = rotation.popleft()
+        items = networks[network]
+
+        yield items.popleft()
+        buffered -= 1
+
+        if items:
+            rotation.append(network)
+        else:
+            del networks[network]
+
+################################################################################################
+
+# NetworkPacer
+#   per-network packet-rate ceilings (one token bucket per ASN//24)
+class NetworkPacer:
+
+    def __init__(self, requests_per_second=NETWORK_REQUESTS_PER_SECOND, burst=NETWORK_BURST):
+
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+
+        self.buckets = {}
+
+        # number of times the scheduler had to wait for a network token
+        self.waits = 0
+
+    def bucket_of(self, ip_address):
+
+        network = network_of(ip_address)
+
+        if network not in self.buckets:
+            self.buckets[network] = rate_handling.TokenBucket(self.requests_per_second, self.burst)
+
+        return self.buckets[network]
+
+    # try_acquire()
+    #   it consumes a token of the network of ip_address, if available (never waits)
+    def try_acquire(self, ip_address):
+
+        return self.bucket_of(ip_address).try_acquire()
+
+    # time_to_token()
+    #   seconds before a token of the network of ip_address becomes available
+    def time_to_token(self, ip_address):
+
+        return self.bucket_of(ip_address).time_to_token()
+
+    def report(self):
+
+        print("\tNetwork pacing")
+        print(f"\t\tnetworks - {len(self.buckets)}")
+        print(f"\t\twaits for a network token - {self.waits}")
@@ -1,10 +1,53 @@
+import ast
 import json
 import re
 
+import numpy as np
+import pandas as pd
+
 from collections import Counter
-from dateutil.parser import parse
+from dateutil.parser import parse, parserinfo
+from aiocoap.numbers.optionnumbers import OptionNumber
+from aiocoap.optiontypes import UintOption
+
+from utils import cache_handling
+
+# typed option columns of the stored datasets (see options_to_json())
+OPTION_COLUMNS_OF = {
+    'CONTENT_FORMAT': 'opt_content_format',
+    'BLOCK2': 'opt_block2',
+    'OBSERVE': 'opt_observe',
+    'ETAG': 'opt_etag',
+    'MAX_AGE': 'opt_max_age'
+}
+OTHER_OPTIONS_COLUMN = 'opt_others'
+
+# stored option values: datasets written before option_value() used str(option)
+#   ETag/opaque options  "b'\x124'" (bytes repr)                                   -> '0x1234'
+#   Block1/Block2        'BlockwiseTuple(block_number=0, more=True, size_exponent=6)' -> '0/1/6'
+#   uint options         '60'                                                         -> 60
+#   repeated options     a single value (the others are lost)                         -> list of values
+#   Content-Format       its name (ex. 'LINKFORMAT'), unchanged
+#   -> old values are converted when read (see legacy_option_value(), get_option(), migrate_options())
+LEGACY_BLOCK = re.compile(r'BlockwiseTuple\(block_number=(\d+), more=(True|False), size_exponent=(\d+)\)')
+
+# payload format classifier
+#   the expensive parsers (dateutil, json) run only when a cheap first-character/regex check says they can succeed:
+#   - int/float/complex -> the text starts with a digit, a sign, '.', '(' or is inf/nan/...j
+#   - datetime          -> the text contains a digit or a month/weekday name and does not start with '<', '[', '{'
+#                          (link-format payloads never reach dateutil)
+#   - json              -> the text starts with '{', '[', '"' or is a JSON literal
+#   NB: JSON objects/arrays are checked before dateutil (dateutil never parses them anyway)
+DATE_NAMES = [name for names in parserinfo().MONTHS + parserinfo().WEEKDAYS for name in names] + ['Sept']
+DATETIME_HINT = re.compile(r'\d|\b(?:' + '|'.join(DATE_NAMES) + r')\b', re.IGNORECASE)
+
+NUMBER_FIRST_CHARS = set('+-.(')
+NUMBER_WORDS = ('inf', 'nan')
+JSON_FIRST_CHARS = set('{["')
+JSON_LITERALS = {'true', 'false', 'null'}
 
 ''''''
+@cache_handling.memoize('detect_format')
 def detect_format(payload):
     
     # cast it to string
@@ -13,44 +56,70 @@ def detect_format(payload):
     # empty payload/data field -> None
     if not payload:
         return None
-        
+
+    text = payload.strip()
+    first = text[:1]
+
     # 1. Number first
-    try:
-        int(payload)
-        return "int"
-    except ValueError:
+    if text and (first.isdigit() or first in NUMBER_FIRST_CHARS or text[:3].lower() in NUMBER_WORDS or text[-1] in 'jJ'):
         try:
-            float(payload)
-            return "float"
+            int(payload)
+            return "int"
         except ValueError:
             try:
-                complex(payload)
-                return "complex"
+                float(payload)
+                return "float"
             except ValueError:
-                pass
+                try:
+                    complex(payload)
+                    return "complex"
+                except ValueError:
+                    pass
 
     # 2. Boolean
     if payload.lower() in {"true", "false"}:
         return "boolean"
 
+    # 4. JSON objects/arrays
+    if first in '{[':
+        try:
+            json.loads(payload)
+            return "json"
+        except (json.JSONDecodeError, TypeError):
+            return "string"
+
     # 3. Datetime
-    try:
-        parse(payload)
-        return "datetime"
-    except Exception:
-        pass
+    if first != '<' and DATETIME_HINT.search(text):
+        try:
+            parse(payload)
+            return "datetime"
+        except Exception:
+            pass
 
-    # 4. JSON
-    try:
-        json.loads(payload)
-        return "json"
-    except (json.JSONDecodeError, TypeError):
-        pass
+    # 4. JSON strings/literals
+    if first == '"' or text in JSON_LITERALS:
+        try:
+            json.loads(payload)
+            return "json"
+        except (json.JSONDecodeError, TypeError):
+            pass
 
     # 5. Fallback: just a string
     return "string"
 
 ''''''
+# detect_formats()
+#   vectorized detect_format(): every distinct payload of the Series is classified once
+def detect_formats(payloads):
+
+    codes, uniques = pd.factorize(payloads.map(str), use_na_sentinel=False)
+
+    formats = np.array([detect_format(payload) for payload in uniques], dtype=object)
+
+    return pd.Series(formats[codes], index=payloads.index, dtype=object)
+
+''''''
+@cache_handling.memoize('uri_list_of')
 def uri_list_of(payload):
 
     uri_list = []
@@ -75,6 +144,7 @@ def uri_list_of(payload):
 
 
 ''''''
+@cache_handling.memoize('resource_list_of')
 def resource_list_of(payload):
     
     if payload is None:
@@ -112,6 +182,7 @@ def resource_metadata_names_of(payload):
     return Counter(metadata)
 
 ''''''
+@cache_handling.memoize('get_metadata_value_of')
 def get_metadata_value_of(payload, metadata_name):
 
     res_attributes = str(payload).split(';')
@@ -204,6 +275,33 @@ def get_token(message):
     return token
 
 
+# option_value()
+#   JSON-friendly value of an option (stored representation, older datasets: see the note above LEGACY_BLOCK)
+def option_value(option):
+
+    value = option.value
+
+    # content format -> its name (ex. LINKFORMAT, TEXT, ...)
+    if option.number == OptionNumber.CONTENT_FORMAT:
+        return str(option)
+
+    # block options -> "<block number>/<more>/<size exponent>"
+    if option.number in (OptionNumber.BLOCK1, OptionNumber.BLOCK2):
+        return f"{value.block_number}/{int(value.more)}/{value.size_exponent}"
+
+    if isinstance(value, int):
+        return value
+
+    # "0x" prefix: an all-digits hex string would be read back as a number
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+
+    return str(value)
+
+
+# get_options()
+#   O: {option name: value} (repeated options -> list of values), None if the message has no options
+#      values are JSON-friendly: int for uint options, hex string (0x...) for opaque ones, string otherwise
 def get_options(message):
 
     try:
@@ -211,19 +309,20 @@ def get_options(message):
         options = None
 
         # if options are defined
-        if (len(message.opt._options.keys()) > 0):
-            options = {}
+        for option in message.opt.option_list():
 
-            options_key = []
-            for option in message.opt._options:
-                options_key.append(str(option))
+            if options is None:
+                options = {}
 
-            options_value = []
-            for option in message.opt.option_list():
-                options_value.append(str(option))
+            name = str(option.number)
+            value = option_value(option)
 
-            for i in range(len(options_key)):
-                options.update({options_key[i]: options_value[i]})
+            if name not in options:
+                options[name] = value
+            elif isinstance(options[name], list):
+                options[name].append(value)
+            else:
+                options[name] = [options[name], value]
     
     except Exception:
         return None
@@ -267,6 +366,19 @@ def get_payload_length(message):
     return payload_length
 
 
+# get_truncated()
+#   True if the message is only the first block of a blockwise resource (Block2 with more = 1)
+#   ex. stateless engine (blocks are not requested) or blockwise_handling.fetch() unable to reassemble it
+def get_truncated(message):
+
+    try:
+        block2 = message.opt.block2
+    except Exception:
+        return None
+
+    return block2 is not None and bool(block2.more)
+
+
 def get_observe(message, uri):
 
     try:
@@ -280,15 +392,110 @@ def get_observe(message, uri):
         return False
     
 
+# options_to_json()
+#   it replaces (in place) the 'options' column (dictionaries, see get_options()) with the typed option columns:
+#   OPTION_COLUMNS_OF (CONTENT_FORMAT, BLOCK2, OBSERVE, ETAG, MAX_AGE) + OTHER_OPTIONS_COLUMN (compact JSON of the remaining ones)
+#   so that the options are parsed once, when the dataset is stored
 def options_to_json(discovery_df):
 
-    discovery_df["options"] = discovery_df["options"].apply(
-        lambda x: json.dumps(x) if isinstance(x, dict) else x
-    )
+    if 'options' not in discovery_df.columns:
+        return discovery_df
+
+    position = discovery_df.columns.get_loc('options')
+    options = [x if isinstance(x, dict) else {} for x in discovery_df['options']]
+
+    for offset, (name, column) in enumerate(OPTION_COLUMNS_OF.items()):
+        values = pd.Series([x.get(name) for x in options], index=discovery_df.index, dtype=object)
+        # uint options -> nullable integers
+        if name in ('OBSERVE', 'MAX_AGE'):
+            values = values.astype('Int64')
+        discovery_df.insert(position + 1 + offset, column, values)
+
+    discovery_df.insert(position + 1 + len(OPTION_COLUMNS_OF), OTHER_OPTIONS_COLUMN, [
+        json.dumps(others, separators=(',', ':')) if (others := {name: value for name, value in x.items() if name not in OPTION_COLUMNS_OF}) else None
+        for x in options
+    ])
+
+    del discovery_df['options']
 
     return discovery_df
 
 
+# legacy_option_value()
+#   it converts the value of the option 'name' of an old dataset into the current representation (see option_value())
+#   current values are returned as they are
+def legacy_option_value(name, value):
+
+    if isinstance(value, list):
+        return [legacy_option_value(name, x) for x in value]
+
+    if not isinstance(value, str):
+        return value
+
+    if (match := LEGACY_BLOCK.fullmatch(value)):
+        return f"{match[1]}/{int(match[2] == 'True')}/{match[3]}"
+
+    if value.startswith(("b'", 'b"')):
+        try:
+            return '0x' + ast.literal_eval(value).hex()
+        except (ValueError, SyntaxError, AttributeError):
+            return value
+
+    if value.isdigit() and name in OptionNumber.__members__ and OptionNumber[name].format is UintOption:
+        return int(value)
+
+    return value
+
+
+# load_options()
+#   'options' of an old dataset (JSON string, CSV-escaped or not) -> dictionary in the current representation
+def load_options(options):
+
+    if isinstance(options, str):
+        try:
+            options = json.loads(options.replace('""', '"'))
+        except ValueError:
+            return None
+
+    if not isinstance(options, dict):
+        return None
+
+    return {name: legacy_option_value(name, value) for name, value in options.items()}
+
+
+# migrate_options()
+#   old dataset (JSON 'options' column) -> typed option columns, values in the current representation
+def migrate_options(discovery_df):
+
+    if 'options' not in discovery_df.columns:
+        return discovery_df
+
+    discovery_df['options'] = [load_options(x) for x in discovery_df['options']]
+
+    return options_to_json(discovery_df)
+
+
+# get_option()
+#   value of the option 'name' of a row (dict/Series) whatever its representation:
+#   typed columns (see options_to_json()), 'options' dictionary (in memory) or JSON string (old datasets)
+def get_option(row, name):
+
+    if name in OPTION_COLUMNS_OF and OPTION_COLUMNS_OF[name] in row.keys():
+        value = row[OPTION_COLUMNS_OF[name]]
+        return None if pd.isna(value) else value
+
+    options = row.get('options')
+
+    # old dataset
+    if isinstance(options, str):
+        options = load_options(options)
+
+    if not isinstance(options, dict):
+        return None
+
+    return options.get(name)
+
+
 def detect_truncated_response(udp_pkt_size, raw_coap_message, decoded_msg):
 
     # Handle Block2
@@ -322,4 +529,71 @@ def detect_truncated_response(udp_pkt_size, raw_coap_message, decoded_msg):
             return True
 
 
-    return False
\ No newline at end of file
+    return False
+
+
+# empty_record()
+#   it returns the record stored for every CoAP GET request (fields populated only on response)
+def empty_record(ip_address, uri):
+
+    return {
+        'saddr': ip_address,
+        'uri': uri,
+        'version': None,
+        'mtype': None,
+        'token': None,
+        'token_length': None,
+        'code': None,
+        'mid': None,
+        'options': None,
+        'observable': None,
+        'data': None,
+        'data_format': None,
+        'data_length': None,
+        'user_inserted': None,
+        'truncated': None
+    }
+
+
+def get_observable_status(message, uri, declared_obs):
+
+    # OBS resource
+    if get_observe(message, uri) == True:
+
+        #   -> declared OBS = CORRECT
+        if declared_obs == True:
+            return 0
+
+        #   -> NOT declared OBS = WRONG
+        return 1
+
+    # NOT OBS resource
+    #   -> declared OBS = WRONG
+    if declared_obs == True:
+        return 2
+
+    #   -> NOT declared OBS = CORRECT
+    return 3
+
+
+# get_response_fields()
+#   it extracts all the record fields out of a CoAP response message
+def get_response_fields(message, uri, declared_obs, user_inserted):
+
+    decoded_message_payload = get_payload(message)
+
+    return {
+        'version': get_version(message),
+        'mtype': get_mtype(message),
+        'token_length': get_token_length(message),
+        'code': get_code(message),
+        'mid': get_mid(message),
+        'token': get_token(message),
+        'options': get_options(message),
+        'data': decoded_message_payload,
+        'data_format': get_payload_format(decoded_message_payload),
+        'data_length': get_payload_length(message),
+        'observable': get_observable_status(message, uri, declared_obs),
+        'user_inserted': user_inserted,
+        'truncated': get_truncated(message)
+    }
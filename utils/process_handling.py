@@ -0,0 +1,46 @@
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+################################################################################################
+
+# process pools of the CPU/network fan-outs: one per use ('coap' -> coap.coap_sharded(), 'decode' ->
+# workflow_handling.decode()), created on first use and kept for the whole run
+#   (the two uses ask for different sizes: a single shared pool would be respawned at every switch)
+#   a pool is re-created only if a different size is requested for the same use
+_process_pools = {}
+
+# (function, arguments) run by every worker process when it starts (see set_worker_initializer())
+_worker_initializer = (None, ())
+
+# set_worker_initializer()
+#   ex. log_handling.init_worker: the output of the workers goes to the same log as the parent one
+#   NB: it applies to the pools created afterwards
+def set_worker_initializer(function, *arguments):
+
+    global _worker_initializer
+
+    _worker_initializer = (function, arguments)
+
+def get_process_pool(use, n_processes):
+
+    pool, size = _process_pools.get(use, (None, 0))
+
+    if pool is None or size != n_processes:
+
+        if pool is not None:
+            pool.shutdown()
+
+        # 'spawn': the parent process already owns an event loop and open sockets
+        initializer, initargs = _worker_initializer
+        pool = ProcessPoolExecutor(max_workers=n_processes, mp_context=multiprocessing.get_context('spawn'), initializer=initializer, initargs=initargs)
+        _process_pools[use] = (pool, n_processes)
+
+    return pool
+
+def shutdown_process_pool():
+
+    for pool, _ in _process_pools.values():
+        pool.shutdown()
+
+    _process_pools.clear()
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+################################################################################################
+
+# target packet rate shared by every CoAP request of the process
+#   REQUESTS_PER_SECOND -> sustained rate (token refill rate)
+#   BURST               -> max number of requests that can be sent back-to-back after an idle period
+REQUESTS_PER_SECOND = 70
+BURST = 15
+
+################################################################################################
+
+# TokenBucket
+#   classic token bucket: every request consumes one token, tokens are refilled at 'rate' per second
+#   up to 'burst'. Waiters are served in FIFO order, so the sending rate does not depend on
+#   how many requests are in flight or on how slow the responses are
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+
+        self.rate = rate
+        self.burst = burst
+
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+
+        self.lock = None
+        self.loop = None
+
+    def refill(self):
+
+        now = time.monotonic()
+
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    # try_acquire()
+    #   non-blocking variant: it consumes a token only if one is available right now
+    def try_acquire(self):
+
+        self.refill()
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+
+        return True
+
+    # time_to_token()
+    #   seconds before a full token is available
+    def time_to_token(self):
+
+        self.refill()
+
+        return max(0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+
+        # the lock must belong to the running event loop
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.lock = asyncio.Lock()
+            self.loop = loop
+
+        async with self.lock:
+
+            self.refill()
+
+            # wait exactly the time needed to get a full token
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+
+            self.tokens -= 1
+
+################################################################################################
+
+# process-wide limiter
+_rate_limiter = None
+
+# get_rate_limiter()
+#   it returns the process-wide limiter, creating it (with the module settings) on first use
+def get_rate_limiter():
+
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        _rate_limiter = TokenBucket(REQUESTS_PER_SECOND, BURST)
+
+    return _rate_limiter
+
+################################################################################################
+
+# set_rate()
+#   it (re)configures the process-wide limiter
+def set_rate(requests_per_second, burst=BURST):
+
+    global _rate_limiter
+
+    _rate_limiter = TokenBucket(requests_per_second, burst)
+
+    return _rate_limiter
+
+################################################################################################
+
+# acquire()
+#   every CoAP send must await it before leaving the process
+async def acquire():
+
+    await get_rate_limiter().acquire()
@@ -0,0 +1,137 @@
+import collections
+import math
+
+from utils import transmission_handling, network_handling, cache_handling
+
+################################################################################################
+
+# number of RTT samples kept per network (sliding window)
+MAX_SAMPLES = 64
+# minimum number of samples needed before trusting a network estimate
+MIN_SAMPLES = 5
+
+# RTT percentile used to derive the retransmission timeout
+RTT_PERCENTILE = 95
+# safety factor applied to the percentile
+RTT_FACTOR = 2.0
+# lower bound of the learned ACK timeout (seconds)
+MIN_ACK_TIMEOUT = 0.5
+# granularity of the learned ACK timeouts (profiles are cached per rounded value)
+ACK_TIMEOUT_STEP = 0.1
+# max number of networks (/24 prefixes, ASNs) whose samples are kept (least recently used ones dropped)
+MAX_NETWORKS = 50000
+
+################################################################################################
+
+# RTT samples per network: /24 prefix and autonomous system
+_prefix_rtts = cache_handling.LRUCache('rtt /24', MAX_NETWORKS)
+_asn_rtts = cache_handling.LRUCache('rtt ASN', MAX_NETWORKS)
+
+# cached learned profiles: (profile name, ack timeout) -> TransmissionProfile
+_profiles = {}
+
+# telemetry
+_stats = collections.Counter()
+
+################################################################################################
+
+# record_rtt()
+#   it stores the RTT (seconds) of a successful request
+def record_rtt(ip_address, rtt):
+
+    add_sample(_prefix_rtts, network_handling.prefix_of(ip_address), rtt)
+
+    asn = network_handling.asn_of(ip_address)
+    if asn is not None:
+        add_sample(_asn_rtts, asn, rtt)
+
+def add_sample(network_rtts, network, rtt):
+
+    found, samples = network_rtts.lookup(network)
+
+    if not found:
+        samples = collections.deque(maxlen=MAX_SAMPLES)
+        network_rtts.store(network, samples)
+
+    samples.append(rtt)
+
+################################################################################################
+
+def percentile_of(samples, percentile):
+
+    ordered = sorted(samples)
+
+    return ordered[min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1)]
+
+################################################################################################
+
+# learned_rtt()
+#   RTT percentile of the most specific network with enough samples (/24 first, then ASN)
+#   None -> unseen network
+def learned_rtt(ip_address):
+
+    _, samples = _prefix_rtts.lookup(network_handling.prefix_of(ip_address))
+
+    if samples is None or len(samples) < MIN_SAMPLES:
+
+        asn = network_handling.asn_of(ip_address)
+        _, samples = _asn_rtts.lookup(asn) if asn is not None else (False, None)
+
+        if samples is None or len(samples) < MIN_SAMPLES:
+            return None
+
+    return percentile_of(samples, RTT_PERCENTILE)
+
+################################################################################################
+
+# adapt_profile()
+#   it returns the profile to be used for a request towards ip_address:
+#   - known network -> ACK timeout derived from the observed RTTs: it drives the retransmissions only,
+#     an un-ACKed request is given up after the (shorter) retransmission sequence, while an ACKed one
+#     (separate response announced) still has the whole deadline of the operation profile
+#   - unseen network -> the operation profile as is (conservative fallback)
+def adapt_profile(ip_address, profile):
+
+    rtt = learned_rtt(ip_address)
+
+    if rtt is None:
+        _stats['fallback'] += 1
+        return profile
+
+    ack_timeout = max(MIN_ACK_TIMEOUT, rtt * RTT_FACTOR)
+    ack_timeout = round(math.ceil(ack_timeout / ACK_TIMEOUT_STEP) * ACK_TIMEOUT_STEP, 3)
+
+    # never more patient than the operation profile
+    if ack_timeout >= profile.ack_timeout:
+        _stats['fallback'] += 1
+        return profile
+
+    key = (profile.name, profile.max_retransmit, ack_timeout)
+
+    if key not in _profiles:
+
+        learned = transmission_handling.TransmissionProfile(
+            f"{profile.name}/learned",
+            profile.max_retransmit,
+            ack_timeout=ack_timeout,
+            ack_random_factor=profile.ack_random_factor,
+            deadline=profile.deadline
+        )
+        # no ACK: whole retransmission sequence + one more ACK timeout
+        learned.give_up = learned.max_transmit_wait() + ack_timeout
+
+        _profiles[key] = learned
+
+    _stats['learned'] += 1
+
+    return _profiles[key]
+
+################################################################################################
+
+def report():
+
+    print("\tRTT-based timeouts")
+    print(f"\t\tnetworks (/24) - {len(_prefix_rtts.entries)}")
+    print(f"\t\tnetworks (ASN) - {len(_asn_rtts.entries)}")
+    print(f"\t\trequests with learned timeout - {_stats['learned']}")
+    print(f"\t\trequests with fallback timeout - {_stats['fallback']}")
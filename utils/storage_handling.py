@@ -0,0 +1,350 @@
+import atexit
+import os
+
+import pandas as pd
+
+from utils import manifest_handling
+
+# optional dependency (not in requirements.txt): needed only when the Parquet output is enabled
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+################################################################################################
+
+# Pipeline outputs
+#   every dataset is written through append() to its CSV file (create_file()) and/or to a Parquet
+#   "mirror" of it: a directory under PARQUET_PATH with the same relative path, '.csv' removed
+#
+#   O1_DataCollection/data/discovery/cleaned/3/<date>.csv
+#   O1_DataCollection/data/parquet/discovery/cleaned/3/<date>/part-00000.parquet
+#
+#   -> the Parquet datasets are partitioned by portion and date exactly like the CSV ones
+#   the readers (read_chunks()) take the CSV path and use the Parquet mirror only once it is complete:
+#   close() writes a SUCCESS_MARKER with the number of rows, which must match the rows in the run manifest
+#   (mirror still buffered, interrupted run, rows written as CSV only, ... -> the CSV file is read)
+
+DATA_PATH = 'O1_DataCollection/data/'
+PARQUET_PATH = 'O1_DataCollection/data/parquet/'
+
+# 'csv', 'parquet' or both (see set_output_formats(), cli.py --formats): Parquet is opt-in
+OUTPUT_FORMATS = ['csv']
+
+# complete Parquet mirror marker (its content is the number of rows)
+SUCCESS_MARKER = '_SUCCESS'
+
+# rows buffered before a Parquet row group is written
+ROW_GROUP_SIZE = 50000
+
+PARQUET_COMPRESSION = 'zstd'
+
+################################################################################################
+
+def set_output_formats(formats):
+
+    global OUTPUT_FORMATS
+
+    formats = list(formats)
+
+    if 'parquet' in formats and pa is None:
+        raise ImportError("pyarrow is required for the Parquet output")
+
+    OUTPUT_FORMATS = formats
+
+# parquet_path_of()
+#   Parquet mirror (directory) of a CSV dataset path
+def parquet_path_of(csv_path):
+
+    relative_path = os.path.relpath(csv_path, DATA_PATH)
+
+    if relative_path.endswith('.csv'):
+        relative_path = relative_path[:-len('.csv')]
+
+    return os.path.join(PARQUET_PATH, relative_path)
+
+def parquet_files_of(directory):
+
+    if not os.path.isdir(directory):
+        return []
+
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith('.parquet')]
+
+# finalized_rows()
+#   number of rows of a complete Parquet mirror (None if the mirror is not complete)
+def finalized_rows(directory):
+
+    try:
+        with open(os.path.join(directory, SUCCESS_MARKER)) as marker:
+            return int(marker.read())
+    except (OSError, ValueError):
+        return None
+
+def remove_marker(directory):
+
+    marker = os.path.join(directory, SUCCESS_MARKER)
+
+    if os.path.exists(marker):
+        os.remove(marker)
+
+################################################################################################
+
+def text_of(value):
+
+    if value is None or isinstance(value, str) or (isinstance(value, float) and value != value):
+        return value
+
+    # same representation of the CSV files (bytes payloads, lists, mixed bool/int, ...)
+    return str(value)
+
+# arrow_table_of()
+#   typed Arrow table of a pipeline dataframe:
+#   - object columns -> strings (they mix str/bytes/bool/... values, CSV-like representation)
+#   - all-empty columns -> strings (instead of the null type, so later row groups can fill them)
+def arrow_table_of(df):
+
+    df = df.copy()
+
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(text_of)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    schema = pa.schema([
+        pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+        for field in table.schema
+    ])
+
+    return table.cast(schema)
+
+################################################################################################
+
+# ParquetSink
+#   buffered writer of a Parquet mirror: one row group every ROW_GROUP_SIZE rows
+#   if the types of a row group do not match the current file (ex. column all-empty so far)
+#   a new part file is started
+#   an existing mirror (dataset extended by a later run) is continued with new part files
+class ParquetSink:
+
+    def __init__(self, directory):
+
+        self.directory = directory
+
+        self.buffer = []
+        self.buffered_rows = 0
+
+        self.writer = None
+
+        parts = parquet_files_of(directory)
+        self.n_parts = len(parts)
+        self.rows = sum(pq.ParquetFile(filename).metadata.num_rows for filename in parts)
+
+        # being written -> not complete until close()
+        remove_marker(directory)
+
+    def append(self, df):
+
+        self.buffer.append(df)
+        self.buffered_rows += df.shape[0]
+
+        if self.buffered_rows >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+
+        if not self.buffer:
+            return
+
+        table = arrow_table_of(pd.concat(self.buffer, ignore_index=True))
+
+        self.buffer = []
+        self.buffered_rows = 0
+
+        if self.writer is not None:
+            try:
+                table = table.cast(self.writer.schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError):
+                self.writer.close()
+                self.writer = None
+
+        if self.writer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = os.path.join(self.directory, f"part-{self.n_parts:05d}.parquet")
+            self.writer = pq.ParquetWriter(filename, table.schema, compression=PARQUET_COMPRESSION)
+            self.n_parts += 1
+
+        self.writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        self.rows += table.num_rows
+
+    def close(self):
+
+        self.flush()
+
+        if self.writer is not None:
+            self.writer.close()
+
+        self.writer = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        with open(os.path.join(self.directory, SUCCESS_MARKER), 'w') as marker:
+            marker.write(str(self.rows))
+
+# Parquet directory -> open sink
+_sinks = {}
+
+################################################################################################
+
+# append()
+#   it appends df to the dataset csv_path (path returned by create_file()) in every OUTPUT_FORMATS
+#   header = True -> new dataset (first append): a previous Parquet mirror is replaced, as the CSV file is
+def append(df, csv_path, header):
+
+    if 'csv' in OUTPUT_FORMATS:
+        df.to_csv(csv_path, index=False, header=header, mode='a')
+
+    manifest_handling.add_rows(csv_path, df.shape[0], os.path.getsize(csv_path))
+
+    directory = parquet_path_of(csv_path)
+
+    # new dataset: the mirror of a previous one is removed (even if this run does not write Parquet)
+    if header:
+
+        if directory in _sinks:
+            _sinks.pop(directory).close()
+
+        for filename in parquet_files_of(directory):
+            os.remove(filename)
+
+        remove_marker(directory)
+
+    if 'parquet' in OUTPUT_FORMATS:
+
+        if directory not in _sinks:
+            _sinks[directory] = ParquetSink(directory)
+
+        _sinks[directory].append(df)
+
+# close()
+#   it writes the buffered rows and closes the Parquet files (end of every stage + at exit)
+def close():
+
+    for sink in _sinks.values():
+        sink.close()
+
+    _sinks.clear()
+
+atexit.register(close)
+
+################################################################################################
+
+# filters: list of (column, operator, value), operator in '==', '!=', 'in'
+#   (all the conditions must hold)
+
+def filter_mask(chunk, filters):
+
+    mask = pd.Series(True, index=chunk.index)
+
+    for column, operator, value in filters:
+        match operator:
+            case '==':
+                mask &= chunk[column] == value
+            case '!=':
+                mask &= chunk[column] != value
+            case 'in':
+                mask &= chunk[column].isin(value)
+            case _:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+
+    return mask
+
+def filter_expression(filters):
+
+    expression = None
+
+    for column, operator, value in filters:
+        match operator:
+            case '==':
+                condition = pc.field(column) == value
+            case '!=':
+                condition = pc.field(column) != value
+            case 'in':
+                condition = pc.field(column).isin(list(value))
+            case _:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+
+        expression = condition if expression is None else expression & condition
+
+    return expression
+
+# mirror_complete()
+#   True if the Parquet mirror of csv_path can be read instead of the CSV file
+def mirror_complete(csv_path):
+
+    if pa is None:
+        return False
+
+    rows = finalized_rows(parquet_path_of(csv_path))
+
+    if rows is None:
+        return False
+
+    # rows of the dataset in the run manifest (None = dataset created before the manifest)
+    manifest_rows = manifest_handling.rows_of(csv_path)
+
+    return manifest_rows is None or manifest_rows == rows
+
+# read_chunks()
+#   it yields the rows of the dataset csv_path (chunks of at most chunksize rows) restricted to
+#   columns (list or callable, like read_csv usecols) and to the rows satisfying filters
+#   complete Parquet mirror -> projection and filters are pushed down (row groups skipped by statistics)
+#   otherwise the CSV file is read and filtered chunk by chunk
+def read_chunks(csv_path, columns, chunksize, filters=None):
+
+    filters = filters or []
+
+    parquet_files = parquet_files_of(parquet_path_of(csv_path)) if mirror_complete(csv_path) else []
+
+    if not parquet_files:
+
+        # filter columns are needed to evaluate the filters
+        if callable(columns):
+            usecols = lambda column: columns(column) or column in [f[0] for f in filters]
+        else:
+            usecols = list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+
+        with pd.read_csv(csv_path, chunksize=chunksize, usecols=usecols) as csv_reader:
+            for chunk in csv_reader:
+
+                if filters:
+                    chunk = chunk[filter_mask(chunk, filters)]
+
+                if not callable(columns):
+                    chunk = chunk[list(columns)]
+
+                yield chunk
+
+        return
+
+    for filename in parquet_files:
+
+        dataset = ds.dataset(filename, format='parquet')
+
+        if callable(columns):
+            projection = [name for name in dataset.schema.names if columns(name)]
+        else:
+            projection = list(columns)
+
+        scanner = dataset.scanner(
+            columns=projection,
+            filter=filter_expression(filters) if filters else None,
+            batch_size=chunksize
+        )
+
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
@@ -0,0 +1,85 @@
+from aiocoap.numbers import TransportTuning
+
+################################################################################################
+
+# TransmissionProfile
+#   retransmission/timeout settings attached to every single request (instead of mutating the global
+#   aiocoap TransportTuning), so operations with different timings can run concurrently in one loop
+#   - max_retransmit: number of CON retransmissions
+#   - ack_timeout: initial retransmission timeout (seconds)
+#   - deadline: overall time given to a request (seconds), default MAX_TRANSMIT_WAIT + DEADLINE_MARGIN
+#   - give_up: time after which a request never ACKed is abandoned (seconds), default the deadline
+#     (shorter for the profiles learned from the RTTs, see rtt_handling.adapt_profile())
+class TransmissionProfile:
+
+    DEADLINE_MARGIN = 5
+
+    def __init__(self, name, max_retransmit, ack_timeout=TransportTuning.ACK_TIMEOUT,
+                 ack_random_factor=TransportTuning.ACK_RANDOM_FACTOR, deadline=None):
+
+        self.name = name
+        self.max_retransmit = max_retransmit
+        self.ack_timeout = ack_timeout
+        self.ack_random_factor = ack_random_factor
+
+        if deadline is None:
+            deadline = self.max_transmit_wait() + self.DEADLINE_MARGIN
+
+        self.deadline = deadline
+        self.give_up = deadline
+
+        # aiocoap per-message transport parameters
+        self.tuning = TransportTuning()
+        self.tuning.MAX_RETRANSMIT = max_retransmit
+        self.tuning.ACK_TIMEOUT = ack_timeout
+        self.tuning.ACK_RANDOM_FACTOR = ack_random_factor
+
+    def max_transmit_wait(self):
+
+        return (
+            self.ack_timeout *
+            (2 ** (self.max_retransmit + 1) - 1) *
+            self.ack_random_factor
+        )
+
+    def with_deadline(self, deadline):
+
+        return TransmissionProfile(self.name, self.max_retransmit, self.ack_timeout, self.ack_random_factor, deadline)
+
+    def report(self):
+
+        print(f"\tTransmission profile: {self.name}")
+        print("\tMax Retransmissions: ", self.max_retransmit)
+        print("\tACK Timeout: ", self.ack_timeout)
+        print("\tTimeout: ", self.deadline)
+
+################################################################################################
+
+# operation profiles
+PROFILES = {
+    # GET /.well-known/core
+    'discovery': TransmissionProfile('discovery', max_retransmit=3),
+    # GET of every discovered resource
+    'get': TransmissionProfile('get', max_retransmit=1),
+    # GET of the observable resources (lookups)
+    'observe': TransmissionProfile('observe', max_retransmit=3),
+    # GET of the resources truncated by ZMap (decode)
+    'refetch': TransmissionProfile('refetch', max_retransmit=3)
+}
+
+# coap() operation type -> profile
+OPERATION_PROFILES = {
+    0: 'discovery',
+    1: 'get',
+    2: 'observe'
+}
+
+################################################################################################
+
+def get_profile(name):
+
+    return PROFILES[name]
+
+def get_operation_profile(operation_type):
+
+    return PROFILES[OPERATION_PROFILES[operation_type]]
@@ -1,29 +1,40 @@
-import maxminddb
 import pandas as pd
 import os
 import datetime
 import aiocoap
 import asyncio
+import math
 
-from utils import payload_handling
+from utils import payload_handling, context_handling, transmission_handling, rtt_handling, blockwise_handling, header_handling, process_handling, cache_handling, ipinfo_handling, manifest_handling, host_handling
 
-from collections import Counter
+from collections import Counter, defaultdict
 from aiocoap import *
 
 ################################################################################################
 
-# setting MAX_RETRANSMIT = 3
-aiocoap.numbers.TransportTuning.MAX_RETRANSMIT = 3
+# retransmission/timeout settings of the truncated responses refetch
+REFETCH_PROFILE = transmission_handling.get_profile('refetch')
 
-MAX_TRANSMIT_WAIT = (
-            aiocoap.numbers.TransportTuning.ACK_TIMEOUT *
-            (2 ** (aiocoap.numbers.TransportTuning.MAX_RETRANSMIT + 1) - 1) *
-            aiocoap.numbers.TransportTuning.ACK_RANDOM_FACTOR
-        )
+# max number of truncated responses refetched at the same time
+#   (the packet rate is bounded anyway by the process-wide token bucket)
+REFETCH_CONCURRENCY = 50
+
+# decode fan-out: the chunk is split in one slice per process (at least MIN_DECODE_SLICE_SIZE rows each)
+#   decoded by DECODE_PROCESSES processes (1 = everything is decoded in the current process)
+DECODE_PROCESSES = os.cpu_count() or 1
+MIN_DECODE_SLICE_SIZE = 250
+
+# columns of the decoded dataframe
+DECODED_COLUMNS = ['saddr', 'uri', 'version', 'mtype', 'token', 'token_length', 'code', 'mid', 'options', 'observable', 'data', 'data_format', 'data_length', 'user_inserted', 'truncated']
+# NB: same columns of the coap.get() records (payload_handling.empty_record()): one schema per stage
 
 ################################################################################################
 
-def create_file(path, cidr_id, need_new_file, date_and_time):
+# create_file()
+#   it returns the csv file to write (need_new_file -> created/truncated and registered in the run manifest)
+#   - cidr_id == None -> timestamped file in path (portion sub-directory: portion = its id, stored in the manifest)
+#   - otherwise       -> path/{cidr_id}.csv
+def create_file(path, cidr_id, need_new_file, date_and_time, portion=None):
     
     os.makedirs(path, exist_ok=True)
 
@@ -39,19 +50,16 @@ def create_file(path, cidr_id, need_new_file, date_and_time):
             
             with open(path, "w"):
                 pass
+
+            manifest_handling.register(path, manifest_handling.stage_of(os.path.dirname(path), portion), portion, date_and_time)
         
         else:
             
             print("\tFile already created!")
             
-            created_files = os.listdir(path)
-            created_files.sort()
-            
-            # get last file name created
-            last_file = created_files[len(created_files) - 1]
-            print(f"\tLast file name is {last_file}")
-            
-            path = os.path.join(path, f"{last_file}")
+            # last file created in path (run manifest, no directory listing)
+            path = manifest_handling.latest(path)
+            print(f"\tLast file name is {os.path.basename(path)}")
     
     else:
             
@@ -61,6 +69,8 @@ def create_file(path, cidr_id, need_new_file, date_and_time):
 
             with open(path, "w"):
                 pass
+
+            manifest_handling.register(path, manifest_handling.stage_of(os.path.dirname(path)), cidr_id, date_and_time)
         
         
     return path
@@ -80,13 +90,10 @@ def avoid_get(row):
     # ----- OPTION check -----
     # Assumption: /.well-known/core resource use the CONTENT FORMAT option equal to LINK FORMAT
     # NB: I filter out everything that is not in LINKFORMAT style (TEXT, ...)
-    if row['options'] != None:
+    content_format = payload_handling.get_option(row, 'CONTENT_FORMAT')
 
-        options_dict = eval(row['options'])
-
-        if 'CONTENT_FORMAT' in options_dict.keys():
-            if options_dict['CONTENT_FORMAT'] != 'LINKFORMAT':
-                return True
+    if content_format is not None and content_format != 'LINKFORMAT':
+        return True
 
     # ----- EMPTY PAYLOAD check -----
     if len(row['data']) == 0: # empty payload string
@@ -103,13 +110,18 @@ def avoid_get(row):
 # remove_duplicates()
 #   it is able to identify duplicates in the ZMap scan csv files: keep the first, discard the others
 #   duplicate = both IP address and data fields equal
-def remove_duplicates(df_zmap):
+#   seen (address_handling.AddressSet): addresses of the previous chunks -> discarded as well
+def remove_duplicates(df_zmap, seen=None):
 
     # [subset=['saddr']] Remove duplicates considering 'saddr' field
     # [keep='first'] Keep the first instance (not delete all duplicates)
     # [inplace=True] Whether to modify the DataFrame rather than creating a new one.
     df_zmap.drop_duplicates(subset=['saddr'], keep='first', inplace=True)
 
+    # cross-chunk duplicates (the new addresses are added to the seen-set)
+    if seen is not None:
+        df_zmap = df_zmap[seen.add_new(df_zmap['saddr'])].copy()
+
     # [inplace=True] Whether to modify the DataFrame rather than creating a new one.
     # [drop=True] Do not try to insert index into dataframe columns. This resets the index to the default integer index.
     df_zmap.reset_index(inplace=True, drop=True)
@@ -121,32 +133,10 @@ def remove_duplicates(df_zmap):
 # extract_ip_info()
 #   it is able to retrieve IP related information as country, continent, ...
 #   it returns a flat dataframe that will be then stored safely
+#   (process-wide mmdb reader + per-network cache, see ipinfo_handling)
 def extract_ip_info(ip_list_df):
 
-    rows = []
-
-    with maxminddb.open_database("utils/ipinfo/ipinfo_lite.mmdb") as reader:
-        for ip in ip_list_df["saddr"]:
-            record = reader.get(ip) or {}
-
-            row = {
-                "asn": record.get("asn"),
-                "as_name": record.get("as_name"),
-                "as_domain": record.get("as_domain"),
-                "continent": record.get("continent"),
-                "continent_code": record.get("continent_code"),
-                "country": record.get("country"),
-                "country_code": record.get("country_code"),
-            }
-
-            rows.append(row)
-
-    ip_info_df = pd.DataFrame(rows)
-
-    return pd.concat(
-        [ip_list_df.reset_index(drop=True), ip_info_df],
-        axis=1
-    )
+    return ipinfo_handling.enrich_df(ip_list_df)
 
 
 ################################################################################################
@@ -156,12 +146,16 @@ async def get(ip_address, truncated_decoded_msg, context):
         
     # resource URI to be checked
     uri_to_check = f"coap://{ip_address}:5683{truncated_decoded_msg['uri']}"
-    # build the request message
-    request = Message(code=GET, uri=uri_to_check)
+    # timeouts learned from the RTTs observed in the target network (if any)
+    profile = rtt_handling.adapt_profile(ip_address, REFETCH_PROFILE)
 
     try:
-        # send the request and obtained the response
-        response = await asyncio.wait_for(context.request(request).response, timeout=MAX_TRANSMIT_WAIT + 5)
+        # send the request(s) and obtain the whole response
+        #   blockwise resources: blocks requested in parallel and reassembled
+        #   (rate limited through the same process-wide token bucket used by the GET/discovery workers)
+        response, rtt = await blockwise_handling.fetch(context, uri_to_check, profile)
+
+        rtt_handling.record_rtt(ip_address, rtt)
 
     except Exception:
         return truncated_decoded_msg
@@ -182,7 +176,8 @@ async def get(ip_address, truncated_decoded_msg, context):
             'observable': payload_handling.get_observe(response, truncated_decoded_msg['uri']),
             'data': decoded_message_payload,
             'data_format': payload_handling.get_payload_format(decoded_message_payload),
-            'data_length': payload_handling.get_payload_length(response)
+            'data_length': payload_handling.get_payload_length(response),
+            'truncated': payload_handling.get_truncated(response)
         }
 
         return full_decoded_msg # success
@@ -191,6 +186,8 @@ async def get(ip_address, truncated_decoded_msg, context):
 # decode_data()
 #   I: binary payload (in hex)
 #   O: structured object with multiple fields
+#   (cached by content: devices running the same firmware return byte-identical messages)
+@cache_handling.memoize('decode_data')
 def decode_data(binary_data, uri):
 
     # default message to be returned (if any error occurs during the decoding process)
@@ -245,52 +242,87 @@ def decode_data(binary_data, uri):
         
 ################################################################################################
 
-# decode()
-#   it takes as input the raw/binary ZMap data field and it returns a structured object representing a CoAP response message
-#   O: version, message type (mtype), token length, code (response code), mid (message id), tokenn, options, data (payload)
-async def decode(df_zmap, uri):
+# refetch()
+#   it performs the GETs of the truncated messages concurrently (at most REFETCH_CONCURRENCY at a time,
+#   at most host_handling.HOST_IN_FLIGHT towards the same host)
+#   and merges the full responses back into the decoded columns (same row)
+async def refetch(columns, truncated_rows, n_rows):
+
+    print(f"\t({datetime.datetime.now()}) Truncated responses to be refetched: {len(truncated_rows)}")
+
+    # shared client context for the GETs
+    context = await context_handling.get_context()
+
+    semaphore = asyncio.Semaphore(REFETCH_CONCURRENCY)
 
-    # it contains all the decoded messages
-    new_data_list = []
+    # ip -> host slots (the blocks of a resource are already requested in parallel, see blockwise_handling)
+    host_slots = defaultdict(lambda: asyncio.Semaphore(host_handling.HOST_IN_FLIGHT))
+
+    async def refetch_row(row):
+
+        ip_address = columns['saddr'][row]
+
+        async with host_slots[ip_address], semaphore:
+            decoded_msg = {column: values[row] for column, values in columns.items()}
+            return row, await get(ip_address, decoded_msg, context)
+
+    refetched = 0
+
+    for task in asyncio.as_completed([refetch_row(row) for row in truncated_rows]):
+
+        row, full_decoded_msg = await task
+
+        # merge by row
+        for column, value in full_decoded_msg.items():
+            columns[column][row] = value
+
+        refetched += 1
+
+        # logging
+        if refetched % 200 == 0:
+            print(f"\t({datetime.datetime.now()}) Refetched: {refetched}/{len(truncated_rows)} (over {n_rows} rows)")
+
+################################################################################################
+
+# decode_slice()
+#   decode pass (pure, no network) of a slice of ZMap results: it can run in a worker process
+#   O: decoded columns (one list per DECODED_COLUMNS entry), summary, undecodable messages, truncated rows (slice positions)
+def decode_slice(df_zmap, uri):
+
+    # it contains all the decoded messages (columnar)
+    columns = {column: [] for column in DECODED_COLUMNS}
     # undecodable messages
     undecodable_msgs = []
     # it contains a summary of the decode process (success, unsuccess/<REASON>)
     decode_results = Counter()
+    # positions (in columns) of the truncated messages
+    truncated_rows = []
 
+    # successful (UDP) rows
+    success_rows = (df_zmap['success'] == 1).to_numpy()
 
-    # client context creation for eventual GETs
-    context = await Context.create_client_context()
+    # vectorized parsing of the headers of the whole slice + truncation check
+    headers = header_handling.parse_headers(df_zmap['data'].where(success_rows, None))
+    truncated = header_handling.truncated(headers, df_zmap['udp_pkt_size'])
 
-    # iterate over rows
-    for _, row in df_zmap.iterrows():
+    # aiocoap decoding is needed only for the messages with options (or malformed ones)
+    fast_rows = headers['valid'] & ~headers['has_options']
 
-        # logging
-        if (len(new_data_list) % 200 == 0):
-            print(f"\t({datetime.datetime.now()}) Rows examined: {round(len(new_data_list)/df_zmap.shape[0] * 100, 2)}%")
+    # iterate over rows
+    for i, row in enumerate(df_zmap[['saddr', 'success', 'data', 'udp_pkt_size', 'icmp_unreach_str']].to_dict('records')):
         
         # default decoded message (it will be returned if any error occurs)
-        decoded_msg = {
-            'saddr': row['saddr'],
-            'uri': None,
-            'version': None,
-            'mtype': None,
-            'token': None,
-            'token_length': None,
-            'code': None,
-            'mid': None,
-            'options': None,
-            'observable': None,
-            'data': None,
-            'data_format': None,
-            'data_length': None,
-            'user_inserted': None
-        }
+        decoded_msg = {column: None for column in DECODED_COLUMNS}
+        decoded_msg['saddr'] = row['saddr']
 
         # if success field is equal to 1 (all UDP kind of result)
         if row['success'] == 1:
 
             # decoding binary data, get a dictionary as result and update decoded message
-            decoded_msg.update(decode_data(row['data'], uri))
+            if fast_rows[i]:
+                decoded_msg.update(header_handling.decode_row(headers, i, uri))
+            else:
+                decoded_msg.update(decode_data(row['data'], uri))
 
             # if decodede message code field is equal to None -> something went wrong during the decoding process
             #   ex. undecodable message, ...
@@ -307,24 +339,112 @@ async def decode(df_zmap, uri):
                 # update summary
                 decode_results.update(['success'])
 
-                # detect if ZMap retrieved payload is truncated
-                if payload_handling.detect_truncated_response(row['udp_pkt_size'], row['data'], decoded_msg):
+                # detect if ZMap retrieved payload is truncated -> refetched later (see refetch())
+                #   (column-wise check, unless the message could be decoded only by aiocoap)
+                if headers['valid'][i]:
+                    is_truncated = truncated[i]
+                else:
+                    is_truncated = payload_handling.detect_truncated_response(row['udp_pkt_size'], row['data'], decoded_msg)
+
+                # True until a refetch gets the whole response
+                decoded_msg['truncated'] = bool(is_truncated)
 
-                    decoded_msg.update(await get(row['saddr'], decoded_msg, context))
+                if is_truncated:
+
+                    truncated_rows.append(len(columns['saddr']))
             
                 # success case -> append and store it
-                new_data_list.append(decoded_msg)
+                for column in DECODED_COLUMNS:
+                    columns[column].append(decoded_msg[column])
 
         # if success field is equal to 0 (all icmp, ... kind of result)
         else:
             decode_results.update([f"unsuccess/{row['icmp_unreach_str']}"])
+
+    # payload formats (vectorized: every distinct payload is classified once)
+    columns['data_format'] = payload_handling.detect_formats(pd.Series(columns['data'], dtype=object)).tolist()
+
+    return columns, decode_results, undecodable_msgs, truncated_rows
+
+# decode_slice_in_worker()
+#   decode_slice() run by a worker process: the payload caches (see cache_handling) live in the worker,
+#   so their hits/misses on this slice are returned with the result
+def decode_slice_in_worker(df_zmap, uri):
+
+    counters = cache_handling.counters()
+
+    result = decode_slice(df_zmap, uri)
+
+    return result, cache_handling.counters_since(counters)
+
+################################################################################################
+
+# slices_of()
+#   it splits the chunk in (at most) n_processes slices of at least MIN_DECODE_SLICE_SIZE rows
+def slices_of(df_zmap, n_processes):
+
+    slice_size = max(MIN_DECODE_SLICE_SIZE, math.ceil(df_zmap.shape[0] / max(1, n_processes)))
+
+    return [df_zmap.iloc[start:start + slice_size] for start in range(0, df_zmap.shape[0], slice_size)]
+
+################################################################################################
+
+# decode()
+#   it takes as input the raw/binary ZMap data field and it returns a structured object representing a CoAP response message
+#   O: version, message type (mtype), token length, code (response code), mid (message id), tokenn, options, data (payload)
+async def decode(df_zmap, uri, n_processes=None):
+
+    if n_processes is None:
+        n_processes = DECODE_PROCESSES
+
+    # it contains all the decoded messages (columnar)
+    columns = {column: [] for column in DECODED_COLUMNS}
+    # undecodable messages
+    undecodable_msgs = []
+    # it contains a summary of the decode process (success, unsuccess/<REASON>)
+    decode_results = Counter()
+    # positions (in columns) of the truncated messages
+    truncated_rows = []
+
+    # ---------- decode pass (no network, CPU-bound) ----------
+
+    slices = slices_of(df_zmap, n_processes)
+
+    # slices decoded by the worker processes (results gathered in order) or by the current process
+    if n_processes > 1 and len(slices) > 1:
+        pool = process_handling.get_process_pool('decode', n_processes)
+        loop = asyncio.get_running_loop()
+        slice_results = [loop.run_in_executor(pool, decode_slice_in_worker, df_slice, uri) for df_slice in slices]
+    else:
+        slice_results = [None] * len(slices)
+
+    for slice_id, df_slice in enumerate(slices):
+
+        if slice_results[slice_id] is not None:
+            (slice_columns, slice_decode_results, slice_undecodable_msgs, slice_truncated_rows), cache_counters = await slice_results[slice_id]
+            cache_handling.add_worker_counters(cache_counters)
+        else:
+            slice_columns, slice_decode_results, slice_undecodable_msgs, slice_truncated_rows = decode_slice(df_slice, uri)
+
+        # slice positions -> chunk positions
+        truncated_rows.extend(len(columns['saddr']) + row for row in slice_truncated_rows)
+
+        for column in DECODED_COLUMNS:
+            columns[column].extend(slice_columns[column])
+
+        decode_results.update(slice_decode_results)
+        undecodable_msgs.extend(slice_undecodable_msgs)
+
+        # logging
+        print(f"\t({datetime.datetime.now()}) Rows examined: {round(len(columns['saddr'])/df_zmap.shape[0] * 100, 2)}%")
     
-    
-    # close context/UDP socket
-    await context.shutdown()
-    
-    # Build dataframe from list
-    decoded_df = pd.DataFrame(new_data_list)
+    # ---------- refetch pass (concurrent) ----------
+
+    if truncated_rows:
+        await refetch(columns, truncated_rows, df_zmap.shape[0])
+
+    # Build dataframe from columns
+    decoded_df = pd.DataFrame(columns)
         
     # define result to be returned
     result = [decoded_df, decode_results]